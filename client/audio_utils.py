@@ -0,0 +1,395 @@
+# -*- coding: utf-8-*-
+"""
+Helper classes for handling raw audio data that are independent of the
+actual audio backend.
+"""
+import logging
+import collections
+import threading
+import array
+import audioop
+import tempfile
+import wave
+import struct
+import subprocess
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def rms(data, width=2):
+    """
+    Calculates the root-mean-square of a chunk of raw audio data.
+
+    Arguments:
+        data -- a string of raw audio data
+        width -- (optional) the sample width in bytes (Default: 2)
+
+    Returns:
+        The RMS value of data
+    """
+    return audioop.rms(data, width)
+
+
+def rms_many(chunks, width=2):
+    """
+    Calculates the root-mean-square of several chunks of raw audio data at
+    once. If NumPy is available, this is done in a single vectorized
+    operation.
+
+    Arguments:
+        chunks -- a list of strings of raw audio data of equal size
+        width -- (optional) the sample width in bytes (Default: 2)
+
+    Returns:
+        A list containing the RMS value of each chunk
+    """
+    if numpy is None or not chunks or width not in (1, 2, 4):
+        return [rms(chunk, width) for chunk in chunks]
+    if any(len(chunk) != len(chunks[0]) for chunk in chunks):
+        return [rms(chunk, width) for chunk in chunks]
+    dtype = {1: numpy.int8, 2: numpy.int16, 4: numpy.int32}[width]
+    samples = numpy.frombuffer(''.join(chunks), dtype=dtype)
+    samples = samples.reshape(len(chunks), -1).astype(numpy.float64)
+    return [int(x) for x in numpy.sqrt(numpy.mean(samples ** 2, axis=1))]
+
+
+def read_wav_header(fp):
+    """
+    Reads the header of WAV data from a file object that doesn't have to be
+    seekable, e.g. the stdout of a synthesizer. Programs that write WAV data
+    to a pipe don't know its length in advance, so the data size in the
+    header is ignored.
+
+    Arguments:
+        fp -- a file object positioned at the start of the WAV data
+
+    Returns:
+        A tuple of the sample rate, the sample width in bytes and the number
+        of channels. fp is left at the start of the audio data.
+
+    Raises:
+        ValueError if the data is not in WAV format
+    """
+    header = fp.read(12)
+    if len(header) < 12 or header[:4] != 'RIFF' or header[8:] != 'WAVE':
+        raise ValueError("Not in WAV format")
+    audio_format = None
+    while True:
+        header = fp.read(8)
+        if len(header) < 8:
+            raise ValueError("WAV data without data chunk")
+        chunk_id, size = struct.unpack('<4sI', header)
+        if chunk_id == 'data':
+            break
+        # Chunks are padded to an even size
+        chunk = fp.read(size + size % 2)
+        if chunk_id == 'fmt ':
+            channels, rate = struct.unpack('<HI', chunk[2:8])
+            bits = struct.unpack('<H', chunk[14:16])[0]
+            audio_format = (rate, bits // 8, channels)
+    if audio_format is None:
+        raise ValueError("WAV data without fmt chunk")
+    return audio_format
+
+
+class AudioData(object):
+    """
+    Raw PCM audio data together with its format.
+
+    The chunks of audio data are only joined once they are actually needed
+    and are only serialized to WAV if a consumer asks for a file.
+    """
+
+    def __init__(self, frames, rate=16000, sample_width=2, channels=1):
+        """
+        Initializes a new AudioData instance.
+
+        Arguments:
+            frames -- a string or a list of strings of raw audio data
+            rate -- (optional) the sample rate (Default: 16000)
+            sample_width -- (optional) the sample width in bytes
+                            (Default: 2)
+            channels -- (optional) the number of channels (Default: 1)
+        """
+        if isinstance(frames, basestring):
+            self._data = frames
+            self._frames = None
+        else:
+            self._data = None
+            self._frames = frames
+        self.rate = rate
+        self.sample_width = sample_width
+        self.channels = channels
+
+    @classmethod
+    def from_wav(cls, fp):
+        """
+        Reads audio data from a WAV file.
+
+        Arguments:
+            fp -- a filename or a file object containing WAV data
+
+        Returns:
+            A new AudioData instance
+        """
+        wav = wave.open(fp, 'rb')
+        try:
+            return cls(wav.readframes(wav.getnframes()),
+                       rate=wav.getframerate(),
+                       sample_width=wav.getsampwidth(),
+                       channels=wav.getnchannels())
+        finally:
+            wav.close()
+
+    @property
+    def data(self):
+        """
+        Returns:
+            The raw audio data as string
+        """
+        if self._data is None:
+            self._data = ''.join(self._frames)
+            self._frames = None
+        return self._data
+
+    @property
+    def duration(self):
+        """
+        Returns:
+            The duration of the audio data in seconds
+        """
+        return (float(len(self.data)) /
+                (self.rate * self.sample_width * self.channels))
+
+    def write_wav(self, fp):
+        """
+        Writes the audio data into a file object in WAV format.
+
+        Arguments:
+            fp -- a file object opened for writing
+        """
+        wav = wave.open(fp, 'wb')
+        wav.setnchannels(self.channels)
+        wav.setsampwidth(self.sample_width)
+        wav.setframerate(self.rate)
+        wav.writeframes(self.data)
+        wav.close()
+
+    def encode_flac(self, compression_level=5):
+        """
+        Compresses the audio data losslessly to FLAC. Requires the flac
+        executable to be available.
+
+        Arguments:
+            compression_level -- (optional) the flac compression level from
+                                 0 (fastest) to 8 (smallest) (Default: 5)
+
+        Returns:
+            A string containing the FLAC stream
+
+        Raises:
+            OSError if flac is not installed, IOError if encoding failed
+        """
+        cmd = ['flac', '--silent', '--stdout', '-%d' % compression_level,
+               '--force-raw-format', '--endian=little', '--sign=signed',
+               '--channels=%d' % self.channels,
+               '--bps=%d' % (self.sample_width * 8),
+               '--sample-rate=%d' % self.rate, '-']
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        output, error = proc.communicate(self.data)
+        if proc.returncode != 0:
+            raise IOError("flac failed with return code %d: '%s'" %
+                          (proc.returncode, error.strip()))
+        return output
+
+    def open_wav(self):
+        """
+        Serializes the audio data to WAV format.
+
+        Returns:
+            A temporary file object positioned at the start of the WAV data
+            that stays in memory unless its file descriptor is requested.
+        """
+        f = tempfile.SpooledTemporaryFile(mode='w+b')
+        self.write_wav(f)
+        f.seek(0)
+        return f
+
+
+class RingBuffer(object):
+    """
+    A thread-safe ring buffer that keeps the most recent chunks of raw
+    audio data.
+
+    Every chunk that has ever been appended gets an absolute position
+    number, so that multiple readers can consume the same audio data
+    independently of each other. Once the buffer is full, the oldest chunks
+    are discarded.
+    """
+
+    def __init__(self, size):
+        """
+        Initializes a new RingBuffer instance.
+
+        Arguments:
+            size -- the maximum number of chunks this buffer will hold
+        """
+        self._logger = logging.getLogger(__name__)
+        self._chunks = collections.deque(maxlen=size)
+        self._cond = threading.Condition()
+        self._end = 0
+        self._closed = False
+
+    @property
+    def size(self):
+        """
+        Returns:
+            The maximum number of chunks this buffer will hold
+        """
+        return self._chunks.maxlen
+
+    @property
+    def position(self):
+        """
+        Returns:
+            The absolute position the next appended chunk will get
+        """
+        with self._cond:
+            return self._end
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def append(self, chunk):
+        """
+        Appends a chunk of audio data and wakes up all waiting readers.
+
+        Arguments:
+            chunk -- a string of raw audio data
+        """
+        with self._cond:
+            self._chunks.append(chunk)
+            self._end += 1
+            self._cond.notify_all()
+
+    def close(self):
+        """
+        Closes this buffer. Readers will stop after they consumed all chunks
+        that are still available.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def get_last(self, count):
+        """
+        Returns the most recent chunks that are currently available without
+        waiting for new ones.
+
+        Arguments:
+            count -- the maximum number of chunks to return
+
+        Returns:
+            A list of at most count chunks, oldest first.
+        """
+        with self._cond:
+            count = min(count, len(self._chunks))
+            return [self._chunks[i] for i in
+                    range(len(self._chunks) - count, len(self._chunks))]
+
+    def read(self, position=None):
+        """
+        Iterates over the chunks of this buffer, starting at an absolute
+        position and blocking until new chunks become available. If the
+        reader falls behind so that chunks have already been discarded, it
+        continues with the oldest chunk available.
+
+        Arguments:
+            position -- (optional) the absolute position to start reading
+                        from (Default: the position of the next chunk)
+
+        Returns:
+            A generator that yields chunks of audio data until the buffer
+            is closed.
+        """
+        if position is None:
+            position = self.position
+        while True:
+            with self._cond:
+                while position >= self._end and not self._closed:
+                    # Waiting with a timeout keeps the main thread
+                    # responsive to KeyboardInterrupt
+                    self._cond.wait(1)
+                if position >= self._end:
+                    return
+                start = self._end - len(self._chunks)
+                if position < start:
+                    self._logger.warning("Reader fell behind, skipping %d " +
+                                         "chunks of audio data.",
+                                         start - position)
+                    position = start
+                chunk = self._chunks[position - start]
+            position += 1
+            yield chunk
+
+
+class EnergyTracker(object):
+    """
+    Keeps the running average of the last N energy scores in constant time
+    per update.
+    """
+
+    def __init__(self, size, initial=0):
+        """
+        Initializes a new EnergyTracker instance.
+
+        Arguments:
+            size -- the number of scores to average over
+            initial -- (optional) the value the tracker is filled with
+                       initially (Default: 0)
+        """
+        self._values = array.array('d', [initial] * size)
+        self._sum = float(initial) * size
+        self._index = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    @property
+    def average(self):
+        """
+        Returns:
+            The average of the last N scores
+        """
+        return self._sum / len(self._values)
+
+    def add(self, score):
+        """
+        Adds a score, replacing the oldest one.
+
+        Arguments:
+            score -- the energy score to add
+        """
+        self._sum += score - self._values[self._index]
+        self._values[self._index] = score
+        self._index += 1
+        if self._index == len(self._values):
+            self._index = 0
+            # Recalculate the sum once per cycle so that floating point
+            # errors can't accumulate
+            self._sum = sum(self._values)
+
+    def extend(self, scores):
+        """
+        Adds several scores, replacing the oldest ones.
+
+        Arguments:
+            scores -- an iterable of energy scores
+        """
+        for score in scores:
+            self.add(score)
@@ -0,0 +1,510 @@
+# -*- coding: utf-8-*-
+"""
+Benchmarks for the STT engines. Web services are replaced by a local stub
+server.
+
+The upload benchmark measures how much data the cloud STT engines upload
+and how long a transcription takes end-to-end. For streaming uploads, the
+time is measured from the end of the utterance.
+
+The STT benchmark measures the word error rate, the real-time factor, the
+latency after the end of the utterance and the peak memory usage of each
+engine over a labelled corpus and writes a JSON report.
+
+Usage:
+    python client/benchmark.py upload [--uplink-kbps N] [WAVFILE ...]
+    python client/benchmark.py stt [--corpus MANIFEST] [--engines SLUG ...]
+                                   [-o REPORT]
+"""
+import sys
+import json
+import time
+import datetime
+import functools
+import logging
+import argparse
+import resource
+import threading
+import multiprocessing
+import BaseHTTPServer
+import SocketServer
+import stt
+import diagnose
+import jasperpath
+import http_pool
+from audio_utils import AudioData
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Answers POST requests after reading the request body at the uplink
+    speed of the server. Requests to /oauth get an access token, requests
+    to /att and /wit get an AT&T or Wit.ai result and all other requests
+    get a Google Speech API result, each containing the text of the server.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def _read(self, length):
+        data = self.rfile.read(length)
+        if self.server.uplink_kbps:
+            time.sleep(len(data) * 8 / (self.server.uplink_kbps * 1000.0))
+        return data
+
+    def _read_body(self):
+        if self.headers.getheader('transfer-encoding') == 'chunked':
+            received = 0
+            while True:
+                length = int(self.rfile.readline().split(';')[0], 16)
+                if length == 0:
+                    break
+                received += len(self._read(length))
+                self.rfile.readline()
+            # Skip the trailer
+            while self.rfile.readline() not in ('\r\n', '\n', ''):
+                pass
+            return received
+        length = int(self.headers.getheader('content-length'))
+        received = 0
+        while received < length:
+            chunk = self._read(min(4096, length - received))
+            if not chunk:
+                break
+            received += len(chunk)
+        return received
+
+    def do_POST(self):
+        self.server.bytes_received += self._read_body()
+        self.server.content_types.append(self.headers.getheader(
+            'content-type'))
+        self.server.transfer_encodings.append(self.headers.getheader(
+            'transfer-encoding'))
+        body = self._get_response(self.server.text)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _get_response(self, text):
+        if self.path.startswith('/oauth'):
+            return json.dumps({'access_token': 'benchmark',
+                               'expires_in': 3600})
+        elif self.path.startswith('/att'):
+            if not text:
+                return json.dumps({'Recognition': {'Status': 'No Speech'}})
+            return json.dumps({'Recognition': {
+                'Status': 'OK',
+                'NBest': [{'Hypothesis': text, 'Confidence': 1.0,
+                           'Words': text.split(),
+                           'WordScores': [1.0] * len(text.split())}]}})
+        elif self.path.startswith('/wit'):
+            return json.dumps({'_text': text})
+        result = []
+        if text:
+            result.append({'alternative': [{'transcript': text,
+                                            'confidence': 1.0}],
+                           'final': True})
+        return '{"result":[]}\n%s\n' % json.dumps({'result': result})
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A local HTTP server that counts the bytes it receives.
+    """
+    # Keep-alive connections of the shared HTTP session must not prevent
+    # the server from shutting down
+    daemon_threads = True
+
+    def __init__(self, uplink_kbps=None, text=''):
+        """
+        Arguments:
+            uplink_kbps -- (optional) the simulated upload speed in kbit/s
+                           (Default: unlimited)
+            text -- (optional) the text of all transcriptions (Default:
+                    nothing has been transcribed)
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           StubHandler)
+        self.uplink_kbps = uplink_kbps
+        self.text = text
+        self.bytes_received = 0
+        self.content_types = []
+        self.transfer_encodings = []
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:%d' % self.server_port
+
+    @property
+    def url(self):
+        return self.base_url + '/recognize'
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+
+def measure_upload(server, engine, audio, repeat=3):
+    """
+    Transcribes audio data with an engine that talks to a stub server.
+
+    Arguments:
+        server -- a running StubServer instance
+        engine -- an STT engine instance whose requests go to server
+        audio -- the AudioData instance to transcribe
+        repeat -- (optional) the number of transcriptions to average over
+                  (Default: 3)
+
+    Returns:
+        A tuple containing the bytes sent and the average time in seconds
+        per transcription
+    """
+    server.bytes_received = 0
+    start = time.time()
+    for i in range(repeat):
+        engine.transcribe_pcm(audio)
+    elapsed = (time.time() - start) / repeat
+    return (server.bytes_received / repeat, elapsed)
+
+
+def measure_stream(server, engine, audio, chunk_size=1024):
+    """
+    Feeds audio data into a transcription stream of an engine that talks to
+    a stub server, at the pace it would be recorded.
+
+    Arguments:
+        server -- a running StubServer instance
+        engine -- an STT engine instance whose requests go to server
+        audio -- the AudioData instance to transcribe
+        chunk_size -- (optional) the number of frames per chunk
+                      (Default: 1024)
+
+    Returns:
+        A tuple containing the bytes sent and the time in seconds between
+        the end of the audio data and the transcription
+    """
+    server.bytes_received = 0
+    size = chunk_size * audio.sample_width * audio.channels
+    data = audio.data
+    transcription = engine.begin_stream(rate=audio.rate,
+                                        sample_width=audio.sample_width)
+    for i in range(0, len(data), size):
+        chunk = data[i:i + size]
+        transcription.feed(chunk)
+        time.sleep(float(len(chunk)) / size * chunk_size / audio.rate)
+    start = time.time()
+    transcription.finish()
+    return (server.bytes_received, time.time() - start)
+
+
+def run_upload(audio_files, uplink_kbps=None):
+    if not audio_files:
+        # Two seconds of a rising tone are a poor substitute for speech,
+        # but still compress far worse than silence
+        import math
+        import struct
+        samples = [int(8000 * math.sin(i * (0.05 + i / 640000.0)))
+                   for i in range(32000)]
+        audio_files = [('<synthetic tone>',
+                        AudioData(struct.pack('<%dh' % len(samples),
+                                              *samples)))]
+    else:
+        audio_files = [(fname, AudioData.from_wav(fname))
+                       for fname in audio_files]
+
+    compressions = [None]
+    if diagnose.check_executable('flac'):
+        compressions.append('flac')
+    else:
+        print("flac not found, only measuring uncompressed uploads.")
+
+    server = StubServer(uplink_kbps=uplink_kbps)
+    server.start()
+    print("%-30s %-12s %10s %10s" % ('File', 'Encoding', 'Bytes', 'Time'))
+    try:
+        for fname, audio in audio_files:
+            for compression in compressions:
+                engine = stt.GoogleSTT(api_key='benchmark',
+                                       compression=compression)
+                engine.api_url = server.url
+                sent, elapsed = measure_upload(server, engine, audio)
+                print("%-30s %-12s %10d %9.3fs" % (fname[-30:],
+                                                   compression or 'l16',
+                                                   sent, elapsed))
+            engine = stt.GoogleSTT(api_key='benchmark')
+            engine.api_url = server.url
+            sent, elapsed = measure_stream(server, engine, audio)
+            print("%-30s %-12s %10d %9.3fs" % (fname[-30:], 'l16 stream',
+                                               sent, elapsed))
+    finally:
+        # Drop the keep-alive connections so that the handlers can exit
+        http_pool.get_session().close()
+        server.shutdown()
+        server.server_close()
+
+
+def _create_google_stub(base_url):
+    engine = stt.GoogleSTT(api_key='benchmark')
+    engine.api_url = base_url + '/recognize'
+    return engine
+
+
+def _create_att_stub(base_url):
+    return stt.AttSTT('benchmark', 'benchmark', api_url=base_url + '/att',
+                      token_url=base_url + '/oauth')
+
+
+def _create_witai_stub(base_url):
+    return stt.WitAiSTT('benchmark', api_url=base_url + '/wit')
+
+
+# Engines that talk to web services, with functions that create an instance
+# that talks to a stub server instead
+STUBBED_ENGINES = {stt.GoogleSTT.SLUG: _create_google_stub,
+                   stt.AttSTT.SLUG: _create_att_stub,
+                   stt.WitAiSTT.SLUG: _create_witai_stub}
+
+# Labels of the clips in static/audio
+BUILTIN_CORPUS = [('jasper.wav', 'JASPER'),
+                  ('time.wav', 'TIME')]
+
+
+def word_error_rate(reference, hypothesis):
+    """
+    Calculates the number of word errors of a transcription.
+
+    Arguments:
+        reference -- the correct text
+        hypothesis -- the transcribed text
+
+    Returns:
+        A tuple containing the number of substituted, deleted and inserted
+        words and the number of words of the reference
+    """
+    ref = reference.upper().split()
+    hyp = hypothesis.upper().split()
+    # Levenshtein distance on words, keeping one row of the matrix
+    row = range(len(hyp) + 1)
+    for i in range(1, len(ref) + 1):
+        prev, row = row, [i] + [0] * len(hyp)
+        for j in range(1, len(hyp) + 1):
+            row[j] = min(prev[j] + 1, row[j - 1] + 1,
+                         prev[j - 1] + (ref[i - 1] != hyp[j - 1]))
+    return (row[-1], len(ref))
+
+
+def get_corpus(manifest=None):
+    """
+    Arguments:
+        manifest -- (optional) a JSONL manifest of additional clips, whose
+                    'text' keys hold the correct transcriptions
+
+    Returns:
+        A list of dicts with the keys 'file' and 'text'
+    """
+    corpus = [{'file': jasperpath.data('audio', fname), 'text': text}
+              for fname, text in BUILTIN_CORPUS]
+    if manifest:
+        corpus.extend(item for item in stt.find_batch_items(manifest)
+                      if 'text' in item)
+    return corpus
+
+
+def get_default_engines():
+    """
+    Returns:
+        The slugs of all engines that can be benchmarked on this machine
+    """
+    slugs = []
+    for engine in stt.get_engines():
+        # Composite engines depend on the profile
+        if issubclass(engine, (stt.AbstractCompositeSTTEngine,
+                               stt.CachedSTT)):
+            continue
+        if engine.SLUG in STUBBED_ENGINES or engine.is_available():
+            slugs.append(engine.SLUG)
+    return sorted(slugs)
+
+
+def measure_clip(engine, audio, chunk_size=1024):
+    """
+    Feeds audio data into a transcription stream as fast as possible.
+
+    The latency is the time finishing the stream takes. As long as the
+    real-time factor is below 1, an engine keeps up with the recording, so
+    this is the time the user would wait after the end of the utterance.
+
+    Arguments:
+        engine -- the STT engine instance
+        audio -- the AudioData instance to transcribe
+        chunk_size -- (optional) the number of frames per chunk
+                      (Default: 1024)
+
+    Returns:
+        A tuple containing the transcription, the latency in seconds and
+        the real-time factor
+    """
+    size = chunk_size * audio.sample_width * audio.channels
+    data = audio.data
+    start = time.time()
+    transcription = engine.begin_stream(rate=audio.rate,
+                                        sample_width=audio.sample_width)
+    for i in range(0, len(data), size):
+        transcription.feed(data[i:i + size])
+    fed = time.time()
+    transcribed = transcription.finish()
+    end = time.time()
+    return (transcribed, end - fed, (end - start) / audio.duration)
+
+
+def _get_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on OS X, but in kilobytes elsewhere
+    return rss / 1024 if sys.platform == 'darwin' else rss
+
+
+def benchmark_engine(create_engine, corpus):
+    """
+    Transcribes the corpus with an engine.
+
+    Arguments:
+        create_engine -- a function that returns the engine instance
+        corpus -- a list of dicts with the keys 'file' and 'text'
+
+    Returns:
+        A dict containing the results
+    """
+    baseline_rss = _get_rss_kb()
+    engine = create_engine()
+    clips = []
+    errors = words = 0
+    for item in corpus:
+        audio = AudioData.from_wav(item['file'])
+        transcribed, latency, rtf = measure_clip(engine, audio)
+        hypothesis = transcribed[0] if transcribed else ''
+        clip_errors, clip_words = word_error_rate(item['text'], hypothesis)
+        errors += clip_errors
+        words += clip_words
+        clips.append({'file': item['file'],
+                      'text': item['text'],
+                      'hypothesis': hypothesis,
+                      'confidence': getattr(transcribed, 'confidence', None),
+                      'wer': float(clip_errors) / max(clip_words, 1),
+                      'latency': latency,
+                      'rtf': rtf})
+    latencies = [clip['latency'] for clip in clips]
+    peak_rss = _get_rss_kb()
+    return {'wer': float(errors) / max(words, 1),
+            'rtf': (sum(clip['rtf'] for clip in clips) /
+                    max(len(clips), 1)),
+            'latency_mean': sum(latencies) / max(len(latencies), 1),
+            'latency_max': max(latencies) if latencies else None,
+            'peak_rss_kb': peak_rss,
+            'rss_increase_kb': peak_rss - baseline_rss,
+            'clips': clips}
+
+
+def _benchmark_engine_process(slug, corpus):
+    if slug in STUBBED_ENGINES:
+        server = StubServer()
+        server.start()
+        create_engine = functools.partial(STUBBED_ENGINES[slug],
+                                          server.base_url)
+    else:
+        engine_class = stt.get_engine_by_slug(slug)
+        create_engine = engine_class.get_active_instance
+    try:
+        result = benchmark_engine(create_engine, corpus)
+    except Exception as e:
+        logging.getLogger(__name__).error("Benchmarking STT engine '%s' " +
+                                          "failed.", slug, exc_info=True)
+        result = {'error': str(e)}
+    result['stubbed'] = slug in STUBBED_ENGINES
+    if result['stubbed']:
+        # The stub server doesn't actually transcribe anything
+        result['wer'] = None
+        for clip in result.get('clips', []):
+            clip['wer'] = None
+    return result
+
+
+def run_stt(slugs, corpus):
+    """
+    Benchmarks each engine in a process of its own, so that their memory
+    usage can be measured separately.
+
+    Arguments:
+        slugs -- the slugs of the engines
+        corpus -- a list of dicts with the keys 'file' and 'text'
+
+    Returns:
+        The report as dict
+    """
+    report = {'created': datetime.datetime.utcnow().isoformat() + 'Z',
+              'corpus': corpus,
+              'engines': {}}
+    for slug in slugs:
+        pool = multiprocessing.Pool(1)
+        try:
+            report['engines'][slug] = pool.apply(_benchmark_engine_process,
+                                                 (slug, corpus))
+        finally:
+            pool.terminate()
+            pool.join()
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Jasper STT benchmarks')
+    parser.add_argument('--debug', action='store_true',
+                        help='Show debug messages')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    upload_parser = subparsers.add_parser('upload',
+                                          help='Measure cloud STT uploads')
+    upload_parser.add_argument('audio_files', metavar='WAVFILE', nargs='*',
+                               help='WAV files to transcribe')
+    upload_parser.add_argument('--uplink-kbps', type=float, default=None,
+                               help='Simulated upload speed in kbit/s')
+    stt_parser = subparsers.add_parser('stt', help='Measure accuracy, ' +
+                                       'latency and memory usage')
+    stt_parser.add_argument('--corpus', default=None,
+                            help='A JSONL manifest of additional clips ' +
+                                 'with their texts')
+    stt_parser.add_argument('--engines', nargs='+', default=None,
+                            help='The slugs of the engines to benchmark ' +
+                                 '(Default: all available engines)')
+    stt_parser.add_argument('-o', '--output', default=None,
+                            help='The file to write the JSON report to ' +
+                                 '(Default: stdout)')
+    args = parser.parse_args()
+
+    logging.basicConfig(stream=sys.stderr)
+    if args.debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    if args.benchmark == 'upload':
+        run_upload(args.audio_files, uplink_kbps=args.uplink_kbps)
+    else:
+        report = run_stt(args.engines or get_default_engines(),
+                         get_corpus(args.corpus))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        else:
+            json.dump(report, sys.stdout, indent=2)
+            print('')
+        for slug, result in sorted(report['engines'].items()):
+            if 'error' in result:
+                sys.stderr.write('%-10s failed: %s\n' %
+                                 (slug, result['error']))
+                continue
+            wer = ('%.1f%%' % (result['wer'] * 100)
+                   if result['wer'] is not None else 'n/a')
+            sys.stderr.write(('%-10s WER %s, RTF %.3f, latency %.3fs, ' +
+                              'peak RSS %d kB\n') %
+                             (slug, wer, result['rtf'],
+                              result['latency_mean'], result['peak_rss_kb']))
@@ -6,6 +6,9 @@ import jasperpath
 
 class Brain(object):
 
+    ERROR_MESSAGE = ("I'm sorry. I had some trouble with that operation. " +
+                     "Please try again later.")
+
     def __init__(self, mic, profile):
         """
         Instantiates a new Brain object, which cross-references user
@@ -23,6 +26,10 @@ class Brain(object):
         self.profile = profile
         self.modules = self.get_modules()
         self._logger = logging.getLogger(__name__)
+        # Transcriptions that are at least this confident are taken as they
+        # are, without trying their alternatives
+        self.confidence_threshold = profile.get('stt_confidence_threshold',
+                                                0.9)
 
     @classmethod
     def get_modules(cls):
@@ -56,31 +63,62 @@ class Brain(object):
                      else 0, reverse=True)
         return modules
 
+    def get_prompts(self):
+        """
+        Returns the static phrases that Jasper may say while handling input,
+        i.e. the Brain's own ones and those that modules declare in their
+        optional PROMPTS constant.
+        """
+        prompts = [self.ERROR_MESSAGE]
+        for module in self.modules:
+            for prompt in getattr(module, 'PROMPTS', []):
+                if prompt not in prompts:
+                    prompts.append(prompt)
+        return prompts
+
     def query(self, texts):
         """
         Passes user input to the appropriate module, testing it against
         each candidate module's isValid function.
 
         Arguments:
-        text -- user input, typically speech, to be parsed by a module
+        texts -- user input, typically speech, to be parsed by a module.
+                 If it is a stt.Transcription whose best hypothesis clears
+                 the confidence threshold and is valid for a module, the
+                 alternatives are skipped.
         """
+        hypotheses = getattr(texts, 'hypotheses', None)
+        if (hypotheses and hypotheses[0].confidence is not None and
+                hypotheses[0].confidence >= self.confidence_threshold):
+            text = hypotheses[0].text
+            # Unclear accepts any text, so it is only used once none of
+            # the alternatives is valid for another module
+            for module in self.modules:
+                if module.__name__ != 'Unclear' and module.isValid(text):
+                    self._logger.debug("Confident transcription '%s' (%s), " +
+                                       "skipping alternatives", text,
+                                       hypotheses[0].confidence)
+                    self._handle(module, text)
+                    return
+            self._logger.debug("Confident transcription '%s' is not a " +
+                               "valid phrase for any module, trying " +
+                               "alternatives", text)
         for module in self.modules:
             for text in texts:
                 if module.isValid(text):
-                    self._logger.debug("'%s' is a valid phrase for module " +
-                                       "'%s'", text, module.__name__)
-                    try:
-                        module.handle(text, self.mic, self.profile)
-                    except Exception:
-                        self._logger.error('Failed to execute module',
-                                           exc_info=True)
-                        self.mic.say("I'm sorry. I had some trouble with " +
-                                     "that operation. Please try again later.")
-                    else:
-                        self._logger.debug("Handling of phrase '%s' by " +
-                                           "module '%s' completed", text,
-                                           module.__name__)
-                    finally:
-                        return
+                    self._handle(module, text)
+                    return
         self._logger.debug("No module was able to handle any of these " +
                            "phrases: %r", texts)
+
+    def _handle(self, module, text):
+        self._logger.debug("'%s' is a valid phrase for module '%s'", text,
+                           module.__name__)
+        try:
+            module.handle(text, self.mic, self.profile)
+        except Exception:
+            self._logger.error('Failed to execute module', exc_info=True)
+            self.mic.say(self.ERROR_MESSAGE)
+        else:
+            self._logger.debug("Handling of phrase '%s' by module '%s' " +
+                               "completed", text, module.__name__)
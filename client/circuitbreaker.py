@@ -0,0 +1,71 @@
+# -*- coding: utf-8-*-
+"""
+A circuit breaker stops calling an engine that failed repeatedly, so that
+every request doesn't have to wait for the same timeout again.
+
+The breaker opens after failure_threshold consecutive failures. Once the
+cooldown has passed, it lets a trial call through: if that call succeeds,
+the breaker closes again, otherwise it stays open for another cooldown.
+"""
+import time
+import logging
+import threading
+
+
+class CircuitBreaker(object):
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, failure_threshold=3, cooldown=60):
+        """
+        Arguments:
+            name -- the name of the protected engine, used for logging
+            failure_threshold -- (optional) the number of consecutive
+                                 failures after which the breaker opens
+                                 (Default: 3)
+            cooldown -- (optional) seconds to skip the engine for once the
+                        breaker is open (Default: 60)
+        """
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return self.CLOSED
+            if time.time() - self._opened_at < self.cooldown:
+                return self.OPEN
+            return self.HALF_OPEN
+
+    def allow(self):
+        """
+        Returns:
+            True if the engine may be called
+        """
+        return self.state != self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                self._logger.info("Circuit breaker for '%s' closed.",
+                                  self.name)
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    self._logger.warning("Circuit breaker for '%s' opened " +
+                                         "after %d failures.", self.name,
+                                         self._failures)
+                self._opened_at = time.time()
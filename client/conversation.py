@@ -6,6 +6,8 @@ from brain import Brain
 
 class Conversation(object):
 
+    PARDON = "Pardon?"
+
     def __init__(self, persona, mic, profile):
         self._logger = logging.getLogger(__name__)
         self.persona = persona
@@ -14,6 +16,14 @@ class Conversation(object):
         self.brain = Brain(mic, profile)
         self.notifier = Notifier(profile)
 
+    def presynthesizePrompts(self):
+        """
+        Synthesizes all static prompts in the background, so that the first
+        response after startup is as fast as every later one.
+        """
+        return self.mic.presynthesize([self.PARDON] +
+                                      self.brain.get_prompts())
+
     def handleForever(self):
         """
         Delegates user input to the handling function when activated.
@@ -46,4 +56,4 @@ class Conversation(object):
             if input:
                 self.brain.query(input)
             else:
-                self.mic.say("Pardon?")
+                self.mic.say(self.PARDON)
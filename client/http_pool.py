@@ -0,0 +1,80 @@
+# -*- coding: utf-8-*-
+"""
+Provides a shared HTTP session for all engines that talk to web services.
+
+Reusing one session keeps connections alive between requests, so that
+subsequent requests to the same host skip the TCP and TLS handshakes.
+"""
+import os
+import logging
+import threading
+import requests
+import requests.adapters
+import yaml
+import jasperpath
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class PooledSession(requests.Session):
+    """
+    A requests.Session with a configurable connection pool and a default
+    timeout for all requests.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=4, max_retries=0,
+                 connect_timeout=5, read_timeout=30):
+        """
+        Arguments:
+            pool_connections -- the number of hosts to keep connections for
+            pool_maxsize -- the maximum number of connections per host
+            max_retries -- the number of retries for failed connections
+            connect_timeout -- seconds to wait for a connection
+            read_timeout -- seconds to wait for a response
+        """
+        super(PooledSession, self).__init__()
+        self.timeout = (connect_timeout, read_timeout)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+            max_retries=max_retries)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    @classmethod
+    def get_config(cls):
+        # FIXME: Replace this as soon as we have a config module
+        config = {}
+        # Try to get pool settings from config
+        profile_path = jasperpath.config('profile.yml')
+        if os.path.exists(profile_path):
+            with open(profile_path, 'r') as f:
+                profile = yaml.safe_load(f)
+                if 'http' in profile:
+                    for key in ('pool_connections', 'pool_maxsize',
+                                'max_retries', 'connect_timeout',
+                                'read_timeout'):
+                        if key in profile['http']:
+                            config[key] = profile['http'][key]
+        return config
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super(PooledSession, self).request(method, url, **kwargs)
+
+
+def get_session():
+    """
+    Returns:
+        The PooledSession instance shared by all engines, created on first
+        use from the 'http' section of profile.yml
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            config = PooledSession.get_config()
+            logging.getLogger(__name__).debug('Creating HTTP session with ' +
+                                              'config: %r', config)
+            _session = PooledSession(**config)
+        return _session
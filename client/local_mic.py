@@ -9,7 +9,8 @@ implementation, Jasper is always active listening with local_mic.
 class Mic:
     prev = None
 
-    def __init__(self, speaker, passive_stt_engine, active_stt_engine):
+    def __init__(self, speaker, passive_stt_engine, active_stt_engine,
+                 **kwargs):
         return
 
     def passiveListen(self, PERSONA):
@@ -28,5 +29,8 @@ class Mic:
         self.prev = input
         return input
 
+    def presynthesize(self, phrases):
+        pass
+
     def say(self, phrase, OPTIONS=None):
         print("JASPER: %s" % phrase)
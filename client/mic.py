@@ -3,12 +3,15 @@
     The Mic class handles all interactions with the microphone and speaker.
 """
 import logging
-import tempfile
-import wave
-import audioop
+import collections
+import threading
 import pyaudio
 import alteration
 import jasperpath
+import audio_utils
+import vad
+from player import Player
+from audio_utils import RingBuffer, EnergyTracker
 
 
 class Mic:
@@ -16,7 +19,18 @@ class Mic:
     speechRec = None
     speechRec_persona = None
 
-    def __init__(self, speaker, passive_stt_engine, active_stt_engine):
+    RATE = 16000
+    CHUNK = 1024
+    SAMPLE_WIDTH = pyaudio.get_sample_size(pyaudio.paInt16)
+
+    # number of seconds of audio kept in the capture buffer
+    BUFFER_TIME = 20
+
+    BEEP_HI = jasperpath.data('audio', 'beep_hi.wav')
+    BEEP_LO = jasperpath.data('audio', 'beep_lo.wav')
+
+    def __init__(self, speaker, passive_stt_engine, active_stt_engine,
+                 preroll_ms=500, vad_engine=None, output_device=None):
         """
         Initiates the pocketsphinx instance.
 
@@ -25,167 +39,290 @@ class Mic:
         passive_stt_engine -- performs STT while Jasper is in passive listen
                               mode
         acive_stt_engine -- performs STT while Jasper is in active listen mode
+        preroll_ms -- milliseconds of audio captured before the beep that
+                      will be prepended to actively recorded utterances
+        vad_engine -- detects the end of actively recorded utterances
+                      (Default: an EnergyVAD instance)
+        output_device -- the index of the audio output device or a part of
+                         its name (Default: the default output device)
         """
         self._logger = logging.getLogger(__name__)
         self.speaker = speaker
         self.passive_stt_engine = passive_stt_engine
         self.active_stt_engine = active_stt_engine
+        self.preroll_ms = preroll_ms
+        if vad_engine is None:
+            vad_engine = vad.EnergyVAD(rate=self.RATE)
+        self.vad_engine = vad_engine
+        self._passive_lastN = None
+        self._passive_position = None
+        self._passive_frames = None
+        self._passive_quiet_chunks = 0
+        self._passive_loud_chunks = 0
+        self._passive_transcription = None
+        self._passive_transcription_chunks = 0
         self._logger.info("Initializing PyAudio. ALSA/Jack error messages " +
                           "that pop up during this process are normal and " +
                           "can usually be safely ignored.")
         self._audio = pyaudio.PyAudio()
         self._logger.info("Initialization of PyAudio completed.")
 
+        # Beeps and speech are played through the same PyAudio instance
+        self._player = Player(self._audio, device=output_device)
+        self._player.preload([self.BEEP_HI, self.BEEP_LO])
+        self.speaker.set_player(self._player)
+
+        # A single input stream is kept open for the whole lifetime of this
+        # instance. A background thread feeds it into a ring buffer, from
+        # which the listening methods read their audio data.
+        self._buffer = RingBuffer(self.RATE / self.CHUNK * self.BUFFER_TIME)
+        self._stream = self._audio.open(format=pyaudio.paInt16,
+                                        channels=1,
+                                        rate=self.RATE,
+                                        input=True,
+                                        frames_per_buffer=self.CHUNK)
+        self._capture_thread = threading.Thread(target=self._capture,
+                                                name='MicCapture')
+        self._capture_thread.daemon = True
+        self._capture_thread.start()
+
     def __del__(self):
-        self._audio.terminate()
+        self.close()
+
+    def close(self):
+        """
+        Stops capturing audio and releases the audio device.
+        """
+        # Attributes are missing if __init__ failed part-way, e.g. because
+        # the input device couldn't be opened
+        buffer = getattr(self, '_buffer', None)
+        if buffer is not None:
+            if buffer.closed:
+                return
+            buffer.close()
+        if getattr(self, '_capture_thread', None) is not None:
+            self._capture_thread.join()
+        if getattr(self, '_stream', None) is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+        if getattr(self, '_player', None) is not None:
+            self._player.close()
+        if getattr(self, '_audio', None) is not None:
+            self._audio.terminate()
+            self._audio = None
+
+    def _capture(self):
+        """
+        Continuously reads audio data from the input stream into the ring
+        buffer until the buffer gets closed.
+        """
+        while not self._buffer.closed:
+            try:
+                data = self._stream.read(self.CHUNK)
+            except IOError as e:
+                # Input overflows are reported as IOError, the stream itself
+                # remains usable.
+                self._logger.debug("Error while reading from input " +
+                                   "stream: %s", e)
+                continue
+            self._buffer.append(data)
 
     def getScore(self, data):
-        rms = audioop.rms(data, 2)
+        rms = audio_utils.rms(data, 2)
         score = rms / 3
         return score
 
+    def getScores(self, frames):
+        return [rms / 3 for rms in audio_utils.rms_many(frames, 2)]
+
     def fetchThreshold(self):
 
-        # TODO: Consolidate variables from the next three functions
         THRESHOLD_MULTIPLIER = 1.8
-        RATE = 16000
-        CHUNK = 1024
+        RATE = self.RATE
+        CHUNK = self.CHUNK
 
         # number of seconds to allow to establish threshold
         THRESHOLD_TIME = 1
 
-        # prepare recording stream
-        stream = self._audio.open(format=pyaudio.paInt16,
-                                  channels=1,
-                                  rate=RATE,
-                                  input=True,
-                                  frames_per_buffer=CHUNK)
+        # read from the shared capture buffer
+        stream = self._buffer.read()
 
         # stores the audio data
-        frames = []
-
-        # stores the lastN score values
-        lastN = [i for i in range(20)]
+        frames = [next(stream) for i in range(RATE / CHUNK * THRESHOLD_TIME)]
 
         # calculate the long run average, and thereby the proper threshold
-        for i in range(0, RATE / CHUNK * THRESHOLD_TIME):
-
-            data = stream.read(CHUNK)
-            frames.append(data)
-
-            # save this data point as a score
-            lastN.pop(0)
-            lastN.append(self.getScore(data))
-            average = sum(lastN) / len(lastN)
-
-        stream.stop_stream()
-        stream.close()
+        lastN = EnergyTracker(len(frames))
+        lastN.extend(self.getScores(frames))
 
         # this will be the benchmark to cause a disturbance over!
-        THRESHOLD = average * THRESHOLD_MULTIPLIER
+        THRESHOLD = lastN.average * THRESHOLD_MULTIPLIER
 
         return THRESHOLD
 
+    def _resetPassiveListening(self, window):
+        """
+        Discards the audio data and the transcription that passiveListen()
+        carries over from its previous call.
+        """
+        if self._passive_transcription is not None:
+            self._passive_transcription.finish()
+        self._passive_frames = collections.deque(maxlen=window)
+        self._passive_quiet_chunks = window
+        self._passive_loud_chunks = 0
+        self._passive_transcription = None
+        self._passive_transcription_chunks = 0
+
     def passiveListen(self, PERSONA):
         """
         Listens for PERSONA in everyday sound. Times out after LISTEN_TIME, so
         needs to be restarted.
+
+        Listening is continuous: the noise level, the most recent audio and
+        a transcription in progress are carried over between calls, so that
+        PERSONA is also spotted if it is said while a call returns. As soon
+        as a disturbance is detected, a sliding window over the most recent
+        audio is fed into the passive STT engine chunk by chunk. The partial
+        transcription is checked every HOP_TIME seconds, so PERSONA is
+        reported as soon as it is spotted.
         """
 
         THRESHOLD_MULTIPLIER = 1.8
-        RATE = 16000
-        CHUNK = 1024
+        RATE = self.RATE
+        CHUNK = self.CHUNK
 
         # number of seconds to allow to establish threshold
         THRESHOLD_TIME = 1
 
-        # number of seconds to listen before forcing restart
+        # number of seconds to listen before returning to the caller
         LISTEN_TIME = 10
 
-        # prepare recording stream
-        stream = self._audio.open(format=pyaudio.paInt16,
-                                  channels=1,
-                                  rate=RATE,
-                                  input=True,
-                                  frames_per_buffer=CHUNK)
+        # number of seconds of audio in which PERSONA is searched
+        WINDOW_TIME = 2.5
 
-        # stores the audio data
-        frames = []
+        # number of seconds between two checks of the partial transcription
+        HOP_TIME = 0.5
 
-        # stores the lastN score values
-        lastN = [i for i in range(30)]
+        # number of seconds after which a transcription is restarted
+        MAX_STREAM_TIME = 5
 
-        # calculate the long run average, and thereby the proper threshold
-        for i in range(0, RATE / CHUNK * THRESHOLD_TIME):
+        # only every Nth chunk above the threshold is added to the noise
+        # level, so that the threshold slowly follows a lasting rise of the
+        # background noise (e.g. a TV) without drowning out speech
+        ADAPTATION_INTERVAL = 8
 
-            data = stream.read(CHUNK)
-            frames.append(data)
+        WINDOW = int(RATE / CHUNK * WINDOW_TIME)
+        HOP = int(RATE / CHUNK * HOP_TIME)
+        MAX_STREAM = int(RATE / CHUNK * MAX_STREAM_TIME)
 
-            # save this data point as a score
-            lastN.pop(0)
-            lastN.append(self.getScore(data))
-            average = sum(lastN) / len(lastN)
+        # continue where the last call stopped reading, unless too much time
+        # has passed since then (e.g. because we listened actively)
+        position = self._buffer.position
+        if (self._passive_position is not None and
+                position - self._passive_position < HOP):
+            position = self._passive_position
+        else:
+            self._resetPassiveListening(WINDOW)
 
-        # this will be the benchmark to cause a disturbance over!
-        THRESHOLD = average * THRESHOLD_MULTIPLIER
+        # read from the shared capture buffer
+        stream = self._buffer.read(position)
+
+        # stores the lastN score values, kept across calls
+        if self._passive_lastN is None:
+            # calculate the long run average, and thereby the proper
+            # threshold
+            frames = [next(stream)
+                      for i in range(RATE / CHUNK * THRESHOLD_TIME)]
+            position += len(frames)
+            scores = self.getScores(frames)
+            self._passive_lastN = EnergyTracker(
+                30, initial=sum(scores) / float(len(scores)))
+            self._passive_lastN.extend(scores)
+        lastN = self._passive_lastN
+
+        # sliding window of the most recent audio data
+        frames = self._passive_frames
+
+        # number of chunks since the last disturbance
+        quiet_chunks = self._passive_quiet_chunks
 
-        # save some memory for sound data
-        frames = []
+        # number of chunks above the threshold
+        loud_chunks = self._passive_loud_chunks
 
-        # flag raised when sound disturbance detected
-        didDetect = False
+        # incremental transcription of the current disturbance
+        transcription = self._passive_transcription
+        transcription_chunks = self._passive_transcription_chunks
+
+        transcribed = None
 
         # start passively listening for disturbance above threshold
         for i in range(0, RATE / CHUNK * LISTEN_TIME):
 
-            data = stream.read(CHUNK)
+            data = next(stream)
+            position += 1
             frames.append(data)
             score = self.getScore(data)
 
+            # this will be the benchmark to cause a disturbance over!
+            THRESHOLD = lastN.average * THRESHOLD_MULTIPLIER
+
             if score > THRESHOLD:
-                didDetect = True
-                break
+                quiet_chunks = 0
+                loud_chunks += 1
+                if loud_chunks % ADAPTATION_INTERVAL == 0:
+                    lastN.add(score)
+            else:
+                quiet_chunks += 1
+                # save this data point as a score
+                lastN.add(score)
+
+            if transcription is None:
+                if quiet_chunks >= WINDOW:
+                    continue
+                # start transcribing, including the audio data that was
+                # recorded before the disturbance
+                transcription = self.passive_stt_engine.begin_stream(
+                    RATE, self.SAMPLE_WIDTH)
+                for chunk in frames:
+                    transcription.feed(chunk)
+                transcription_chunks = len(frames)
+            else:
+                transcription.feed(data)
+                transcription_chunks += 1
+
+            if quiet_chunks >= WINDOW or transcription_chunks >= MAX_STREAM:
+                transcribed = transcription.finish()
+                transcription = None
+            elif transcription_chunks % HOP == 0:
+                transcribed = transcription.partial()
+            else:
+                continue
+
+            # check if PERSONA was said
+            if any(PERSONA in phrase for phrase in transcribed):
+                self._passive_transcription = transcription
+                self._resetPassiveListening(WINDOW)
+                self._passive_position = None
+                return (THRESHOLD, PERSONA)
+
+        # the next call continues with this state
+        self._passive_position = position
+        self._passive_quiet_chunks = quiet_chunks
+        self._passive_loud_chunks = loud_chunks
+        self._passive_transcription = transcription
+        self._passive_transcription_chunks = transcription_chunks
 
         # no use continuing if no flag raised
-        if not didDetect:
+        if transcribed is None:
             print "No disturbance detected"
-            stream.stop_stream()
-            stream.close()
             return (None, None)
 
-        # cutoff any recording before this disturbance was detected
-        frames = frames[-20:]
-
-        # otherwise, let's keep recording for few seconds and save the file
-        DELAY_MULTIPLIER = 1
-        for i in range(0, RATE / CHUNK * DELAY_MULTIPLIER):
-
-            data = stream.read(CHUNK)
-            frames.append(data)
-
-        # save the audio data
-        stream.stop_stream()
-        stream.close()
-
-        with tempfile.NamedTemporaryFile(mode='w+b') as f:
-            wav_fp = wave.open(f, 'wb')
-            wav_fp.setnchannels(1)
-            wav_fp.setsampwidth(pyaudio.get_sample_size(pyaudio.paInt16))
-            wav_fp.setframerate(RATE)
-            wav_fp.writeframes(''.join(frames))
-            wav_fp.close()
-            f.seek(0)
-            # check if PERSONA was said
-            transcribed = self.passive_stt_engine.transcribe(f)
-
-        if any(PERSONA in phrase for phrase in transcribed):
-            return (THRESHOLD, PERSONA)
-
         return (False, transcribed)
 
     def activeListen(self, THRESHOLD=None, LISTEN=True, MUSIC=False):
         """
-            Records until a second of silence or times out after 12 seconds
+            Records until the VAD engine detects the end of the utterance or
+            times out after 12 seconds
 
             Returns the first matching string or None
         """
@@ -197,63 +334,80 @@ class Mic:
     def activeListenToAllOptions(self, THRESHOLD=None, LISTEN=True,
                                  MUSIC=False):
         """
-            Records until a second of silence or times out after 12 seconds
+            Records until the VAD engine detects the end of the utterance or
+            times out after 12 seconds
 
             Returns a list of the matching options or None
         """
 
-        RATE = 16000
-        CHUNK = 1024
+        RATE = self.RATE
+        CHUNK = self.CHUNK
         LISTEN_TIME = 12
 
         # check if no threshold provided
         if THRESHOLD is None:
             THRESHOLD = self.fetchThreshold()
 
-        self.speaker.play(jasperpath.data('audio', 'beep_hi.wav'))
+        # users often start speaking before the beep has been played, so we
+        # also record some pre-roll before it
+        PREROLL = int(round(self.preroll_ms / 1000.0 * RATE / CHUNK))
+        beep_start = self._buffer.position
+        start = max(beep_start - PREROLL, 0)
 
-        # prepare recording stream
-        stream = self._audio.open(format=pyaudio.paInt16,
-                                  channels=1,
-                                  rate=RATE,
-                                  input=True,
-                                  frames_per_buffer=CHUNK)
+        self._player.play(self.BEEP_HI)
 
-        frames = []
-        # increasing the range # results in longer pause after command
-        # generation
-        lastN = [THRESHOLD * 1.2 for i in range(30)]
+        # the player returns once the beep has been played, but its end may
+        # still be on its way from the input device, so one more chunk is
+        # skipped
+        beep_end = self._buffer.position + 1
 
-        for i in range(0, RATE / CHUNK * LISTEN_TIME):
+        # the audio data is transcribed while it is being recorded
+        transcription = self.active_stt_engine.begin_stream(
+            RATE, self.SAMPLE_WIDTH)
 
-            data = stream.read(CHUNK)
-            frames.append(data)
-            score = self.getScore(data)
+        self.vad_engine.reset(THRESHOLD)
+
+        # speech in the pre-roll counts towards the utterance, so that the
+        # VAD doesn't wait for speech to start that has already started.
+        # The end of the utterance is only detected after the beep, though.
+        stream = self._buffer.read(start)
+        for i in range(beep_start - start):
+            data = next(stream)
+            transcription.feed(data)
+            self.vad_engine.process(data)
 
-            lastN.pop(0)
-            lastN.append(score)
+        # the beep itself must not reach the recognizer or the VAD
+        stream = self._buffer.read(beep_end)
 
-            average = sum(lastN) / float(len(lastN))
+        for i in range(0, RATE / CHUNK * LISTEN_TIME):
+
+            data = next(stream)
+            transcription.feed(data)
 
-            # TODO: 0.8 should not be a MAGIC NUMBER!
-            if average < THRESHOLD * 0.8:
+            if self.vad_engine.process(data):
                 break
 
-        self.speaker.play(jasperpath.data('audio', 'beep_lo.wav'))
-
-        # save the audio data
-        stream.stop_stream()
-        stream.close()
-
-        with tempfile.SpooledTemporaryFile(mode='w+b') as f:
-            wav_fp = wave.open(f, 'wb')
-            wav_fp.setnchannels(1)
-            wav_fp.setsampwidth(pyaudio.get_sample_size(pyaudio.paInt16))
-            wav_fp.setframerate(RATE)
-            wav_fp.writeframes(''.join(frames))
-            wav_fp.close()
-            f.seek(0)
-            return self.active_stt_engine.transcribe(f)
+        self._player.play(self.BEEP_LO)
+
+        return transcription.finish()
+
+    def presynthesize(self, phrases):
+        """
+        Synthesizes phrases on a background thread, so that saying them
+        later doesn't have to wait for the TTS engine.
+
+        Arguments:
+            phrases -- a list of phrases
+
+        Returns:
+            The background thread
+        """
+        phrases = [alteration.clean(phrase) for phrase in phrases]
+        thread = threading.Thread(target=self.speaker.presynthesize,
+                                  args=(phrases,), name='presynthesis')
+        thread.daemon = True
+        thread.start()
+        return thread
 
     def say(self, phrase,
             OPTIONS=" -vdefault+m3 -p 40 -s 160 --stdout > say.wav"):
@@ -6,6 +6,12 @@ from dateutil import parser
 
 WORDS = ["EMAIL", "INBOX"]
 
+NOT_AUTHENTICATED = "I'm sorry. I'm not authenticated to work with your Gmail."
+NO_UNREAD_EMAILS = "You have no unread emails."
+
+# Static phrases that are synthesized ahead of time
+PROMPTS = [NOT_AUTHENTICATED, NO_UNREAD_EMAILS]
+
 
 def getSender(email):
     """
@@ -106,12 +112,11 @@ def handle(text, mic, profile):
 
         senders = [getSender(e) for e in msgs]
     except imaplib.IMAP4.error:
-        mic.say(
-            "I'm sorry. I'm not authenticated to work with your Gmail.")
+        mic.say(NOT_AUTHENTICATED)
         return
 
     if not senders:
-        mic.say("You have no unread emails.")
+        mic.say(NO_UNREAD_EMAILS)
     elif len(senders) == 1:
         mic.say("You have one unread email from " + senders[0] + ".")
     else:
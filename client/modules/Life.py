@@ -4,6 +4,9 @@ import re
 
 WORDS = ["MEANING", "OF", "LIFE"]
 
+PROMPTS = ["It's 42, you idiot.",
+           "It's 42. How many times do I have to tell you?"]
+
 
 def handle(text, mic, profile):
     """
@@ -16,10 +19,7 @@ def handle(text, mic, profile):
         profile -- contains information related to the user (e.g., phone
                    number)
     """
-    messages = ["It's 42, you idiot.",
-                "It's 42. How many times do I have to tell you?"]
-
-    message = random.choice(messages)
+    message = random.choice(PROMPTS)
 
     mic.say(message)
 
@@ -3,7 +3,6 @@ import re
 import logging
 import difflib
 import mpd
-from client.mic import Mic
 
 # Standard module stuff
 WORDS = ["MUSIC", "SPOTIFY"]
@@ -66,7 +65,7 @@ class MusicMode(object):
     def __init__(self, PERSONA, mic, mpdwrapper):
         self._logger = logging.getLogger(__name__)
         self.persona = PERSONA
-        # self.mic - we're actually going to ignore the mic they passed in
+        self.mic = mic
         self.music = mpdwrapper
 
         # index spotify playlists into new dictionary and language models
@@ -75,11 +74,10 @@ class MusicMode(object):
                    "PLAYLIST"]
         phrases.extend(self.music.get_soup_playlist())
 
-        music_stt_engine = mic.active_stt_engine.get_instance('music', phrases)
-
-        self.mic = Mic(mic.speaker,
-                       mic.passive_stt_engine,
-                       music_stt_engine)
+        # Engines that support it add the music vocabulary to the decoder
+        # they already have, so switching to it costs no reloading
+        self.music_stt_engine = mic.active_stt_engine.with_vocabulary(
+            'music', phrases)
 
     def delegateInput(self, input):
 
@@ -155,6 +153,16 @@ class MusicMode(object):
         return
 
     def handleForever(self):
+        # The mic keeps the audio input device open, so we reuse it with the
+        # music vocabulary instead of creating a second one
+        default_stt_engine = self.mic.active_stt_engine
+        self.mic.active_stt_engine = self.music_stt_engine
+        try:
+            self._handleForever()
+        finally:
+            self.mic.active_stt_engine = default_stt_engine
+
+    def _handleForever(self):
 
         self.music.play()
         self.mic.say("Playing %s" % self.music.current_song())
@@ -8,6 +8,17 @@ WORDS = ["NEWS", "YES", "NO", "FIRST", "SECOND", "THIRD"]
 
 PRIORITY = 3
 
+PULLING_UP = "Pulling up the news"
+MOMENT = "Sure, just give me a moment"
+ALL_SET = "All set"
+NOT_SENDING = "OK I will not send any articles"
+SEND_FAILED = ("I'm having trouble sending you these articles. Please make " +
+               "sure that your phone number and carrier are correct on the " +
+               "dashboard.")
+
+# Static phrases that are synthesized ahead of time
+PROMPTS = [PULLING_UP, MOMENT, ALL_SET, NOT_SENDING, SEND_FAILED]
+
 URL = 'http://news.ycombinator.com'
 
 
@@ -44,7 +55,7 @@ def handle(text, mic, profile):
         profile -- contains information related to the user (e.g., phone
                    number)
     """
-    mic.say("Pulling up the news")
+    mic.say(PULLING_UP)
     articles = getTopArticles(maxResults=3)
     titles = [" ".join(x.title.split(" - ")[:-1]) for x in articles]
     all_titles = "... ".join(str(idx + 1) + ")" +
@@ -64,7 +75,7 @@ def handle(text, mic, profile):
         send_all = not chosen_articles and app_utils.isPositive(text)
 
         if send_all or chosen_articles:
-            mic.say("Sure, just give me a moment")
+            mic.say(MOMENT)
 
             if profile['prefers_email']:
                 body = "<ul>"
@@ -87,10 +98,7 @@ def handle(text, mic, profile):
                     else:
                         if not app_utils.emailUser(profile, SUBJECT="",
                                                    BODY=article_link):
-                            mic.say("I'm having trouble sending you these " +
-                                    "articles. Please make sure that your " +
-                                    "phone number and carrier are correct " +
-                                    "on the dashboard.")
+                            mic.say(SEND_FAILED)
                             return
 
             # if prefers email, we send once, at the end
@@ -99,16 +107,14 @@ def handle(text, mic, profile):
                 if not app_utils.emailUser(profile,
                                            SUBJECT="Your Top Headlines",
                                            BODY=body):
-                    mic.say("I'm having trouble sending you these articles. " +
-                            "Please make sure that your phone number and " +
-                            "carrier are correct on the dashboard.")
+                    mic.say(SEND_FAILED)
                     return
 
-            mic.say("All set")
+            mic.say(ALL_SET)
 
         else:
 
-            mic.say("OK I will not send any articles")
+            mic.say(NOT_SENDING)
 
     if 'phone_number' in profile:
         mic.say("Here are the current top headlines. " + all_titles +
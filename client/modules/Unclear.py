@@ -6,6 +6,10 @@ WORDS = []
 
 PRIORITY = -(maxint + 1)
 
+PROMPTS = ["I'm sorry, could you repeat that?",
+           "My apologies, could you try saying that again?",
+           "Say that again?", "I beg your pardon?"]
+
 
 def handle(text, mic, profile):
     """
@@ -18,11 +22,7 @@ def handle(text, mic, profile):
                    number)
     """
 
-    messages = ["I'm sorry, could you repeat that?",
-                "My apologies, could you try saying that again?",
-                "Say that again?", "I beg your pardon?"]
-
-    message = random.choice(messages)
+    message = random.choice(PROMPTS)
 
     mic.say(message)
 
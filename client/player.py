@@ -0,0 +1,173 @@
+# -*- coding: utf-8-*-
+"""
+Plays audio in-process through PyAudio instead of running a player
+executable for every sound.
+"""
+import logging
+import threading
+from audio_utils import AudioData, read_wav_header
+
+
+class Player(object):
+    """
+    Plays WAV files and raw audio data through a single PyAudio output
+    stream that is kept open between sounds, so that playing a short sound
+    costs little more than writing its samples. The stream is only reopened
+    if a sound has a different format than the previous one, and it is
+    closed once it has been idle for idle_timeout seconds, so that other
+    programs (e.g. MPD) can use the output device in between.
+
+    Like an external player, all methods block until the sound has actually
+    been played, not only until it has been handed to the output device.
+
+    Frequently played sounds (e.g. the beeps) can be preloaded into memory.
+    """
+
+    def __init__(self, audio, device=None, idle_timeout=5):
+        """
+        Arguments:
+            audio -- the pyaudio.PyAudio instance to use
+            device -- (optional) the index of the output device or a part of
+                      its name (Default: the default output device)
+            idle_timeout -- (optional) seconds after the last sound after
+                            which the output stream is closed (Default: 5)
+        """
+        self._logger = logging.getLogger(__name__)
+        self._audio = audio
+        self._lock = threading.Lock()
+        self._stream = None
+        self._format = None
+        self._idle_timer = None
+        self._preloaded = {}
+        self.idle_timeout = idle_timeout
+        self.device_index = self._get_device_index(device)
+
+    def _get_device_index(self, device):
+        if device is None or isinstance(device, int):
+            return device
+        for i in range(self._audio.get_device_count()):
+            info = self._audio.get_device_info_by_index(i)
+            if info['maxOutputChannels'] > 0 and device in info['name']:
+                self._logger.debug("Using audio output device '%s'",
+                                   info['name'])
+                return i
+        raise ValueError("No audio output device named '%s' found" % device)
+
+    def preload(self, filenames):
+        """
+        Reads WAV files into memory, so that playing them doesn't have to
+        read them from disk.
+
+        Arguments:
+            filenames -- a list of WAV filenames
+        """
+        for filename in filenames:
+            self._preloaded[filename] = AudioData.from_wav(filename)
+
+    def play(self, filename):
+        """
+        Plays a WAV file.
+
+        Arguments:
+            filename -- the WAV file to play
+        """
+        audio = self._preloaded.get(filename)
+        if audio is None:
+            audio = AudioData.from_wav(filename)
+        self.play_data(audio)
+
+    def play_data(self, audio):
+        """
+        Plays raw audio data.
+
+        Arguments:
+            audio -- an audio_utils.AudioData instance
+        """
+        with self._lock:
+            stream = self._open_stream(audio.rate, audio.sample_width,
+                                       audio.channels)
+            try:
+                stream.write(audio.data)
+            finally:
+                self._finish_stream()
+
+    def play_stream(self, fp, chunk_size=1024):
+        """
+        Plays WAV data from a file object while it is still being written,
+        e.g. from the stdout of a synthesizer.
+
+        Arguments:
+            fp -- a file object positioned at the start of the WAV data
+            chunk_size -- (optional) the number of frames to play at once
+
+        Returns:
+            An audio_utils.AudioData instance of the played audio data, e.g.
+            to cache it
+
+        Raises:
+            ValueError if the data is not in WAV format
+        """
+        rate, sample_width, channels = read_wav_header(fp)
+        frames = []
+        with self._lock:
+            stream = self._open_stream(rate, sample_width, channels)
+            try:
+                while True:
+                    # Reading a file object blocks until all requested data
+                    # is available, so chunks only end in the middle of a
+                    # frame at the end of the data
+                    data = fp.read(chunk_size * sample_width * channels)
+                    if not data:
+                        break
+                    stream.write(data)
+                    frames.append(data)
+            finally:
+                self._finish_stream()
+        return AudioData(frames, rate=rate, sample_width=sample_width,
+                         channels=channels)
+
+    def _open_stream(self, rate, sample_width, channels):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+        audio_format = (rate, sample_width, channels)
+        if self._stream is not None and audio_format != self._format:
+            self._close_stream()
+        if self._stream is None:
+            self._stream = self._audio.open(
+                format=self._audio.get_format_from_width(sample_width),
+                channels=channels,
+                rate=rate,
+                output=True,
+                output_device_index=self.device_index)
+            self._format = audio_format
+        elif self._stream.is_stopped():
+            self._stream.start_stream()
+        return self._stream
+
+    def _finish_stream(self):
+        # Writing only hands the audio data to PortAudio, stopping the
+        # stream waits until it has been played
+        self._stream.stop_stream()
+        self._idle_timer = threading.Timer(self.idle_timeout, self.close)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def _close_stream(self):
+        # Stopping the stream lets it play what is still buffered
+        if not self._stream.is_stopped():
+            self._stream.stop_stream()
+        self._stream.close()
+        self._stream = None
+        self._format = None
+
+    def close(self):
+        """
+        Closes the output stream.
+        """
+        with self._lock:
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            if self._stream is not None:
+                self._close_stream()
@@ -1,20 +1,396 @@
 #!/usr/bin/env python2
 # -*- coding: utf-8-*-
 import os
+import copy
 import wave
 import json
+import math
+import multiprocessing
+import collections
+import hashlib
+import Queue
 import tempfile
 import logging
 import urllib
-import urlparse
 import re
+import socket
+import struct
 import subprocess
+import threading
+import time
 from abc import ABCMeta, abstractmethod
+import concurrent.futures
 import requests
 import yaml
 import jasperpath
 import diagnose
 import vocabcompiler
+import http_pool
+from audio_utils import AudioData
+from circuitbreaker import CircuitBreaker
+
+
+# A recognized word with its start and end time in seconds and its
+# confidence between 0 and 1. Each of them is None if the engine doesn't
+# provide it.
+Word = collections.namedtuple('Word', ['text', 'start', 'end', 'confidence'])
+
+# A transcribed text with its confidence between 0 and 1 (None if the engine
+# doesn't provide one) and a possibly empty list of Words.
+Hypothesis = collections.namedtuple('Hypothesis',
+                                    ['text', 'confidence', 'words'])
+
+
+class Transcription(list):
+    """
+    The result of a transcription.
+
+    This is a list of the transcribed texts, most likely first, so that it
+    can be used like the plain lists of strings that the engines returned
+    before. The hypotheses attribute holds the Hypothesis for each text.
+    """
+
+    def __init__(self, hypotheses=()):
+        """
+        Arguments:
+            hypotheses -- an iterable of Hypothesis instances, most likely
+                          first
+        """
+        self.hypotheses = list(hypotheses)
+        super(Transcription, self).__init__(hypothesis.text for hypothesis
+                                            in self.hypotheses)
+
+    @classmethod
+    def from_texts(cls, texts, confidence=None):
+        """
+        Arguments:
+            texts -- an iterable of transcribed texts, most likely first
+            confidence -- (optional) the confidence of all texts
+
+        Returns:
+            A new Transcription instance
+        """
+        return cls(Hypothesis(text, confidence, []) for text in texts)
+
+    @property
+    def confidence(self):
+        """
+        Returns:
+            The confidence of the most likely hypothesis or None
+        """
+        if not self.hypotheses:
+            return None
+        return self.hypotheses[0].confidence
+
+
+class TranscriptionStream(object):
+    """
+    A transcription of audio data that is fed chunk by chunk while it is
+    being recorded.
+
+    This default implementation just collects the audio data and transcribes
+    it as a whole once the stream is finished. Engines that can decode
+    incrementally provide their own subclass via begin_stream().
+    """
+
+    def __init__(self, engine, rate=16000, sample_width=2):
+        """
+        Arguments:
+            engine -- the STT engine to use
+            rate -- the sample rate of the audio data
+            sample_width -- the sample width of the audio data in bytes
+        """
+        self.engine = engine
+        self.rate = rate
+        self.sample_width = sample_width
+        self._frames = []
+
+    def feed(self, data):
+        """
+        Feeds a chunk of audio data into the transcription.
+
+        Arguments:
+            data -- a string of raw audio data
+        """
+        self._frames.append(data)
+
+    def partial(self):
+        """
+        Returns:
+            A list of hypotheses for the audio data fed so far. Note that
+            this transcribes everything fed so far, so engines that decode
+            incrementally should override it.
+        """
+        return self.engine.transcribe_pcm(self.get_audio())
+
+    def finish(self):
+        """
+        Finishes the transcription.
+
+        Returns:
+            The transcription of all audio data fed into this stream
+        """
+        return self.engine.transcribe_pcm(self.get_audio())
+
+    def get_audio(self):
+        """
+        Returns:
+            The audio data fed so far as audio_utils.AudioData instance
+        """
+        return AudioData(list(self._frames), rate=self.rate,
+                         sample_width=self.sample_width)
+
+
+class ChunkedUploadStream(TranscriptionStream):
+    """
+    Uploads audio data to a web service while it is still being recorded.
+
+    The chunks fed into this stream are handed over to a background thread
+    that sends them as the body of a single request with chunked transfer
+    encoding, so that only the end of the utterance is left to upload once
+    it has been recorded.
+    """
+
+    # Seconds to wait for the next chunk before the upload is abandoned
+    TIMEOUT = 10
+
+    def __init__(self, engine, upload, rate=16000, sample_width=2):
+        """
+        Arguments:
+            engine -- the STT engine to use
+            upload -- a function that takes an iterator over the chunks of
+                      audio data, sends it and returns the transcription
+            rate -- the sample rate of the audio data
+            sample_width -- the sample width of the audio data in bytes
+        """
+        super(ChunkedUploadStream, self).__init__(
+            engine, rate=rate, sample_width=sample_width)
+        self._logger = logging.getLogger(__name__)
+        self._queue = Queue.Queue()
+        self._result = []
+        self._thread = threading.Thread(target=self._upload, args=(upload,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _upload(self, upload):
+        try:
+            self._result = upload(self._read_chunks())
+        except Exception:
+            self._logger.error('Streaming upload failed.', exc_info=True)
+
+    def _read_chunks(self):
+        while True:
+            try:
+                data = self._queue.get(timeout=self.TIMEOUT)
+            except Queue.Empty:
+                self._logger.warning('No audio data received for %d ' +
+                                     'seconds, aborting upload.',
+                                     self.TIMEOUT)
+                return
+            if data is None:
+                return
+            yield data
+
+    def feed(self, data):
+        super(ChunkedUploadStream, self).feed(data)
+        self._queue.put(data)
+
+    def partial(self):
+        # The web services only answer once the request body is complete
+        return []
+
+    def finish(self):
+        self._queue.put(None)
+        self._thread.join()
+        return self._result
+
+
+class LogfileDrainer(threading.Thread):
+    """
+    Forwards the lines an external library writes into a logfile to a
+    logger on a background thread and keeps the logfile from growing
+    without bound.
+
+    The logfile is only read if the logger is enabled for DEBUG messages.
+    """
+
+    def __init__(self, logfile, logger, max_size=1024 * 1024, interval=10):
+        """
+        Arguments:
+            logfile -- the path of the logfile
+            logger -- the logger that receives the lines at DEBUG level
+            max_size -- the size in bytes above which the logfile is
+                        truncated
+            interval -- seconds between two checks if drain() is not
+                        called
+        """
+        super(LogfileDrainer, self).__init__(name='LogfileDrainer')
+        self.daemon = True
+        self.logfile = logfile
+        self.logger = logger
+        self.max_size = max_size
+        self.interval = interval
+        self._offset = 0
+        self._event = threading.Event()
+        self._stopped = False
+
+    def drain(self):
+        """
+        Wakes up the background thread without waiting for it.
+        """
+        self._event.set()
+
+    def stop(self):
+        self._stopped = True
+        self._event.set()
+
+    def run(self):
+        while not self._stopped:
+            self._event.wait(self.interval)
+            self._event.clear()
+            try:
+                self._process()
+            except (IOError, OSError):
+                self.logger.debug("Cannot process logfile '%s'",
+                                  self.logfile, exc_info=True)
+
+    def _process(self):
+        size = os.path.getsize(self.logfile)
+        if size < self._offset:
+            # The logfile has been truncated
+            self._offset = 0
+        if self.logger.isEnabledFor(logging.DEBUG) and size > self._offset:
+            with open(self.logfile, 'r') as f:
+                f.seek(self._offset)
+                data = f.read(size - self._offset)
+            # Only consume complete lines
+            data = data[:data.rfind('\n') + 1]
+            self._offset += len(data)
+            for line in data.splitlines():
+                if line.strip():
+                    self.logger.debug(line.strip())
+        else:
+            self._offset = size
+        if size > self.max_size:
+            with open(self.logfile, 'r+') as f:
+                f.truncate(0)
+            self._offset = 0
+
+
+class OAuthTokenManager(object):
+    """
+    Keeps an OAuth access token (client credentials grant) valid by
+    refreshing it on a background thread shortly before it expires, so that
+    requests never have to wait for a new token.
+    """
+
+    # seconds to wait before retrying a failed token request
+    RETRY_INTERVAL = 30
+
+    def __init__(self, session, url, payload, refresh_margin=300):
+        """
+        Arguments:
+            session -- the requests.Session used for token requests
+            url -- the URL of the token endpoint
+            payload -- the form data of the token request
+            refresh_margin -- seconds before the expiry of a token at which
+                              it will be refreshed
+        """
+        self._logger = logging.getLogger(__name__)
+        self._session = session
+        self.url = url
+        self.payload = payload
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self.expires_at = None
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def start(self):
+        """
+        Fetches the first token on a background thread.
+        """
+        self._schedule(0)
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+
+    def _schedule(self, delay):
+        self.stop()
+        self._timer = threading.Timer(max(delay, 0), self._refresh_quietly)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            self._logger.warning('Fetching OAuth access token failed, ' +
+                                 'retrying in %d seconds.',
+                                 self.RETRY_INTERVAL, exc_info=True)
+            self._schedule(self.RETRY_INTERVAL)
+
+    def refresh(self):
+        """
+        Fetches a new token and schedules its refresh.
+
+        Returns:
+            The new access token
+        """
+        headers = {'content-type': 'application/x-www-form-urlencoded',
+                   'accept': 'application/json'}
+        r = self._session.post(self.url, data=self.payload, headers=headers)
+        r.raise_for_status()
+        response = r.json()
+        token = response['access_token']
+        expires_in = response.get('expires_in')
+        with self._lock:
+            self._token = token
+            if expires_in:
+                self.expires_at = time.time() + float(expires_in)
+            else:
+                self.expires_at = None
+        self._logger.debug('Fetched OAuth access token, expires in: %r',
+                           expires_in)
+        if expires_in:
+            self._schedule(self.get_refresh_delay(float(expires_in)))
+        return token
+
+    def get_refresh_delay(self, expires_in):
+        """
+        Returns:
+            Seconds to wait before refreshing a token that expires in
+            expires_in seconds. Tokens that live shorter than the refresh
+            margin are refreshed halfway through their lifetime instead of
+            immediately, which would fetch them over and over again.
+        """
+        return max(expires_in - self.refresh_margin, expires_in / 2.0)
+
+    @property
+    def is_valid(self):
+        with self._lock:
+            return (self._token is not None and
+                    (self.expires_at is None or
+                     time.time() < self.expires_at))
+
+    def get(self):
+        """
+        Returns:
+            A valid access token. Only if no valid token is available yet,
+            it is fetched synchronously.
+        """
+        if self.is_valid:
+            return self._token
+        return self.refresh()
+
+    def invalidate(self):
+        """
+        Discards the current token and fetches a new one in the background.
+        """
+        with self._lock:
+            self._token = None
+        self._schedule(0)
 
 
 class AbstractSTTEngine(object):
@@ -29,16 +405,29 @@ class AbstractSTTEngine(object):
     def get_config(cls):
         return {}
 
+    @classmethod
+    def get_vocabulary(cls, vocabulary_name, phrases):
+        """
+        Returns a compiled vocabulary of this engine's VOCABULARY_TYPE,
+        recompiling it only if the phrases changed.
+
+        Arguments:
+            vocabulary_name -- the name of the vocabulary
+            phrases -- a list of phrases the vocabulary should contain
+        """
+        vocabulary = cls.VOCABULARY_TYPE(vocabulary_name,
+                                         path=jasperpath.config(
+                                             'vocabularies'))
+        if not vocabulary.matches_phrases(phrases):
+            vocabulary.compile(phrases)
+        return vocabulary
+
     @classmethod
     def get_instance(cls, vocabulary_name, phrases):
         config = cls.get_config()
         if cls.VOCABULARY_TYPE:
-            vocabulary = cls.VOCABULARY_TYPE(vocabulary_name,
-                                             path=jasperpath.config(
-                                                 'vocabularies'))
-            if not vocabulary.matches_phrases(phrases):
-                vocabulary.compile(phrases)
-            config['vocabulary'] = vocabulary
+            config['vocabulary'] = cls.get_vocabulary(vocabulary_name,
+                                                      phrases)
         instance = cls(**config)
         return instance
 
@@ -57,10 +446,53 @@ class AbstractSTTEngine(object):
     def is_available(cls):
         return True
 
+    def with_vocabulary(self, vocabulary_name, phrases):
+        """
+        Returns an engine that recognizes another vocabulary, e.g. for a
+        modal plugin. Engines that can switch vocabularies on a single
+        decoder override this to share the decoder and the acoustic model
+        with this instance; by default, a new instance is created.
+
+        Arguments:
+            vocabulary_name -- the name of the vocabulary
+            phrases -- a list of phrases the vocabulary should contain
+
+        Returns:
+            An STT engine instance
+        """
+        return self.get_instance(vocabulary_name, phrases)
+
     @abstractmethod
     def transcribe(self, fp):
         pass
 
+    def transcribe_pcm(self, audio):
+        """
+        Performs STT on raw PCM audio data. Engines that can handle raw
+        audio data directly should override this method, all others get the
+        audio data serialized to WAV.
+
+        Arguments:
+            audio -- an audio_utils.AudioData instance
+        """
+        with audio.open_wav() as f:
+            return self.transcribe(f)
+
+    def begin_stream(self, rate=16000, sample_width=2):
+        """
+        Starts a transcription of audio data that is still being recorded.
+        Only one stream per engine instance may be active at a time.
+
+        Arguments:
+            rate -- the sample rate of the audio data
+            sample_width -- the sample width of the audio data in bytes
+
+        Returns:
+            A TranscriptionStream instance
+        """
+        return TranscriptionStream(self, rate=rate,
+                                   sample_width=sample_width)
+
 
 class PocketSphinxSTT(AbstractSTTEngine):
     """
@@ -70,8 +502,14 @@ class PocketSphinxSTT(AbstractSTTEngine):
     SLUG = 'sphinx'
     VOCABULARY_TYPE = vocabcompiler.PocketsphinxVocabulary
 
+    # The base of pocketsphinx's log-domain scores (its -logbase default)
+    LOGBASE = 1.0001
+
+    # Frames per second (pocketsphinx's -frate default)
+    FRAME_RATE = 100
+
     def __init__(self, vocabulary, hmm_dir="/usr/local/share/" +
-                 "pocketsphinx/model/hmm/en_US/hub4wsj_sc_8k"):
+                 "pocketsphinx/model/hmm/en_US/hub4wsj_sc_8k", nbest_size=5):
 
         """
         Initiates the pocketsphinx instance.
@@ -79,9 +517,11 @@ class PocketSphinxSTT(AbstractSTTEngine):
         Arguments:
             vocabulary -- a PocketsphinxVocabulary instance
             hmm_dir -- the path of the Hidden Markov Model (HMM)
+            nbest_size -- the maximum number of hypotheses to return
         """
 
         self._logger = logging.getLogger(__name__)
+        self.nbest_size = nbest_size
 
         # quirky bug where first import doesn't work
         try:
@@ -92,6 +532,10 @@ class PocketSphinxSTT(AbstractSTTEngine):
         with tempfile.NamedTemporaryFile(prefix='psdecoder_',
                                          suffix='.log', delete=False) as f:
             self._logfile = f.name
+        # Set early, so that __del__ removes the logfile even if the decoder
+        # can't be created
+        self._owns_decoder = True
+        self._logfile_drainer = None
 
         self._logger.debug("Initializing PocketSphinx Decoder with hmm_dir " +
                            "'%s'", hmm_dir)
@@ -122,11 +566,40 @@ class PocketSphinxSTT(AbstractSTTEngine):
                                  "hmm_dir in your profile.",
                                  hmm_dir, ', '.join(missing_hmm_files))
 
-        self._decoder = ps.Decoder(hmm=hmm_dir, logfn=self._logfile,
-                                   **vocabulary.decoder_kwargs)
+        if hasattr(ps.Decoder, 'default_config'):
+            # The SWIG bindings (pocketsphinx 5prealpha and later) are
+            # configured through a Config object
+            decoder_config = ps.Decoder.default_config()
+            decoder_config.set_string('-hmm', hmm_dir)
+            decoder_config.set_string('-logfn', self._logfile)
+            for key, value in vocabulary.decoder_kwargs.items():
+                decoder_config.set_string('-%s' % key, value)
+            self._decoder = ps.Decoder(decoder_config)
+        else:
+            self._decoder = ps.Decoder(hmm=hmm_dir, logfn=self._logfile,
+                                       **vocabulary.decoder_kwargs)
+
+        # Decoders that support multiple searches can hold the language
+        # models of several vocabularies at once (see with_vocabulary())
+        if hasattr(self._decoder, 'set_search'):
+            self._search = self._decoder.get_search()
+        else:
+            self._search = None
+        self._searches = {}
+
+        # The decoder log is forwarded to our logger in the background so
+        # that reading it never delays a transcription
+        self._logfile_drainer = LogfileDrainer(self._logfile, self._logger)
+        self._logfile_drainer.start()
 
     def __del__(self):
-        os.remove(self._logfile)
+        # Copies made by with_vocabulary() share the decoder and its logfile
+        if not getattr(self, '_owns_decoder', False):
+            return
+        if self._logfile_drainer is not None:
+            self._logfile_drainer.stop()
+        if os.path.exists(self._logfile):
+            os.remove(self._logfile)
 
     @classmethod
     def get_config(cls):
@@ -143,6 +616,11 @@ class PocketSphinxSTT(AbstractSTTEngine):
                     config['hmm_dir'] = profile['pocketsphinx']['hmm_dir']
                 except KeyError:
                     pass
+                try:
+                    config['nbest_size'] = \
+                        profile['pocketsphinx']['nbest_size']
+                except KeyError:
+                    pass
 
         return config
 
@@ -159,20 +637,195 @@ class PocketSphinxSTT(AbstractSTTEngine):
         # FIXME: Can't use the Decoder.decode_raw() here, because
         # pocketsphinx segfaults with tempfile.SpooledTemporaryFile()
         data = fp.read()
+        return self._transcribe_data(data)
+
+    def transcribe_pcm(self, audio):
+        """
+        Performs STT on raw PCM audio data without serializing it first.
+
+        Arguments:
+            audio -- an audio_utils.AudioData instance
+        """
+        return self._transcribe_data(audio.data)
+
+    def with_vocabulary(self, vocabulary_name, phrases):
+        """
+        Adds the language model of another vocabulary to this instance's
+        decoder and returns an engine that decodes with it. The acoustic
+        model stays loaded only once and switching between the engines
+        costs nothing but a search switch. Falls back to a new instance if
+        the installed pocketsphinx version doesn't support multiple
+        searches.
+
+        Arguments:
+            vocabulary_name -- the name of the vocabulary
+            phrases -- a list of phrases the vocabulary should contain
+
+        Returns:
+            A PocketSphinxSTT instance
+        """
+        if self._search is None:
+            return super(PocketSphinxSTT, self).with_vocabulary(
+                vocabulary_name, phrases)
+        vocabulary = self.get_vocabulary(vocabulary_name, phrases)
+        if self._searches.get(vocabulary_name) != vocabulary.compiled_revision:
+            self._logger.debug("Adding vocabulary '%s' to decoder",
+                               vocabulary_name)
+            self._add_words(vocabulary.decoder_kwargs['dict'])
+            self._decoder.set_lm_file(vocabulary_name,
+                                      vocabulary.decoder_kwargs['lm'])
+            self._searches[vocabulary_name] = vocabulary.compiled_revision
+        engine = copy.copy(self)
+        engine._search = vocabulary_name
+        engine._owns_decoder = False
+        return engine
+
+    def _add_words(self, dictionary_file):
+        """
+        Adds all words of a dictionary file that the decoder doesn't know
+        yet, so that the language models of all vocabularies can share the
+        decoder's dictionary.
+        """
+        entries = []
+        with open(dictionary_file, 'r') as f:
+            for line in f:
+                fields = line.split(None, 1)
+                if len(fields) == 2 and \
+                   self._decoder.lookup_word(fields[0]) is None:
+                    entries.append((fields[0], fields[1].strip()))
+        for i, (word, phones) in enumerate(entries):
+            # Updating the search structures once is enough
+            self._decoder.add_word(word, phones, i == len(entries) - 1)
+
+    def _start_utt(self):
+        if self._search is not None and \
+           self._decoder.get_search() != self._search:
+            self._decoder.set_search(self._search)
         self._decoder.start_utt()
+
+    def _get_hypstr(self):
+        if hasattr(self._decoder, 'hyp'):
+            hyp = self._decoder.hyp()
+            return hyp.hypstr if hyp is not None else ''
+        result = self._decoder.get_hyp()
+        return result[0] if result and result[0] else ''
+
+    def _transcribe_data(self, data):
+        self._start_utt()
         self._decoder.process_raw(data, False, True)
         self._decoder.end_utt()
+        return self._get_transcription()
 
-        result = self._decoder.get_hyp()
-        with open(self._logfile, 'r+') as f:
-            for line in f:
-                self._logger.debug(line.strip())
-            f.truncate()
+    def _get_transcription(self):
+        hypotheses = self._get_nbest()
+        if not hypotheses:
+            hypotheses = [Hypothesis(self._get_hypstr(),
+                                     self._get_posterior(),
+                                     self._get_words())]
+        self._logfile_drainer.drain()
 
-        transcribed = [result[0]]
+        transcribed = Transcription(hypotheses)
         self._logger.info('Transcribed: %r', transcribed)
         return transcribed
 
+    def _to_probability(self, score):
+        if hasattr(self._decoder, 'get_logmath'):
+            return self._decoder.get_logmath().exp(score)
+        return math.pow(self.LOGBASE, score)
+
+    def _get_posterior(self):
+        # The decoder API differs between pocketsphinx versions, so we only
+        # use what the installed version offers
+        if hasattr(self._decoder, 'hyp'):
+            hyp = self._decoder.hyp()
+            if hyp is None:
+                return None
+            prob = hyp.prob
+        elif hasattr(self._decoder, 'get_prob'):
+            prob = self._decoder.get_prob()
+            if isinstance(prob, tuple):
+                prob = prob[0]
+        else:
+            return None
+        return min(self._to_probability(prob), 1.0)
+
+    def _get_words(self):
+        if not hasattr(self._decoder, 'seg'):
+            return []
+        words = []
+        for seg in self._decoder.seg():
+            if seg.word in ('<s>', '</s>', '<sil>') or seg.word[0] in '[+':
+                continue
+            # Alternative pronunciations are marked as WORD(2)
+            words.append(Word(seg.word.split('(', 1)[0],
+                              seg.start_frame / float(self.FRAME_RATE),
+                              seg.end_frame / float(self.FRAME_RATE),
+                              min(self._to_probability(seg.prob), 1.0)))
+        return words
+
+    def _get_nbest(self):
+        """
+        Returns:
+            A list of up to nbest_size Hypothesis instances, whose
+            confidences are the path scores normalized over that list, or an
+            empty list if the decoder has no n-best API.
+        """
+        if not self.nbest_size or not hasattr(self._decoder, 'nbest'):
+            return []
+        results = []
+        for entry in self._decoder.nbest():
+            if entry.hypstr and entry.hypstr not in [x[0] for x in results]:
+                results.append((entry.hypstr, entry.score))
+            if len(results) >= self.nbest_size:
+                break
+        if not results:
+            return []
+        weights = [self._to_probability(score - results[0][1])
+                   for text, score in results]
+        hypotheses = [Hypothesis(text, weight / sum(weights), [])
+                      for (text, score), weight in zip(results, weights)]
+        # Word timings are only available for the best hypothesis
+        hypotheses[0] = hypotheses[0]._replace(words=self._get_words())
+        return hypotheses
+
+    class Stream(TranscriptionStream):
+        """
+        Feeds audio data into the decoder as soon as it arrives, so that
+        almost all decoding work is done once the utterance ends.
+        """
+
+        def __init__(self, engine, rate=16000, sample_width=2):
+            super(PocketSphinxSTT.Stream, self).__init__(
+                engine, rate=rate, sample_width=sample_width)
+            self._decoder = engine._decoder
+            engine._start_utt()
+
+        def feed(self, data):
+            self._decoder.process_raw(data, False, False)
+
+        def partial(self):
+            result = self.engine._get_hypstr()
+            return [result] if result else []
+
+        def finish(self):
+            self._decoder.end_utt()
+            return self.engine._get_transcription()
+
+    def begin_stream(self, rate=16000, sample_width=2):
+        """
+        Starts an incremental transcription of audio data that is still
+        being recorded.
+
+        Arguments:
+            rate -- the sample rate of the audio data
+            sample_width -- the sample width of the audio data in bytes
+
+        Returns:
+            A PocketSphinxSTT.Stream instance
+        """
+        return PocketSphinxSTT.Stream(self, rate=rate,
+                                      sample_width=sample_width)
+
     @classmethod
     def is_available(cls):
         return diagnose.check_python_import('pocketsphinx')
@@ -181,44 +834,53 @@ class PocketSphinxSTT(AbstractSTTEngine):
 class JuliusSTT(AbstractSTTEngine):
     """
     A very basic Speech-to-Text engine using Julius.
+
+    A single julius process is kept running in module mode. Audio data is
+    streamed to it via the adinnet protocol and the recognition results are
+    read from the module connection. The process is only restarted if it
+    died or if the vocabulary has been recompiled.
     """
 
     SLUG = 'julius'
     VOCABULARY_TYPE = vocabcompiler.JuliusVocabulary
 
+    # seconds to wait for julius to load its models and accept connections
+    STARTUP_TIMEOUT = 30
+
+    # seconds to wait for a recognition result
+    RESULT_TIMEOUT = 30
+
+    SHYPO_PATTERN = re.compile(r'<SHYPO RANK="(\d+)"[^>]*>(.*?)</SHYPO>',
+                               re.DOTALL)
+    WORD_PATTERN = re.compile(r'<WHYPO WORD="([^"]*)"' +
+                              r'(?:[^>]*?CM="([-.\d]+)")?[^>]*>')
+
     def __init__(self, vocabulary=None, hmmdefs="/usr/share/voxforge/julius/" +
                  "acoustic_model_files/hmmdefs", tiedlist="/usr/share/" +
-                 "voxforge/julius/acoustic_model_files/tiedlist"):
+                 "voxforge/julius/acoustic_model_files/tiedlist",
+                 nbest_size=5):
         self._logger = logging.getLogger(__name__)
         self._vocabulary = vocabulary
         self._hmmdefs = hmmdefs
         self._tiedlist = tiedlist
-        self._pattern = re.compile(r'sentence(\d+): <s> (.+) </s>')
+        self.nbest_size = nbest_size
+        self._process = None
+        self._module_sock = None
+        self._module_file = None
+        self._adinnet_sock = None
+        self._vocabulary_mtime = None
+
+        # Start the server once and check that it is working, so that
+        # errors/warnings are logged at startup
+        self._start_server()
+        if not self.is_running():
+            self._logger.error('Julius server is not running, check the ' +
+                               'log messages above for errors.')
 
-        # Inital test run: we run this command once to log errors/warnings
-        cmd = ['julius',
-               '-input', 'stdin',
-               '-dfa', self._vocabulary.dfa_file,
-               '-v', self._vocabulary.dict_file,
-               '-h', self._hmmdefs,
-               '-hlist', self._tiedlist,
-               '-forcedict']
-        cmd = [str(x) for x in cmd]
-        self._logger.debug('Executing: %r', cmd)
-        with tempfile.SpooledTemporaryFile() as out_f:
-            with tempfile.SpooledTemporaryFile() as f:
-                with tempfile.SpooledTemporaryFile() as err_f:
-                    subprocess.call(cmd, stdin=f, stdout=out_f, stderr=err_f)
-            out_f.seek(0)
-            for line in out_f.read().splitlines():
-                line = line.strip()
-                if len(line) > 7 and line[:7].upper() == 'ERROR: ':
-                    if not line[7:].startswith('adin_'):
-                        self._logger.error(line[7:])
-                elif len(line) > 9 and line[:9].upper() == 'WARNING: ':
-                    self._logger.warning(line[9:])
-                elif len(line) > 6 and line[:6].upper() == 'STAT: ':
-                    self._logger.debug(line[6:])
+    def __del__(self):
+        # The server attributes are missing if __init__ failed early
+        if getattr(self, '_process', None) is not None:
+            self._stop_server()
 
     @classmethod
     def get_config(cls):
@@ -236,34 +898,242 @@ class JuliusSTT(AbstractSTTEngine):
                         config['hmmdefs'] = profile['julius']['hmmdefs']
                     if 'tiedlist' in profile['julius']:
                         config['tiedlist'] = profile['julius']['tiedlist']
+                    if 'nbest_size' in profile['julius']:
+                        config['nbest_size'] = profile['julius']['nbest_size']
         return config
 
-    def transcribe(self, fp, mode=None):
+    @staticmethod
+    def _get_free_port():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+        finally:
+            sock.close()
+
+    def _get_vocabulary_mtime(self):
+        try:
+            return (os.path.getmtime(self._vocabulary.dfa_file),
+                    os.path.getmtime(self._vocabulary.dict_file))
+        except OSError:
+            return None
+
+    def _connect(self, port):
+        timeout = time.time() + self.STARTUP_TIMEOUT
+        while True:
+            if self._process.poll() is not None:
+                raise IOError('julius exited with return code %d' %
+                              self._process.returncode)
+            try:
+                return socket.create_connection(('127.0.0.1', port), 1)
+            except socket.error:
+                if time.time() > timeout:
+                    raise
+                time.sleep(0.1)
+
+    def _log_output(self, stream):
+        for line in iter(stream.readline, ''):
+            line = line.strip()
+            if len(line) > 7 and line[:7].upper() == 'ERROR: ':
+                if not line[7:].startswith('adin_'):
+                    self._logger.error(line[7:])
+            elif len(line) > 9 and line[:9].upper() == 'WARNING: ':
+                self._logger.warning(line[9:])
+            elif len(line) > 6 and line[:6].upper() == 'STAT: ':
+                self._logger.debug(line[6:])
+        stream.close()
+
+    def _start_server(self):
+        self._stop_server()
+        module_port = self._get_free_port()
+        adinnet_port = self._get_free_port()
         cmd = ['julius',
-               '-quiet',
-               '-nolog',
-               '-input', 'stdin',
+               '-input', 'adinnet',
+               '-adport', adinnet_port,
+               '-module', module_port,
+               '-nocutsilence',
                '-dfa', self._vocabulary.dfa_file,
                '-v', self._vocabulary.dict_file,
                '-h', self._hmmdefs,
                '-hlist', self._tiedlist,
+               '-output', max(self.nbest_size, 1),
                '-forcedict']
         cmd = [str(x) for x in cmd]
         self._logger.debug('Executing: %r', cmd)
-        with tempfile.SpooledTemporaryFile() as out_f:
-            with tempfile.SpooledTemporaryFile() as err_f:
-                subprocess.call(cmd, stdin=fp, stdout=out_f, stderr=err_f)
-            out_f.seek(0)
-            results = [(int(i), text) for i, text in
-                       self._pattern.findall(out_f.read())]
-        transcribed = [text for i, text in
-                       sorted(results, key=lambda x: x[0])
-                       if text]
+        self._vocabulary_mtime = self._get_vocabulary_mtime()
+        try:
+            self._process = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                             stderr=subprocess.STDOUT)
+        except OSError:
+            self._logger.error('Cannot execute julius.', exc_info=True)
+            self._process = None
+            return
+        output_thread = threading.Thread(target=self._log_output,
+                                         args=(self._process.stdout,),
+                                         name='JuliusOutput')
+        output_thread.daemon = True
+        output_thread.start()
+        try:
+            # julius waits for a module client before it opens the audio
+            # input
+            self._module_sock = self._connect(module_port)
+            self._module_sock.settimeout(self.RESULT_TIMEOUT)
+            self._module_file = self._module_sock.makefile('r')
+            self._adinnet_sock = self._connect(adinnet_port)
+        except (IOError, socket.error):
+            self._logger.error('Cannot connect to julius server.',
+                               exc_info=True)
+            self._stop_server()
+
+    def _stop_server(self):
+        for obj in (self._adinnet_sock, self._module_file,
+                    self._module_sock):
+            if obj is not None:
+                try:
+                    obj.close()
+                except (IOError, socket.error):
+                    pass
+        self._adinnet_sock = None
+        self._module_file = None
+        self._module_sock = None
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            self._process.wait()
+        self._process = None
+
+    def is_running(self):
+        """
+        Checks if the julius server is running and connected.
+
+        Returns:
+            True or False
+        """
+        return (self._process is not None and
+                self._process.poll() is None and
+                self._adinnet_sock is not None)
+
+    def _ensure_server(self):
+        if self._get_vocabulary_mtime() != self._vocabulary_mtime:
+            self._logger.info('Vocabulary has changed, restarting julius.')
+            self._start_server()
+        elif not self.is_running():
+            self._logger.warning('Julius server is not running, ' +
+                                 'restarting it.')
+            self._start_server()
+        return self.is_running()
+
+    def _send_audio(self, data):
+        # adinnet packets: the data length as 4 byte integer followed by the
+        # data, an empty packet marks the end of a segment
+        self._adinnet_sock.sendall(struct.pack('<i', len(data)) + data)
+
+    def _read_result(self):
+        lines = []
+        while True:
+            line = self._module_file.readline()
+            if not line:
+                raise IOError('Connection to julius server closed.')
+            line = line.rstrip()
+            if line != '.':
+                lines.append(line)
+                continue
+            message = '\n'.join(lines)
+            lines = []
+            if '<RECOGOUT>' in message:
+                return self._parse_result(message)
+            elif '<RECOGFAIL' in message or '<REJECTED' in message:
+                return Transcription()
+
+    def _parse_result(self, message):
+        results = []
+        for rank, shypo in self.SHYPO_PATTERN.findall(message):
+            # julius reports a confidence measure (CM) for every word, the
+            # confidence of the sentence is their average
+            words = [Word(word, None, None, float(cm) if cm else None)
+                     for word, cm in self.WORD_PATTERN.findall(shypo)
+                     if word not in ('<s>', '</s>')]
+            scores = [word.confidence for word in words
+                      if word.confidence is not None]
+            confidence = sum(scores) / len(scores) if scores else None
+            text = ' '.join(word.text for word in words)
+            if text:
+                results.append((int(rank), Hypothesis(text, confidence,
+                                                      words)))
+        return Transcription(hypothesis for rank, hypothesis
+                             in sorted(results, key=lambda x: x[0]))
+
+    def _finish(self):
+        try:
+            self._send_audio('')
+            transcribed = self._read_result()
+        except (IOError, socket.error):
+            self._logger.error('Communication with julius server failed.',
+                               exc_info=True)
+            self._stop_server()
+            transcribed = []
         if not transcribed:
-            transcribed.append('')
+            transcribed = Transcription.from_texts([''])
         self._logger.info('Transcribed: %r', transcribed)
         return transcribed
 
+    def transcribe(self, fp, mode=None):
+        return self.transcribe_pcm(AudioData.from_wav(fp))
+
+    def transcribe_pcm(self, audio):
+        """
+        Performs STT by streaming raw PCM audio data to the julius server.
+
+        Arguments:
+            audio -- an audio_utils.AudioData instance
+        """
+        stream = self.begin_stream(audio.rate, audio.sample_width)
+        stream.feed(audio.data)
+        return stream.finish()
+
+    class Stream(TranscriptionStream):
+        """
+        Sends audio data to the julius server as soon as it arrives.
+        """
+
+        def __init__(self, engine, rate=16000, sample_width=2):
+            super(JuliusSTT.Stream, self).__init__(
+                engine, rate=rate, sample_width=sample_width)
+            self._running = engine._ensure_server()
+
+        def feed(self, data):
+            if not self._running:
+                return
+            try:
+                for i in range(0, len(data), 4096):
+                    self.engine._send_audio(data[i:i + 4096])
+            except (IOError, socket.error):
+                self.engine._logger.error('Sending audio to julius server ' +
+                                          'failed.', exc_info=True)
+                self.engine._stop_server()
+                self._running = False
+
+        def partial(self):
+            return []
+
+        def finish(self):
+            if not self._running:
+                return Transcription.from_texts([''])
+            return self.engine._finish()
+
+    def begin_stream(self, rate=16000, sample_width=2):
+        """
+        Starts streaming audio data to the julius server while it is still
+        being recorded.
+
+        Arguments:
+            rate -- the sample rate of the audio data
+            sample_width -- the sample width of the audio data in bytes
+
+        Returns:
+            A JuliusSTT.Stream instance
+        """
+        return JuliusSTT.Stream(self, rate=rate, sample_width=sample_width)
+
     @classmethod
     def is_available(cls):
         return diagnose.check_executable('julius')
@@ -296,24 +1166,40 @@ class GoogleSTT(AbstractSTTEngine):
         stt_engine: google
         keys:
             GOOGLE_SPEECH: $YOUR_KEY_HERE
+        google-stt:
+            compression: flac  # optional, requires flac to be installed
 
     """
 
     SLUG = 'google'
 
-    def __init__(self, api_key=None, language='en-us'):
+    API_URL = 'https://www.google.com/speech-api/v2/recognize'
+
+    def __init__(self, api_key=None, language='en-us', compression=None):
         # FIXME: get init args from config
         """
         Arguments:
         api_key - the public api key which allows access to Google APIs
+        language - the language of the speech
+        compression - None to upload raw PCM audio data or 'flac' to
+                      compress it before uploading (requires flac)
         """
         self._logger = logging.getLogger(__name__)
         self._request_url = None
         self._language = None
         self._api_key = None
-        self._http = requests.Session()
+        self._api_url = None
+        self._http = http_pool.get_session()
+        self.api_url = self.API_URL
         self.language = language
         self.api_key = api_key
+        if compression == 'flac' and not diagnose.check_executable('flac'):
+            self._logger.warning('flac not found, audio data will be ' +
+                                 'uploaded uncompressed.')
+            compression = None
+        elif compression not in (None, 'flac'):
+            raise ValueError("Unsupported compression '%s'" % compression)
+        self.compression = compression
 
     @property
     def request_url(self):
@@ -328,6 +1214,15 @@ class GoogleSTT(AbstractSTTEngine):
         self._language = value
         self._regenerate_request_url()
 
+    @property
+    def api_url(self):
+        return self._api_url
+
+    @api_url.setter
+    def api_url(self, value):
+        self._api_url = value
+        self._regenerate_request_url()
+
     @property
     def api_key(self):
         return self._api_key
@@ -338,16 +1233,14 @@ class GoogleSTT(AbstractSTTEngine):
         self._regenerate_request_url()
 
     def _regenerate_request_url(self):
-        if self.api_key and self.language:
+        if self.api_url and self.api_key and self.language:
             query = urllib.urlencode({'output': 'json',
                                       'client': 'chromium',
                                       'key': self.api_key,
                                       'lang': self.language,
                                       'maxresults': 6,
                                       'pfilter': 2})
-            self._request_url = urlparse.urlunparse(
-                ('https', 'www.google.com', '/speech-api/v2/recognize', '',
-                 query, ''))
+            self._request_url = '%s?%s' % (self.api_url, query)
         else:
             self._request_url = None
 
@@ -363,6 +1256,10 @@ class GoogleSTT(AbstractSTTEngine):
                 profile = yaml.safe_load(f)
                 if 'keys' in profile and 'GOOGLE_SPEECH' in profile['keys']:
                     config['api_key'] = profile['keys']['GOOGLE_SPEECH']
+                if ('google-stt' in profile and
+                   'compression' in profile['google-stt']):
+                    config['compression'] = \
+                        profile['google-stt']['compression']
         return config
 
     def transcribe(self, fp):
@@ -374,6 +1271,54 @@ class GoogleSTT(AbstractSTTEngine):
         audio_file_path -- the path to the .wav file to be transcribed
         """
 
+        wav = wave.open(fp, 'rb')
+        frame_rate = wav.getframerate()
+        wav.close()
+        data = fp.read()
+        return self._transcribe_data(data, frame_rate)
+
+    def transcribe_pcm(self, audio):
+        """
+        Performs STT via the Google Speech API on raw PCM audio data, which
+        is sent without serializing it to WAV first.
+
+        Arguments:
+        audio -- an audio_utils.AudioData instance
+        """
+        if self.compression == 'flac':
+            try:
+                data = audio.encode_flac()
+            except (OSError, IOError):
+                self._logger.warning('Compressing audio data failed, ' +
+                                     'uploading it uncompressed.',
+                                     exc_info=True)
+            else:
+                content_type = 'audio/x-flac; rate=%s' % audio.rate
+                return self._transcribe_data(data, audio.rate,
+                                             content_type=content_type)
+        return self._transcribe_data(audio.data, audio.rate)
+
+    def begin_stream(self, rate=16000, sample_width=2):
+        """
+        Starts uploading audio data that is still being recorded. The audio
+        data is sent uncompressed, so if compression is enabled, it is
+        collected and compressed once the stream is finished instead.
+
+        Arguments:
+            rate -- the sample rate of the audio data
+            sample_width -- the sample width of the audio data in bytes
+
+        Returns:
+            A TranscriptionStream instance
+        """
+        if self.compression:
+            return super(GoogleSTT, self).begin_stream(
+                rate=rate, sample_width=sample_width)
+        return ChunkedUploadStream(
+            self, lambda chunks: self._transcribe_data(chunks, rate),
+            rate=rate, sample_width=sample_width)
+
+    def _transcribe_data(self, data, frame_rate, content_type=None):
         if not self.api_key:
             self._logger.critical('API key missing, transcription request ' +
                                   'aborted.')
@@ -383,13 +1328,14 @@ class GoogleSTT(AbstractSTTEngine):
                                   'request aborted.')
             return []
 
-        wav = wave.open(fp, 'rb')
-        frame_rate = wav.getframerate()
-        wav.close()
-        data = fp.read()
-
-        headers = {'content-type': 'audio/l16; rate=%s' % frame_rate}
-        r = self._http.post(self.request_url, data=data, headers=headers)
+        if content_type is None:
+            content_type = 'audio/l16; rate=%s' % frame_rate
+        headers = {'content-type': content_type}
+        try:
+            r = self._http.post(self.request_url, data=data, headers=headers)
+        except requests.exceptions.RequestException:
+            self._logger.critical('Request failed.', exc_info=True)
+            return []
         try:
             r.raise_for_status()
         except requests.exceptions.HTTPError:
@@ -408,7 +1354,8 @@ class GoogleSTT(AbstractSTTEngine):
             if len(response['result']) == 0:
                 # Response result is empty
                 raise ValueError('Nothing has been transcribed.')
-            results = [alt['transcript'] for alt
+            # Only the first alternative comes with a confidence
+            results = [(alt['transcript'], alt.get('confidence')) for alt
                        in response['result'][0]['alternative']]
         except ValueError as e:
             self._logger.warning('Empty response: %s', e.args[0])
@@ -418,7 +1365,8 @@ class GoogleSTT(AbstractSTTEngine):
             results = []
         else:
             # Convert all results to uppercase
-            results = tuple(result.upper() for result in results)
+            results = Transcription(Hypothesis(text.upper(), confidence, [])
+                                    for text, confidence in results)
             self._logger.info('Transcribed: %r', results)
         return results
 
@@ -444,11 +1392,29 @@ class AttSTT(AbstractSTTEngine):
 
     SLUG = "att"
 
-    def __init__(self, app_key, app_secret):
+    API_URL = 'https://api.att.com/speech/v3/speechToText'
+    TOKEN_URL = 'https://api.att.com/oauth/v4/token'
+
+    def __init__(self, app_key, app_secret, api_url=API_URL,
+                 token_url=TOKEN_URL):
         self._logger = logging.getLogger(__name__)
-        self._token = None
+        self._http = http_pool.get_session()
         self.app_key = app_key
         self.app_secret = app_secret
+        self.api_url = api_url
+        payload = {'client_id': self.app_key,
+                   'client_secret': self.app_secret,
+                   'scope': 'SPEECH',
+                   'grant_type': 'client_credentials'}
+        self._token_manager = OAuthTokenManager(self._http, token_url,
+                                                payload)
+        # Warm up the token so that the first utterance doesn't have to wait
+        self._token_manager.start()
+
+    def __del__(self):
+        # The token manager is missing if __init__ failed early
+        if getattr(self, '_token_manager', None) is not None:
+            self._token_manager.stop()
 
     @classmethod
     def get_config(cls):
@@ -468,29 +1434,36 @@ class AttSTT(AbstractSTTEngine):
 
     @property
     def token(self):
-        if not self._token:
-            headers = {'content-type': 'application/x-www-form-urlencoded',
-                       'accept': 'application/json'}
-            payload = {'client_id': self.app_key,
-                       'client_secret': self.app_secret,
-                       'scope': 'SPEECH',
-                       'grant_type': 'client_credentials'}
-            r = requests.post('https://api.att.com/oauth/v4/token',
-                              data=payload,
-                              headers=headers)
-            self._token = r.json()['access_token']
-        return self._token
+        return self._token_manager.get()
 
     def transcribe(self, fp):
-        data = fp.read()
-        r = self._get_response(data)
-        if r.status_code == requests.codes['unauthorized']:
-            # Request token invalid, retry once with a new token
-            self._logger.warning('OAuth access token invalid, generating a ' +
-                                 'new one and retrying...')
-            self._token = None
-            r = self._get_response(data)
+        return self._transcribe_data(fp.read(), 'audio/wav')
+
+    def begin_stream(self, rate=16000, sample_width=2):
+        """
+        Starts uploading audio data that is still being recorded.
+
+        Arguments:
+            rate -- the sample rate of the audio data
+            sample_width -- the sample width of the audio data in bytes
+
+        Returns:
+            A ChunkedUploadStream instance
+        """
+        content_type = 'audio/raw;coding=linear;rate=%d;byteorder=LE' % rate
+        return ChunkedUploadStream(
+            self, lambda chunks: self._transcribe_data(chunks, content_type),
+            rate=rate, sample_width=sample_width)
+
+    def _transcribe_data(self, data, content_type):
         try:
+            r = self._get_response(data, content_type)
+            if r.status_code == requests.codes['unauthorized']:
+                # Request token invalid. We don't upload the audio data
+                # again, but make sure that the next request has a new token
+                self._logger.warning('OAuth access token invalid, ' +
+                                     'generating a new one...')
+                self._token_manager.invalidate()
             r.raise_for_status()
         except requests.exceptions.HTTPError:
             self._logger.critical('Request failed with response: %r',
@@ -505,7 +1478,12 @@ class AttSTT(AbstractSTTEngine):
                 recognition = r.json()['Recognition']
                 if recognition['Status'] != 'OK':
                     raise ValueError(recognition['Status'])
-                results = [(x['Hypothesis'], x['Confidence'])
+                results = [Hypothesis(x['Hypothesis'].upper(),
+                                      x['Confidence'],
+                                      [Word(word.upper(), None, None, score)
+                                       for word, score in
+                                       zip(x.get('Words', []),
+                                           x.get('WordScores', []))])
                            for x in recognition['NBest']]
             except ValueError as e:
                 self._logger.debug('Recognition failed with status: %s',
@@ -516,19 +1494,17 @@ class AttSTT(AbstractSTTEngine):
                                       exc_info=True)
                 return []
             else:
-                transcribed = [x[0].upper() for x in sorted(results,
-                                                            key=lambda x: x[1],
-                                                            reverse=True)]
+                transcribed = Transcription(sorted(results,
+                                                   key=lambda x: x.confidence,
+                                                   reverse=True))
                 self._logger.info('Transcribed: %r', transcribed)
                 return transcribed
 
-    def _get_response(self, data):
+    def _get_response(self, data, content_type='audio/wav'):
         headers = {'authorization': 'Bearer %s' % self.token,
                    'accept': 'application/json',
-                   'content-type': 'audio/wav'}
-        return requests.post('https://api.att.com/speech/v3/speechToText',
-                             data=data,
-                             headers=headers)
+                   'content-type': content_type}
+        return self._http.post(self.api_url, data=data, headers=headers)
 
     @classmethod
     def is_available(cls):
@@ -551,8 +1527,12 @@ class WitAiSTT(AbstractSTTEngine):
 
     SLUG = "witai"
 
-    def __init__(self, access_token):
+    API_URL = 'https://api.wit.ai/speech?v=20150101'
+
+    def __init__(self, access_token, api_url=API_URL):
         self._logger = logging.getLogger(__name__)
+        self._http = http_pool.get_session()
+        self.api_url = api_url
         self.token = access_token
 
     @classmethod
@@ -586,11 +1566,30 @@ class WitAiSTT(AbstractSTTEngine):
         return self._headers
 
     def transcribe(self, fp):
-        data = fp.read()
-        r = requests.post('https://api.wit.ai/speech?v=20150101',
-                          data=data,
-                          headers=self.headers)
+        return self._transcribe_data(fp.read(), self.headers)
+
+    def begin_stream(self, rate=16000, sample_width=2):
+        """
+        Starts uploading audio data that is still being recorded.
+
+        Arguments:
+            rate -- the sample rate of the audio data
+            sample_width -- the sample width of the audio data in bytes
+
+        Returns:
+            A ChunkedUploadStream instance
+        """
+        headers = dict(self.headers)
+        headers['Content-Type'] = ('audio/raw;encoding=signed-integer;' +
+                                   'bits=%d;rate=%d;endian=little' %
+                                   (sample_width * 8, rate))
+        return ChunkedUploadStream(
+            self, lambda chunks: self._transcribe_data(chunks, headers),
+            rate=rate, sample_width=sample_width)
+
+    def _transcribe_data(self, data, headers):
         try:
+            r = self._http.post(self.api_url, data=data, headers=headers)
             r.raise_for_status()
             text = r.json()['_text']
         except requests.exceptions.HTTPError:
@@ -610,9 +1609,8 @@ class WitAiSTT(AbstractSTTEngine):
                                   exc_info=True)
             return []
         else:
-            transcribed = []
-            if text:
-                transcribed.append(text.upper())
+            transcribed = Transcription.from_texts([text.upper()] if text
+                                                   else [])
             self._logger.info('Transcribed: %r', transcribed)
             return transcribed
 
@@ -621,6 +1619,655 @@ class WitAiSTT(AbstractSTTEngine):
         return diagnose.check_network_connection()
 
 
+class AbstractCompositeSTTEngine(AbstractSTTEngine):
+    """
+    Generic parent class for STT engines that delegate every utterance to
+    several other engines running on a thread pool.
+
+    The engines are listed by slug in the 'engines' key of the profile.yml
+    section named CONFIG_SECTION.
+    """
+
+    CONFIG_SECTION = None
+    CONFIG_KEYS = ()
+
+    def __init__(self, engines):
+        """
+        Arguments:
+        engines -- a list of STT engine instances
+        """
+        self._logger = logging.getLogger(__name__)
+        self.engines = engines
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(len(engines), 1))
+        self._running = {}
+
+    @classmethod
+    def get_config(cls):
+        # FIXME: Replace this as soon as we have a config module
+        config = {}
+        # Try to get the engines and their settings from config
+        profile_path = jasperpath.config('profile.yml')
+        if os.path.exists(profile_path):
+            with open(profile_path, 'r') as f:
+                profile = yaml.safe_load(f)
+                if cls.CONFIG_SECTION in profile:
+                    for key in ('engines',) + cls.CONFIG_KEYS:
+                        if key in profile[cls.CONFIG_SECTION]:
+                            config[key] = profile[cls.CONFIG_SECTION][key]
+        return config
+
+    @classmethod
+    def get_engine_slugs(cls, config):
+        return config.pop('engines', [])
+
+    @classmethod
+    def get_instance(cls, vocabulary_name, phrases):
+        config = cls.get_config()
+        engines = []
+        for slug in cls.get_engine_slugs(config):
+            if slug == cls.SLUG:
+                raise ValueError(("STT engine '%s' cannot delegate to " +
+                                  "itself") % slug)
+            try:
+                engine_class = get_engine_by_slug(slug)
+            except ValueError as e:
+                logging.getLogger(__name__).warning('Skipping STT ' +
+                                                    'engine: %s', e)
+                continue
+            engines.append(engine_class.get_instance(vocabulary_name,
+                                                     phrases))
+        if not engines:
+            raise ValueError("No STT engines for '%s' configured" % cls.SLUG)
+        return cls(engines, **config)
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    @staticmethod
+    def _join_frames(audio):
+        # The engines read the audio data concurrently, so the frames are
+        # joined once up front instead of lazily by whichever engine is first
+        return AudioData(audio.data, rate=audio.rate,
+                         sample_width=audio.sample_width,
+                         channels=audio.channels)
+
+    def is_usable(self, engine):
+        """
+        Arguments:
+        engine -- one of the engines of this instance
+
+        Returns True if the engine may be used for the next utterance
+        """
+        # An engine that is still busy with an earlier utterance (because it
+        # missed its deadline) can't be used concurrently, so it sits out
+        future = self._running.get(engine)
+        if future is not None and not future.done():
+            self._logger.warning('STT engine %r is still busy, skipping it.',
+                                 engine)
+            return False
+        return True
+
+    def get_usable_engines(self):
+        return [engine for engine in self.engines if self.is_usable(engine)]
+
+    def submit(self, engine, task):
+        """
+        Runs a task that uses an engine on the thread pool.
+
+        Arguments:
+        engine -- the engine used by the task
+        task -- a function that returns a transcription
+
+        Returns a concurrent.futures.Future instance
+        """
+        future = self._executor.submit(task)
+        self._running[engine] = future
+        return future
+
+    def transcribe(self, fp):
+        return self.transcribe_pcm(AudioData.from_wav(fp))
+
+    class Stream(TranscriptionStream):
+        """
+        Feeds the audio data into a stream of every usable engine and
+        hands the streams over to the composite engine once the utterance
+        is finished.
+        """
+
+        def __init__(self, engine, rate=16000, sample_width=2):
+            super(AbstractCompositeSTTEngine.Stream, self).__init__(
+                engine, rate=rate, sample_width=sample_width)
+            self._streams = [(e, e.begin_stream(rate=rate,
+                                                sample_width=sample_width))
+                             for e in engine.get_usable_engines()]
+
+        def feed(self, data):
+            for e, stream in self._streams:
+                stream.feed(data)
+
+        def partial(self):
+            for e, stream in self._streams:
+                transcribed = stream.partial()
+                if transcribed:
+                    return transcribed
+            return []
+
+        def finish(self):
+            return self.engine.finish_streams(self._streams)
+
+    def begin_stream(self, rate=16000, sample_width=2):
+        """
+        Starts transcriptions of audio data that is still being recorded
+        on all usable engines.
+
+        Arguments:
+            rate -- the sample rate of the audio data
+            sample_width -- the sample width of the audio data in bytes
+
+        Returns:
+            An AbstractCompositeSTTEngine.Stream instance
+        """
+        return AbstractCompositeSTTEngine.Stream(self, rate=rate,
+                                                 sample_width=sample_width)
+
+    @abstractmethod
+    def transcribe_pcm(self, audio):
+        pass
+
+    @abstractmethod
+    def finish_streams(self, streams):
+        """
+        Finishes the streams of the engines and picks a transcription.
+
+        Arguments:
+        streams -- a list of (engine, stream) tuples
+
+        Returns the transcription
+        """
+        pass
+
+
+class RacingSTT(AbstractCompositeSTTEngine):
+    """
+    Dispatches every utterance to several STT engines at once and returns
+    the first result that is confident enough, so that Jasper answers with
+    the latency of the fastest engine and still works if a web service is
+    down.
+
+    The confidence of a result is the one reported by the engine, capped by
+    the confidence configured for the engine (Default: 1.0). Engines that
+    don't report confidences get the configured one, i.e. by default their
+    first non-empty result wins. Capping matters for engines like
+    PocketSphinx, whose confidences only rank their hypotheses against each
+    other and are 1.0 whenever there is a single distinct one. If no result
+    clears the threshold before the deadline, the one with the highest
+    confidence so far is returned.
+
+    Excerpt from sample profile.yml:
+
+        ...
+        stt_engine: race
+        race-stt:
+            engines:
+                - google
+                - sphinx
+            threshold: 0.8
+            deadline: 5
+            confidence:
+                sphinx: 0.6
+    """
+
+    SLUG = 'race'
+
+    CONFIG_SECTION = 'race-stt'
+    CONFIG_KEYS = ('threshold', 'deadline', 'confidence')
+
+    DEFAULT_CONFIDENCE = 1.0
+
+    def __init__(self, engines, threshold=0.8, deadline=5, confidence=None):
+        """
+        Arguments:
+        engines -- a list of STT engine instances
+        threshold -- the confidence a result needs to be returned before
+                     the other engines have finished
+        deadline -- seconds to wait for a confident result
+        confidence -- a dict that maps engine slugs to the confidence of
+                      their results that don't have one and to the maximum
+                      confidence of those that do
+        """
+        super(RacingSTT, self).__init__(engines)
+        self.threshold = threshold
+        self.deadline = deadline
+        self.confidence = confidence if confidence else {}
+
+    def get_confidence(self, engine, transcribed):
+        configured = self.confidence.get(getattr(engine, 'SLUG', None),
+                                         self.DEFAULT_CONFIDENCE)
+        reported = getattr(transcribed, 'confidence', None)
+        if reported is None:
+            return configured
+        return min(reported, configured)
+
+    def _race(self, tasks):
+        """
+        Runs the tasks concurrently and picks the winning result.
+
+        Arguments:
+        tasks -- a list of (engine, function) tuples, where each function
+                 returns the transcription of that engine
+
+        Returns:
+        The first transcription that clears the threshold or the most
+        confident one available at the deadline
+        """
+        futures = dict((self.submit(engine, task), engine)
+                       for engine, task in tasks)
+        deadline = time.time() + self.deadline
+        best = None
+        pending = set(futures)
+        while pending:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            done, pending = concurrent.futures.wait(
+                pending, timeout=timeout,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                engine = futures[future]
+                try:
+                    transcribed = future.result()
+                except Exception:
+                    self._logger.error('STT engine %r failed.', engine,
+                                       exc_info=True)
+                    continue
+                if not transcribed:
+                    continue
+                confidence = self.get_confidence(engine, transcribed)
+                if confidence >= self.threshold:
+                    best = (confidence, engine, transcribed)
+                    pending.clear()
+                    break
+                if best is None or confidence > best[0]:
+                    best = (confidence, engine, transcribed)
+        for future in futures:
+            # Running engines can't be interrupted, their results are
+            # simply ignored
+            future.cancel()
+        if best is None:
+            return []
+        self._logger.debug('STT engine %r won with confidence %s', best[1],
+                           best[0])
+        return best[2]
+
+    def transcribe_pcm(self, audio):
+        audio = self._join_frames(audio)
+        return self._race([(engine, lambda e=engine: e.transcribe_pcm(audio))
+                           for engine in self.get_usable_engines()])
+
+    def finish_streams(self, streams):
+        return self._race([(e, stream.finish) for e, stream in streams])
+
+
+class FallbackSTT(AbstractCompositeSTTEngine):
+    """
+    Tries a list of STT engines in order until one of them transcribes the
+    utterance. Each engine gets a deadline per call, so that a slow web
+    service can't make Jasper wait indefinitely, and engines that failed
+    repeatedly are skipped for a while by a circuit breaker.
+
+    Timeouts and exceptions count as failures. An empty transcription is
+    passed on to the next engine, but doesn't count as failure as nothing
+    might have been said. PocketSphinx is appended to the list as last
+    resort if it isn't listed already.
+
+    Audio data that is streamed while it is recorded only goes to the first
+    usable engine. The other engines get the recorded audio data only if
+    they are needed, so that web services aren't queried for nothing.
+
+    Excerpt from sample profile.yml:
+
+        ...
+        stt_engine: fallback
+        fallback-stt:
+            engines:
+                - google
+                - witai
+            deadline: 4
+            failure_threshold: 3
+            cooldown: 60
+    """
+
+    SLUG = 'fallback'
+
+    CONFIG_SECTION = 'fallback-stt'
+    CONFIG_KEYS = ('deadline', 'failure_threshold', 'cooldown')
+
+    def __init__(self, engines, deadline=5, failure_threshold=3, cooldown=60):
+        """
+        Arguments:
+        engines -- a list of STT engine instances, in order of preference
+        deadline -- seconds to wait for each engine
+        failure_threshold -- the number of consecutive failures after which
+                             an engine is skipped
+        cooldown -- seconds to skip an engine for
+        """
+        super(FallbackSTT, self).__init__(engines)
+        self.deadline = deadline
+        self._breakers = dict(
+            (engine, CircuitBreaker(repr(engine),
+                                    failure_threshold=failure_threshold,
+                                    cooldown=cooldown))
+            for engine in engines)
+
+    @classmethod
+    def get_engine_slugs(cls, config):
+        slugs = super(FallbackSTT, cls).get_engine_slugs(config)
+        if (PocketSphinxSTT.SLUG not in slugs and
+                PocketSphinxSTT.is_available()):
+            slugs.append(PocketSphinxSTT.SLUG)
+        return slugs
+
+    def is_usable(self, engine):
+        if not self._breakers[engine].allow():
+            self._logger.debug('Circuit breaker for STT engine %r is ' +
+                               'open, skipping it.', engine)
+            return False
+        return super(FallbackSTT, self).is_usable(engine)
+
+    def _get_result(self, engine, future, timeout):
+        """
+        Waits for the transcription of an engine and updates its circuit
+        breaker.
+
+        Returns the transcription or None if the engine failed
+        """
+        try:
+            transcribed = future.result(timeout=max(timeout, 0))
+        except concurrent.futures.TimeoutError:
+            self._logger.warning('STT engine %r missed its deadline.', engine)
+            future.cancel()
+        except Exception:
+            self._logger.error('STT engine %r failed.', engine, exc_info=True)
+        else:
+            self._breakers[engine].record_success()
+            return transcribed
+        self._breakers[engine].record_failure()
+        return None
+
+    def transcribe_pcm(self, audio):
+        return self._transcribe_in_order(self.get_usable_engines(), audio)
+
+    def _transcribe_in_order(self, engines, audio):
+        audio = self._join_frames(audio)
+        for engine in engines:
+            future = self.submit(engine,
+                                 lambda e=engine: e.transcribe_pcm(audio))
+            transcribed = self._get_result(engine, future, self.deadline)
+            if transcribed:
+                return transcribed
+        return []
+
+    def finish_streams(self, streams, fallback_engines=(), audio=None):
+        """
+        Finishes the streams in order and, if none of them returns a
+        transcription, transcribes the audio data with the fallback engines.
+
+        Arguments:
+        streams -- a list of (engine, stream) tuples
+        fallback_engines -- (optional) engines to try afterwards
+        audio -- (optional) the audio data fed into the streams
+
+        Returns the transcription
+        """
+        for engine, stream in streams:
+            future = self.submit(engine, stream.finish)
+            transcribed = self._get_result(engine, future, self.deadline)
+            if transcribed:
+                return transcribed
+        if audio is None:
+            return []
+        return self._transcribe_in_order(fallback_engines, audio)
+
+    class Stream(TranscriptionStream):
+        """
+        Feeds the audio data only into a stream of the first usable engine
+        and keeps it in memory, so that the other engines only get it if
+        that engine fails.
+        """
+
+        def __init__(self, engine, rate=16000, sample_width=2):
+            super(FallbackSTT.Stream, self).__init__(
+                engine, rate=rate, sample_width=sample_width)
+            engines = engine.get_usable_engines()
+            self._streams = [(e, e.begin_stream(rate=rate,
+                                                sample_width=sample_width))
+                             for e in engines[:1]]
+            self._fallback_engines = engines[1:]
+
+        def feed(self, data):
+            super(FallbackSTT.Stream, self).feed(data)
+            for e, stream in self._streams:
+                stream.feed(data)
+
+        def partial(self):
+            if not self._streams:
+                return []
+            return self._streams[0][1].partial()
+
+        def finish(self):
+            return self.engine.finish_streams(self._streams,
+                                              self._fallback_engines,
+                                              self.get_audio())
+
+    def begin_stream(self, rate=16000, sample_width=2):
+        """
+        Starts a transcription of audio data that is still being recorded
+        on the first usable engine.
+
+        Arguments:
+            rate -- the sample rate of the audio data
+            sample_width -- the sample width of the audio data in bytes
+
+        Returns:
+            A FallbackSTT.Stream instance
+        """
+        return FallbackSTT.Stream(self, rate=rate, sample_width=sample_width)
+
+
+class TranscriptionCache(object):
+    """
+    A thread-safe LRU cache for transcriptions with an optional time to
+    live, that counts its hits and misses.
+    """
+
+    def __init__(self, size=100, ttl=None):
+        """
+        Arguments:
+        size -- the maximum number of transcriptions to keep
+        ttl -- seconds after which a transcription expires (Default: never)
+        """
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(slug, revision, audio):
+        """
+        Arguments:
+        slug -- the slug of the engine
+        revision -- the revision of the vocabulary or None
+        audio -- an audio_utils.AudioData instance
+
+        Returns a key that identifies the transcription of audio
+        """
+        sha1 = hashlib.sha1()
+        sha1.update('%d:%d:%d:' % (audio.rate, audio.sample_width,
+                                   audio.channels))
+        sha1.update(audio.data)
+        return (slug, revision, sha1.hexdigest())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Returns the transcription stored for key or None
+        """
+        with self._lock:
+            try:
+                timestamp, transcribed = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            if self.ttl is not None and time.time() - timestamp > self.ttl:
+                self.misses += 1
+                return None
+            # Re-insert to mark the entry as most recently used
+            self._entries[key] = (timestamp, transcribed)
+            self.hits += 1
+            return transcribed
+
+    def put(self, key, transcribed):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time(), transcribed)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+class CachedSTT(AbstractSTTEngine):
+    """
+    Keeps the transcriptions of another STT engine in an LRU cache, so that
+    replayed audio (e.g. the clips of regression tests and benchmarks) is
+    only transcribed once. Entries are keyed by the engine's slug, the
+    revision of the vocabulary and a hash of the audio data.
+
+    Empty transcriptions are not cached, as engines also return them on
+    temporary errors.
+
+    Excerpt from sample profile.yml:
+
+        ...
+        stt_engine: cached
+        cached-stt:
+            engine: sphinx
+            size: 100
+            ttl: 3600
+    """
+
+    SLUG = 'cached'
+
+    def __init__(self, engine, revision=None, size=100, ttl=None):
+        """
+        Arguments:
+        engine -- the STT engine instance to cache transcriptions of
+        revision -- the revision of the engine's vocabulary
+        size -- the maximum number of transcriptions to keep
+        ttl -- seconds after which a transcription expires (Default: never)
+        """
+        self._logger = logging.getLogger(__name__)
+        self.engine = engine
+        self.revision = revision
+        self.cache = TranscriptionCache(size=size, ttl=ttl)
+
+    @classmethod
+    def get_config(cls):
+        # FIXME: Replace this as soon as we have a config module
+        config = {}
+        # Try to get the cached engine and the cache limits from config
+        profile_path = jasperpath.config('profile.yml')
+        if os.path.exists(profile_path):
+            with open(profile_path, 'r') as f:
+                profile = yaml.safe_load(f)
+                if 'cached-stt' in profile:
+                    for key in ('engine', 'size', 'ttl'):
+                        if key in profile['cached-stt']:
+                            config[key] = profile['cached-stt'][key]
+        return config
+
+    @classmethod
+    def get_instance(cls, vocabulary_name, phrases):
+        config = cls.get_config()
+        slug = config.pop('engine', 'sphinx')
+        if slug == cls.SLUG:
+            raise ValueError("STT engine '%s' cannot cache itself" % slug)
+        engine_class = get_engine_by_slug(slug)
+        if engine_class.VOCABULARY_TYPE:
+            config['revision'] = \
+                engine_class.VOCABULARY_TYPE.phrases_to_revision(phrases)
+        return cls(engine_class.get_instance(vocabulary_name, phrases),
+                   **config)
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def get_key(self, audio):
+        return TranscriptionCache.make_key(getattr(self.engine, 'SLUG', None),
+                                           self.revision, audio)
+
+    def store(self, audio, transcribed):
+        if transcribed:
+            self.cache.put(self.get_key(audio), transcribed)
+
+    def transcribe(self, fp):
+        return self.transcribe_pcm(AudioData.from_wav(fp))
+
+    def transcribe_pcm(self, audio):
+        transcribed = self.cache.get(self.get_key(audio))
+        if transcribed is not None:
+            self._logger.debug('Cache hit (%d hits, %d misses): %r',
+                               self.cache.hits, self.cache.misses,
+                               transcribed)
+            return transcribed
+        transcribed = self.engine.transcribe_pcm(audio)
+        self.store(audio, transcribed)
+        return transcribed
+
+    class Stream(TranscriptionStream):
+        """
+        Passes the audio data on to a stream of the cached engine, so that
+        incremental decoding still works, and stores the result.
+        """
+
+        def __init__(self, engine, rate=16000, sample_width=2):
+            super(CachedSTT.Stream, self).__init__(
+                engine, rate=rate, sample_width=sample_width)
+            self._stream = engine.engine.begin_stream(
+                rate=rate, sample_width=sample_width)
+
+        def feed(self, data):
+            super(CachedSTT.Stream, self).feed(data)
+            self._stream.feed(data)
+
+        def partial(self):
+            return self._stream.partial()
+
+        def finish(self):
+            transcribed = self._stream.finish()
+            self.engine.store(self.get_audio(), transcribed)
+            return transcribed
+
+    def begin_stream(self, rate=16000, sample_width=2):
+        """
+        Starts a transcription of audio data that is still being recorded
+        on the cached engine.
+
+        Arguments:
+            rate -- the sample rate of the audio data
+            sample_width -- the sample width of the audio data in bytes
+
+        Returns:
+            A CachedSTT.Stream instance
+        """
+        return CachedSTT.Stream(self, rate=rate, sample_width=sample_width)
+
+
 def get_engine_by_slug(slug=None):
     """
     Returns:
@@ -659,3 +2306,168 @@ def get_engines():
     return [tts_engine for tts_engine in
             list(get_subclasses(AbstractSTTEngine))
             if hasattr(tts_engine, 'SLUG') and tts_engine.SLUG]
+
+
+# The engine instance of a batch transcription worker process
+_batch_engine = None
+
+
+def _init_batch_worker(engine_class, vocabulary_name, phrases):
+    global _batch_engine
+    _batch_engine = engine_class.get_instance(vocabulary_name, phrases)
+
+
+def _transcribe_batch_item(item):
+    result = dict(item)
+    start = time.time()
+    try:
+        audio = AudioData.from_wav(item['file'])
+        result['duration'] = audio.duration
+        transcribed = _batch_engine.transcribe_pcm(audio)
+    except Exception as e:
+        logging.getLogger(__name__).error("Transcribing '%s' failed.",
+                                          item['file'], exc_info=True)
+        result['error'] = str(e)
+        transcribed = []
+    result['time'] = time.time() - start
+    result['transcription'] = list(transcribed)
+    result['hypotheses'] = [{'text': h.text, 'confidence': h.confidence,
+                             'words': [list(word) for word in h.words]}
+                            for h in getattr(transcribed, 'hypotheses', [])]
+    return result
+
+
+def find_batch_items(path):
+    """
+    Collects the audio files for a batch transcription.
+
+    Arguments:
+        path -- a directory that is searched for WAV files recursively, a
+                JSONL manifest with one object per line whose 'file' key
+                holds the path of the audio file (other keys like a
+                reference text are passed through to the results), or a
+                text file with one path per line. Relative paths in
+                manifests are relative to the manifest.
+
+    Returns:
+        A list of dicts with a 'file' key
+    """
+    items = []
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for fname in sorted(files):
+                if fname.lower().endswith('.wav'):
+                    items.append({'file': os.path.join(root, fname)})
+        return items
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if path.endswith('.jsonl'):
+                item = json.loads(line)
+            else:
+                item = {'file': line}
+            item['file'] = os.path.join(base_dir, item['file'])
+            items.append(item)
+    return items
+
+
+def transcribe_batch(engine_class, items, vocabulary_name='default',
+                     phrases=None, processes=None):
+    """
+    Transcribes many audio files on a pool of worker processes, each of
+    which creates its own instance of the engine.
+
+    Arguments:
+        engine_class -- the STT engine class to use
+        items -- a list of dicts whose 'file' key holds the path of a WAV
+                 file, e.g. as returned by find_batch_items()
+        vocabulary_name -- (optional) the name of the vocabulary
+        phrases -- (optional) the phrases of the vocabulary (Default: the
+                   phrases of all modules)
+        processes -- (optional) the number of worker processes (Default:
+                     the number of CPUs)
+
+    Returns:
+        An iterator over the items in order, each updated with the keys
+        'duration', 'time' (seconds it took to transcribe the file),
+        'transcription', 'hypotheses' and, if it failed, 'error'.
+    """
+    if phrases is None:
+        phrases = vocabcompiler.get_all_phrases()
+    if engine_class.VOCABULARY_TYPE:
+        # Compile the vocabulary once instead of in every worker
+        vocabulary = engine_class.VOCABULARY_TYPE(
+            vocabulary_name, path=jasperpath.config('vocabularies'))
+        if not vocabulary.matches_phrases(phrases):
+            vocabulary.compile(phrases)
+    pool = multiprocessing.Pool(processes, initializer=_init_batch_worker,
+                                initargs=(engine_class, vocabulary_name,
+                                          phrases))
+    try:
+        for result in pool.imap(_transcribe_batch_item, items):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Jasper batch ' +
+                                                 'transcription')
+    parser.add_argument('engine', metavar='ENGINE',
+                        choices=sorted(engine.SLUG for engine in
+                                       get_engines()),
+                        help='the slug of the STT engine to use')
+    parser.add_argument('path', metavar='PATH',
+                        help='a directory of WAV files, a JSONL manifest ' +
+                             'or a text file listing WAV files')
+    parser.add_argument('-o', '--output', default=None,
+                        help='the JSONL file to write the results to ' +
+                             '(Default: stdout)')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='the number of worker processes')
+    parser.add_argument('--phrases', default=None,
+                        help='a file with one vocabulary phrase per line ' +
+                             '(Default: the phrases of all modules)')
+    parser.add_argument('--vocabulary-name', default=None,
+                        help="the name of the vocabulary (Default: 'batch' " +
+                             "if --phrases is given, otherwise 'default')")
+    parser.add_argument('--debug', action='store_true',
+                        help='show debug messages')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    logger = logging.getLogger(__name__)
+
+    phrases = None
+    vocabulary_name = 'default'
+    if args.phrases:
+        with open(args.phrases, 'r') as f:
+            phrases = [line.strip() for line in f if line.strip()]
+        vocabulary_name = 'batch'
+    if args.vocabulary_name:
+        vocabulary_name = args.vocabulary_name
+
+    items = find_batch_items(args.path)
+    logger.info('Transcribing %d files with %s...', len(items), args.engine)
+    out = open(args.output, 'w') if args.output else sys.stdout
+    start = time.time()
+    try:
+        for result in transcribe_batch(get_engine_by_slug(args.engine),
+                                       items,
+                                       vocabulary_name=vocabulary_name,
+                                       phrases=phrases,
+                                       processes=args.processes):
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    logger.info('Done in %.1f seconds.', time.time() - start)
@@ -29,5 +29,8 @@ class Mic:
         self.idx += 1
         return input
 
+    def presynthesize(self, phrases):
+        pass
+
     def say(self, phrase, OPTIONS=None):
         self.outputs.append(phrase)
@@ -4,7 +4,11 @@ A Speaker handles audio output from Jasper to the user
 
 Speaker methods:
     say - output 'phrase' as speech
+    synthesize - synthesize 'phrase' into a temporary WAV file
+    synthesize_cached - like synthesize, but consults the TTS cache first
+    presynthesize - synthesize 'phrases' into the TTS cache ahead of time
     play - play the audio in 'filename'
+    set_player - play audio in-process through a player.Player instance
     is_available - returns True if the platform supports this implementation
 """
 import os
@@ -19,6 +23,7 @@ import urllib
 import urlparse
 import requests
 from abc import ABCMeta, abstractmethod
+import concurrent.futures
 
 import argparse
 import yaml
@@ -40,6 +45,9 @@ except ImportError:
 
 import diagnose
 import jasperpath
+import http_pool
+import tts_cache
+from circuitbreaker import CircuitBreaker
 
 
 class AbstractTTSEngine(object):
@@ -48,6 +56,9 @@ class AbstractTTSEngine(object):
     """
     __metaclass__ = ABCMeta
 
+    # The player.Player instance that plays audio in-process, if any
+    player = None
+
     @classmethod
     def get_config(cls):
         return {}
@@ -66,13 +77,205 @@ class AbstractTTSEngine(object):
     def __init__(self, **kwargs):
         self._logger = logging.getLogger(__name__)
 
+    def say(self, phrase):
+        """
+        Synthesizes and plays a phrase sentence by sentence. While a
+        sentence plays, the next one is synthesized on a worker thread, so
+        that speech starts as soon as the first sentence is ready, no matter
+        how long the phrase is.
+
+        Arguments:
+            phrase -- the text to say
+        """
+        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
+        sentences = split_sentences(phrase)
+        if (self.player is not None and
+                self.get_stream_command(sentences[0]) is not None):
+            self._say_streamed(sentences)
+            return
+        future = None
+        try:
+            for i, sentence in enumerate(sentences):
+                if future is None:
+                    fname = self.synthesize_cached(sentence)
+                else:
+                    fname = future.result()
+                    future = None
+                if i + 1 < len(sentences):
+                    future = self._get_pipeline().submit(
+                        self.synthesize_cached, sentences[i + 1])
+                try:
+                    self.play(fname)
+                finally:
+                    os.remove(fname)
+        finally:
+            if future is not None:
+                # Clean up after the worker once it has finished anyway
+                future.add_done_callback(_remove_result)
+
+    def get_stream_command(self, phrase):
+        """
+        Engines whose synthesizer can write WAV data to stdout override this,
+        so that their speech is piped straight into the player.
+
+        Arguments:
+            phrase -- the text to synthesize
+
+        Returns:
+            The command line of the synthesizer or None if this engine can't
+            stream
+        """
+        return None
+
+    def _say_streamed(self, sentences):
+        """
+        Pipes the output of the synthesizer into the player, starting
+        playback while the synthesizer is still running.
+
+        Without a TTS cache, the whole phrase is synthesized by a single
+        process. Otherwise, every sentence is looked up in the cache and only
+        the others are synthesized, one process per sentence, so that their
+        speech can be added to the cache while it plays.
+        """
+        cache = tts_cache.get_cache()
+        if cache is None:
+            self._play_streamed(' '.join(sentences))
+            return
+        for sentence in sentences:
+            key = cache.make_key(self.SLUG, self.voice_settings, sentence)
+            fname = cache.get(key)
+            if fname is None:
+                self._play_streamed(sentence, cache=cache, key=key)
+                continue
+            try:
+                self.play(fname)
+            finally:
+                os.remove(fname)
+
+    def _play_streamed(self, phrase, cache=None, key=None):
+        cmd = [str(x) for x in self.get_stream_command(phrase)]
+        self._logger.debug('Executing %s', ' '.join([pipes.quote(arg)
+                                                     for arg in cmd]))
+        with tempfile.TemporaryFile() as f:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=f)
+            try:
+                audio = self.player.play_stream(proc.stdout)
+            finally:
+                # Closing the pipe stops the synthesizer if playback failed
+                proc.stdout.close()
+                proc.wait()
+            f.seek(0)
+            output = f.read()
+            if output:
+                self._logger.debug("Output was: '%s'", output)
+        if cache is None or proc.returncode != 0:
+            # Don't cache speech that the synthesizer may have cut short
+            return
+        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
+            audio.write_wav(f)
+        try:
+            cache.put(key, f.name)
+        except (IOError, OSError):
+            self._logger.warning("Could not add speech to the TTS cache",
+                                 exc_info=True)
+        finally:
+            os.remove(f.name)
+
+    def _get_pipeline(self):
+        if getattr(self, '_pipeline', None) is None:
+            self._pipeline = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1)
+        return self._pipeline
+
+    @property
+    def voice_settings(self):
+        """
+        Returns:
+            A dict of the settings that affect how this engine sounds, which
+            keeps the cached speech of differently configured engines apart.
+            By default, these are all public attributes with simple values.
+        """
+        return dict((key, value) for key, value in vars(self).items()
+                    if not key.startswith('_') and
+                    isinstance(value, (basestring, int, long, float)))
+
+    def synthesize_cached(self, phrase):
+        """
+        Like synthesize(), but returns a copy of the cached speech if this
+        engine already synthesized the phrase with the same voice settings.
+        The result of synthesize() is added to the cache.
+
+        Arguments:
+            phrase -- the text to synthesize
+
+        Returns:
+            The filename of a temporary WAV file that the caller has to
+            remove
+        """
+        cache = tts_cache.get_cache()
+        if cache is None:
+            return self.synthesize(phrase)
+        key = cache.make_key(self.SLUG, self.voice_settings, phrase)
+        fname = cache.get(key)
+        if fname is not None:
+            self._logger.debug("Using cached speech for '%s'", phrase)
+            return fname
+        fname = self.synthesize(phrase)
+        try:
+            cache.put(key, fname)
+        except (IOError, OSError):
+            self._logger.warning("Could not add speech to the TTS cache",
+                                 exc_info=True)
+        return fname
+
+    def presynthesize(self, phrases):
+        """
+        Synthesizes phrases into the TTS cache without playing them, so that
+        saying them later only has to play the cached speech.
+
+        Arguments:
+            phrases -- a list of phrases
+        """
+        if tts_cache.get_cache() is None:
+            return
+        # say() looks up the cache sentence by sentence
+        sentences = [sentence for phrase in phrases
+                     for sentence in split_sentences(phrase)]
+        for sentence in sentences:
+            try:
+                os.remove(self.synthesize_cached(sentence))
+            except Exception:
+                self._logger.warning("Failed to presynthesize '%s'",
+                                     sentence, exc_info=True)
+
     @abstractmethod
-    def say(self, phrase, *args):
+    def synthesize(self, phrase):
+        """
+        Synthesizes speech without playing it.
+
+        Arguments:
+            phrase -- the text to synthesize
+
+        Returns:
+            The filename of a temporary WAV file that the caller has to
+            remove
+        """
         pass
 
+    def set_player(self, player):
+        """
+        Makes this engine play audio through a player instead of running
+        aplay for every phrase.
+
+        Arguments:
+            player -- a player.Player instance
+        """
+        self.player = player
+
     def play(self, filename):
-        # FIXME: Use platform-independent audio-output here
-        # See issue jasperproject/jasper-client#188
+        if self.player is not None:
+            self.player.play(filename)
+            return
         cmd = ['aplay', '-D', 'plughw:1,0', str(filename)]
         self._logger.debug('Executing %s', ' '.join([pipes.quote(arg)
                                                      for arg in cmd]))
@@ -93,9 +296,18 @@ class AbstractMp3TTSEngine(AbstractTTSEngine):
         return (super(AbstractMp3TTSEngine, cls).is_available() and
                 diagnose.check_python_import('mad'))
 
-    def play_mp3(self, filename):
+    def mp3_to_wav(self, filename):
+        """
+        Decodes an mp3 file into a temporary WAV file.
+
+        Arguments:
+            filename -- the mp3 file to decode
+
+        Returns:
+            The filename of the WAV file
+        """
         mf = mad.MadFile(filename)
-        with tempfile.NamedTemporaryFile(suffix='.wav') as f:
+        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
             wav = wave.open(f, mode='wb')
             wav.setframerate(mf.samplerate())
             wav.setnchannels(1 if mf.mode() == mad.MODE_SINGLE_CHANNEL else 2)
@@ -106,7 +318,12 @@ class AbstractMp3TTSEngine(AbstractTTSEngine):
                 wav.writeframes(frame)
                 frame = mf.read()
             wav.close()
-            self.play(f.name)
+        return f.name
+
+    def play_mp3(self, filename):
+        fname = self.mp3_to_wav(filename)
+        self.play(fname)
+        os.remove(fname)
 
 
 class DummyTTS(AbstractTTSEngine):
@@ -124,6 +341,15 @@ class DummyTTS(AbstractTTSEngine):
     def say(self, phrase):
         self._logger.info(phrase)
 
+    def synthesize(self, phrase):
+        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
+            wav = wave.open(f, mode='wb')
+            wav.setframerate(16000)
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.close()
+        return f.name
+
     def play(self, filename):
         self._logger.debug("Playback of file '%s' requested")
         pass
@@ -170,15 +396,18 @@ class EspeakTTS(AbstractTTSEngine):
         return (super(cls, cls).is_available() and
                 diagnose.check_executable('espeak'))
 
-    def say(self, phrase):
-        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
+    def _get_command(self):
+        return ['espeak', '-v', self.voice,
+                          '-p', self.pitch_adjustment,
+                          '-s', self.words_per_minute]
+
+    def get_stream_command(self, phrase):
+        return self._get_command() + ['--stdout', phrase]
+
+    def synthesize(self, phrase):
         with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
             fname = f.name
-        cmd = ['espeak', '-v', self.voice,
-                         '-p', self.pitch_adjustment,
-                         '-s', self.words_per_minute,
-                         '-w', fname,
-                         phrase]
+        cmd = self._get_command() + ['-w', fname, phrase]
         cmd = [str(x) for x in cmd]
         self._logger.debug('Executing %s', ' '.join([pipes.quote(arg)
                                                      for arg in cmd]))
@@ -188,8 +417,7 @@ class EspeakTTS(AbstractTTSEngine):
             output = f.read()
             if output:
                 self._logger.debug("Output was: '%s'", output)
-        self.play(fname)
-        os.remove(fname)
+        return fname
 
 
 class FestivalTTS(AbstractTTSEngine):
@@ -221,10 +449,10 @@ class FestivalTTS(AbstractTTSEngine):
                     return ('No default voice found' not in output)
         return False
 
-    def say(self, phrase):
-        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
+    def synthesize(self, phrase):
         cmd = ['text2wave']
-        with tempfile.NamedTemporaryFile(suffix='.wav') as out_f:
+        with tempfile.NamedTemporaryFile(suffix='.wav',
+                                         delete=False) as out_f:
             with tempfile.SpooledTemporaryFile() as in_f:
                 in_f.write(phrase)
                 in_f.seek(0)
@@ -238,7 +466,7 @@ class FestivalTTS(AbstractTTSEngine):
                     output = err_f.read()
                     if output:
                         self._logger.debug("Output was: '%s'", output)
-            self.play(out_f.name)
+        return out_f.name
 
 
 class FliteTTS(AbstractTTSEngine):
@@ -287,12 +515,20 @@ class FliteTTS(AbstractTTSEngine):
                 diagnose.check_executable('flite') and
                 len(cls.get_voices()) > 0)
 
-    def say(self, phrase):
-        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
+    def _get_command(self, phrase):
         cmd = ['flite']
         if self.voice:
             cmd.extend(['-voice', self.voice])
         cmd.extend(['-t', phrase])
+        return cmd
+
+    def get_stream_command(self, phrase):
+        # flite writes the whole RIFF header up front, so it never has to
+        # seek in its output file
+        return self._get_command(phrase) + ['/dev/stdout']
+
+    def synthesize(self, phrase):
+        cmd = self._get_command(phrase)
         with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
             fname = f.name
         cmd.append(fname)
@@ -305,8 +541,7 @@ class FliteTTS(AbstractTTSEngine):
             output = out_f.read().strip()
         if output:
             self._logger.debug("Output was: '%s'", output)
-        self.play(fname)
-        os.remove(fname)
+        return fname
 
 
 class MacOSXTTS(AbstractTTSEngine):
@@ -322,9 +557,10 @@ class MacOSXTTS(AbstractTTSEngine):
                 diagnose.check_executable('say') and
                 diagnose.check_executable('afplay'))
 
-    def say(self, phrase):
-        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
-        cmd = ['say', str(phrase)]
+    def synthesize(self, phrase):
+        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
+            fname = f.name
+        cmd = ['say', '-o', fname, '--data-format=LEI16@22050', str(phrase)]
         self._logger.debug('Executing %s', ' '.join([pipes.quote(arg)
                                                      for arg in cmd]))
         with tempfile.TemporaryFile() as f:
@@ -333,8 +569,12 @@ class MacOSXTTS(AbstractTTSEngine):
             output = f.read()
             if output:
                 self._logger.debug("Output was: '%s'", output)
+        return fname
 
     def play(self, filename):
+        if self.player is not None:
+            super(MacOSXTTS, self).play(filename)
+            return
         cmd = ['afplay', str(filename)]
         self._logger.debug('Executing %s', ' '.join([pipes.quote(arg)
                                                      for arg in cmd]))
@@ -395,8 +635,7 @@ class PicoTTS(AbstractTTSEngine):
         langs = matchobj.group(1).split()
         return langs
 
-    def say(self, phrase):
-        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
+    def synthesize(self, phrase):
         with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
             fname = f.name
         cmd = ['pico2wave', '--wave', fname]
@@ -413,8 +652,7 @@ class PicoTTS(AbstractTTSEngine):
             output = f.read()
             if output:
                 self._logger.debug("Output was: '%s'", output)
-        self.play(fname)
-        os.remove(fname)
+        return fname
 
 
 class GoogleTTS(AbstractMp3TTSEngine):
@@ -460,8 +698,7 @@ class GoogleTTS(AbstractMp3TTSEngine):
                  'th', 'tr', 'vi', 'cy']
         return langs
 
-    def say(self, phrase):
-        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
+    def synthesize(self, phrase):
         if self.language not in self.languages:
             raise ValueError("Language '%s' not supported by '%s'",
                              self.language, self.SLUG)
@@ -469,8 +706,9 @@ class GoogleTTS(AbstractMp3TTSEngine):
         with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as f:
             tmpfile = f.name
         tts.save(tmpfile)
-        self.play_mp3(tmpfile)
+        fname = self.mp3_to_wav(tmpfile)
         os.remove(tmpfile)
+        return fname
 
 
 class MaryTTS(AbstractTTSEngine):
@@ -493,7 +731,7 @@ class MaryTTS(AbstractTTSEngine):
                                                port=self.port)
         self.language = language
         self.voice = voice
-        self.session = requests.Session()
+        self.session = http_pool.get_session()
 
     @property
     def languages(self):
@@ -544,8 +782,7 @@ class MaryTTS(AbstractTTSEngine):
         urlparts = ('http', self.netloc, path, query_s, '')
         return urlparse.urlunsplit(urlparts)
 
-    def say(self, phrase):
-        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
+    def synthesize(self, phrase):
         if self.language not in self.languages:
             raise ValueError("Language '%s' not supported by '%s'"
                              % (self.language, self.SLUG))
@@ -561,11 +798,20 @@ class MaryTTS(AbstractTTSEngine):
                  'VOICE': self.voice}
 
         r = self.session.get(self._makeurl('/process', query=query))
+        r.raise_for_status()
         with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
             f.write(r.content)
             tmpfile = f.name
-        self.play(tmpfile)
-        os.remove(tmpfile)
+        return tmpfile
+
+    def say(self, phrase):
+        # synthesize() raises on server errors, so that FallbackTTS counts
+        # them as failures, but on its own, Jasper just doesn't say anything
+        try:
+            super(MaryTTS, self).say(phrase)
+        except requests.exceptions.RequestException:
+            self._logger.error("Communication with MaryTTS server at %s " +
+                               "failed.", self.netloc, exc_info=True)
 
 
 class IvonaTTS(AbstractMp3TTSEngine):
@@ -591,6 +837,12 @@ class IvonaTTS(AbstractMp3TTSEngine):
         if sentence_break:
             self._pyvonavoice.sentence_break = sentence_break
 
+    @property
+    def voice_settings(self):
+        return dict((key, getattr(self._pyvonavoice, key, None))
+                    for key in ('region', 'voice_name', 'speech_rate',
+                                'sentence_break'))
+
     @classmethod
     def get_config(cls):
         # FIXME: Replace this as soon as we have a config module
@@ -626,13 +878,174 @@ class IvonaTTS(AbstractMp3TTSEngine):
                 diagnose.check_python_import('pyvona') and
                 diagnose.check_network_connection())
 
-    def say(self, phrase):
-        self._logger.debug("Saying '%s' with '%s'", phrase, self.SLUG)
+    def synthesize(self, phrase):
         with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as f:
             tmpfile = f.name
         self._pyvonavoice.fetch_voice(phrase, tmpfile)
-        self.play_mp3(tmpfile)
+        fname = self.mp3_to_wav(tmpfile)
         os.remove(tmpfile)
+        return fname
+
+
+class FallbackTTS(AbstractTTSEngine):
+    """
+    Tries a list of TTS engines in order until one of them synthesizes the
+    phrase. Each engine gets a deadline for the synthesis (playback is not
+    limited), and engines that failed repeatedly are skipped for a while
+    by a circuit breaker. eSpeak is appended to the list as last resort if
+    it isn't listed already.
+
+    Excerpt from sample profile.yml:
+
+        ...
+        tts_engine: fallback-tts
+        fallback-tts:
+            engines:
+                - ivona-tts
+                - pico-tts
+            deadline: 5
+            failure_threshold: 3
+            cooldown: 60
+    """
+
+    SLUG = 'fallback-tts'
+
+    def __init__(self, engines, deadline=5, failure_threshold=3, cooldown=60):
+        """
+        Arguments:
+            engines -- a list of TTS engine instances, in order of
+                       preference
+            deadline -- seconds to wait for each engine
+            failure_threshold -- the number of consecutive failures after
+                                 which an engine is skipped
+            cooldown -- seconds to skip an engine for
+        """
+        super(FallbackTTS, self).__init__()
+        self.engines = engines
+        self.deadline = deadline
+        self._breakers = dict(
+            (engine, CircuitBreaker(engine.SLUG,
+                                    failure_threshold=failure_threshold,
+                                    cooldown=cooldown))
+            for engine in engines)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(len(engines), 1))
+
+    @classmethod
+    def get_config(cls):
+        # FIXME: Replace this as soon as we have a config module
+        config = {}
+        # Try to get the engines and their settings from config
+        profile_path = jasperpath.config('profile.yml')
+        if os.path.exists(profile_path):
+            with open(profile_path, 'r') as f:
+                profile = yaml.safe_load(f)
+                if 'fallback-tts' in profile:
+                    for key in ('engines', 'deadline', 'failure_threshold',
+                                'cooldown'):
+                        if key in profile['fallback-tts']:
+                            config[key] = profile['fallback-tts'][key]
+        return config
+
+    @classmethod
+    def get_instance(cls):
+        config = cls.get_config()
+        slugs = config.pop('engines', [])
+        if EspeakTTS.SLUG not in slugs and EspeakTTS.is_available():
+            slugs.append(EspeakTTS.SLUG)
+        engines = []
+        for slug in slugs:
+            if slug == cls.SLUG:
+                raise ValueError(("TTS engine '%s' cannot delegate to " +
+                                  "itself") % slug)
+            try:
+                engines.append(get_engine_by_slug(slug).get_instance())
+            except ValueError as e:
+                logging.getLogger(__name__).warning('Skipping TTS engine: %s',
+                                                    e)
+        if not engines:
+            raise ValueError("No TTS engines for '%s' configured" % cls.SLUG)
+        return cls(engines, **config)
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def _synthesize(self, phrase):
+        """
+        Returns:
+            A tuple of the engine that synthesized the phrase and the
+            filename of the WAV file, or (None, None) if all engines failed
+        """
+        for engine in self.engines:
+            breaker = self._breakers[engine]
+            if not breaker.allow():
+                self._logger.debug("Circuit breaker for TTS engine '%s' " +
+                                   "is open, skipping it.", engine.SLUG)
+                continue
+            future = self._executor.submit(engine.synthesize_cached, phrase)
+            try:
+                fname = future.result(timeout=self.deadline)
+            except concurrent.futures.TimeoutError:
+                self._logger.warning("TTS engine '%s' missed its deadline.",
+                                     engine.SLUG)
+                # Clean up after the engine once it has finished anyway
+                future.add_done_callback(_remove_result)
+            except Exception:
+                self._logger.error("TTS engine '%s' failed.", engine.SLUG,
+                                   exc_info=True)
+            else:
+                breaker.record_success()
+                return (engine, fname)
+            breaker.record_failure()
+        return (None, None)
+
+    def synthesize(self, phrase):
+        engine, fname = self._synthesize(phrase)
+        if fname is None:
+            raise RuntimeError("All TTS engines failed to synthesize '%s'" %
+                               phrase)
+        return fname
+
+    def synthesize_cached(self, phrase):
+        # The engines consult the cache themselves, keyed by their own
+        # voice settings
+        return self.synthesize(phrase)
+
+    def say(self, phrase):
+        try:
+            super(FallbackTTS, self).say(phrase)
+        except RuntimeError as e:
+            self._logger.error(e)
+
+    def set_player(self, player):
+        super(FallbackTTS, self).set_player(player)
+        for engine in self.engines:
+            engine.set_player(player)
+
+    def play(self, filename):
+        self.engines[0].play(filename)
+
+
+def split_sentences(text):
+    """
+    Splits text into sentences at sentence-ending punctuation followed by
+    whitespace. The punctuation is kept, as it affects the intonation.
+
+    Arguments:
+        text -- the text to split
+
+    Returns:
+        A list of sentences
+    """
+    sentences = [sentence.strip()
+                 for sentence in re.split(r'(?<=[.!?])\s+', text)]
+    return [sentence for sentence in sentences if sentence] or [text]
+
+
+def _remove_result(future):
+    if not future.cancelled() and future.exception() is None:
+        os.remove(future.result())
 
 
 def get_default_engine_slug():
@@ -0,0 +1,186 @@
+# -*- coding: utf-8-*-
+"""
+Keeps synthesized speech on disk, so that phrases Jasper says over and over
+(e.g. "How can I be of service?") are synthesized only once per voice.
+
+Files are addressed by a hash of the engine's slug, its voice settings and
+the phrase. Once the cache grows beyond its maximum size, the least recently
+used files are removed.
+
+Excerpt from sample profile.yml:
+
+    ...
+    tts_cache:
+        max_size_mb: 20  # 0 disables the cache
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import yaml
+import jasperpath
+
+_cache = None
+_cache_lock = threading.Lock()
+
+# The size of a WAV header, i.e. of a file without any audio data
+_EMPTY_WAV_SIZE = 44
+
+
+class SpeechCache(object):
+
+    def __init__(self, path, max_size=20 * 1024 * 1024):
+        """
+        Arguments:
+            path -- the directory to keep the WAV files in
+            max_size -- (optional) the maximum total size of the cache in
+                        bytes (Default: 20 MB)
+        """
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self.path = path
+        self.max_size = max_size
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    @classmethod
+    def get_config(cls):
+        # FIXME: Replace this as soon as we have a config module
+        config = {}
+        # Try to get cache settings from config
+        profile_path = jasperpath.config('profile.yml')
+        if os.path.exists(profile_path):
+            with open(profile_path, 'r') as f:
+                profile = yaml.safe_load(f)
+                if 'tts_cache' in profile:
+                    if 'path' in profile['tts_cache']:
+                        config['path'] = profile['tts_cache']['path']
+                    if 'max_size_mb' in profile['tts_cache']:
+                        config['max_size'] = int(
+                            profile['tts_cache']['max_size_mb'] * 1024 * 1024)
+        return config
+
+    @staticmethod
+    def make_key(slug, settings, phrase):
+        """
+        Arguments:
+            slug -- the slug of the TTS engine
+            settings -- a dict of the engine's voice settings
+            phrase -- the phrase to synthesize
+
+        Returns:
+            A key that identifies the synthesized phrase
+        """
+        if isinstance(phrase, unicode):
+            phrase = phrase.encode('utf-8')
+        data = json.dumps([slug, sorted(settings.items()),
+                           ' '.join(phrase.split())])
+        return hashlib.sha1(data).hexdigest()
+
+    def _get_filename(self, key):
+        return os.path.join(self.path, '%s.wav' % key)
+
+    def get(self, key):
+        """
+        Arguments:
+            key -- a key returned by make_key()
+
+        Returns:
+            The filename of a temporary copy of the cached WAV file that the
+            caller has to remove, or None if the phrase isn't cached
+        """
+        fname = self._get_filename(key)
+        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
+            tmpfile = f.name
+        os.remove(tmpfile)
+        try:
+            # A hard link is as good as a copy, but costs nothing
+            os.link(fname, tmpfile)
+        except OSError:
+            try:
+                shutil.copyfile(fname, tmpfile)
+            except IOError:
+                if os.path.exists(tmpfile):
+                    os.remove(tmpfile)
+                return None
+        try:
+            # The modification time marks recently used files
+            os.utime(fname, None)
+        except OSError:
+            pass
+        return tmpfile
+
+    def put(self, key, fname):
+        """
+        Stores a copy of a synthesized WAV file and evicts the least recently
+        used files if the cache is full.
+
+        Arguments:
+            key -- a key returned by make_key()
+            fname -- the filename of the WAV file
+        """
+        if os.path.getsize(fname) <= _EMPTY_WAV_SIZE:
+            # Don't keep the output of failed syntheses
+            return
+        with tempfile.NamedTemporaryFile(dir=self.path, suffix='.tmp',
+                                         delete=False) as f:
+            tmpfile = f.name
+        shutil.copyfile(fname, tmpfile)
+        # Renaming is atomic, so readers never see a partial file
+        os.rename(tmpfile, self._get_filename(key))
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.path):
+                if not name.endswith('.wav'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.path, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+            total_size = sum(size for mtime, size, name in entries)
+            for mtime, size, name in sorted(entries):
+                if total_size <= self.max_size:
+                    break
+                self._logger.debug("Evicting '%s' from TTS cache", name)
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+                total_size -= size
+
+    @property
+    def size(self):
+        """
+        Returns:
+            The total size of all cached files in bytes
+        """
+        return sum(os.path.getsize(os.path.join(self.path, name))
+                   for name in os.listdir(self.path) if name.endswith('.wav'))
+
+
+def get_cache():
+    """
+    Returns:
+        The SpeechCache instance shared by all TTS engines, created on first
+        use from the 'tts_cache' section of profile.yml, or None if the
+        cache is disabled (max_size_mb: 0)
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = SpeechCache.get_config()
+            config.setdefault('path', jasperpath.config('tts_cache'))
+            if config.get('max_size') == 0:
+                _cache = False
+            else:
+                logging.getLogger(__name__).debug('Creating TTS cache with ' +
+                                                  'config: %r', config)
+                _cache = SpeechCache(**config)
+        return _cache or None
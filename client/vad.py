@@ -0,0 +1,220 @@
+# -*- coding: utf-8-*-
+"""
+A voice activity detector (VAD) decides when the user has finished speaking
+while Jasper is listening actively.
+
+VAD methods:
+    reset - prepare the detector for a new utterance
+    process - feed a chunk of audio, returns True once the utterance ended
+    is_available - returns True if the platform supports this implementation
+"""
+import os
+import logging
+import audioop
+from abc import ABCMeta, abstractmethod
+import yaml
+import jasperpath
+from audio_utils import EnergyTracker
+
+
+class AbstractVAD(object):
+    """
+    Generic parent class for all voice activity detectors
+
+    Energy thresholds passed to reset() are expressed in the same unit as
+    the scores of client.mic.Mic, i.e. the RMS of a chunk divided by 3.
+    """
+    __metaclass__ = ABCMeta
+
+    @classmethod
+    def get_config(cls):
+        # FIXME: Replace this as soon as we have a config module
+        config = {}
+        # Try to get silence_ms from config
+        profile_path = jasperpath.config('profile.yml')
+        if os.path.exists(profile_path):
+            with open(profile_path, 'r') as f:
+                profile = yaml.safe_load(f)
+                if cls.SLUG in profile:
+                    if 'silence_ms' in profile[cls.SLUG]:
+                        config['silence_ms'] = \
+                            profile[cls.SLUG]['silence_ms']
+        return config
+
+    @classmethod
+    def get_instance(cls):
+        config = cls.get_config()
+        instance = cls(**config)
+        return instance
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def __init__(self, rate=16000, sample_width=2, silence_ms=700):
+        """
+        Arguments:
+        rate -- the sample rate of the audio data
+        sample_width -- the sample width of the audio data in bytes
+        silence_ms -- milliseconds of silence after which an utterance is
+                      considered finished
+        """
+        self._logger = logging.getLogger(__name__)
+        self.rate = rate
+        self.sample_width = sample_width
+        self.silence_ms = silence_ms
+
+    def get_score(self, data):
+        return audioop.rms(data, self.sample_width) / 3
+
+    def get_duration_ms(self, data):
+        return 1000.0 * len(data) / self.sample_width / self.rate
+
+    @abstractmethod
+    def reset(self, threshold):
+        """
+        Prepares the detector for a new utterance.
+
+        Arguments:
+        threshold -- the energy score that background noise stays below
+        """
+        pass
+
+    @abstractmethod
+    def process(self, data):
+        """
+        Feeds a chunk of audio data into the detector.
+
+        Arguments:
+        data -- a string of raw audio data
+
+        Returns True if the end of the utterance has been detected
+        """
+        pass
+
+
+class ThresholdVAD(AbstractVAD):
+    """
+    The original endpointing of Jasper: the utterance ends as soon as the
+    average score of the last 30 chunks drops below 80% of the threshold.
+    """
+
+    SLUG = 'threshold-vad'
+
+    def reset(self, threshold):
+        self._threshold = threshold
+        # increasing the size results in longer pause after command
+        # generation
+        self._lastN = EnergyTracker(30, initial=threshold * 1.2)
+
+    def process(self, data):
+        self._lastN.add(self.get_score(data))
+        return self._lastN.average < self._threshold * 0.8
+
+
+class EnergyVAD(AbstractVAD):
+    """
+    Classifies each chunk as speech or non-speech by its energy and its
+    zero-crossing rate (so that quiet unvoiced sounds like fricatives still
+    count as speech) and ends the utterance after silence_ms milliseconds of
+    non-speech (the hangover).
+    """
+
+    SLUG = 'energy-vad'
+
+    def __init__(self, rate=16000, sample_width=2, silence_ms=700,
+                 leading_silence_ms=3000, min_speech_ms=100,
+                 zcr_threshold=0.25):
+        """
+        Arguments:
+        rate -- the sample rate of the audio data
+        sample_width -- the sample width of the audio data in bytes
+        silence_ms -- milliseconds of silence after speech after which an
+                      utterance is considered finished
+        leading_silence_ms -- milliseconds to wait for speech to start
+        min_speech_ms -- milliseconds of speech required before an
+                         utterance is considered started
+        zcr_threshold -- zero-crossings per sample above which a quiet chunk
+                         is considered unvoiced speech
+        """
+        super(EnergyVAD, self).__init__(rate=rate, sample_width=sample_width,
+                                        silence_ms=silence_ms)
+        self.leading_silence_ms = leading_silence_ms
+        self.min_speech_ms = min_speech_ms
+        self.zcr_threshold = zcr_threshold
+        self.reset(0)
+
+    def reset(self, threshold):
+        self._threshold = threshold
+        self._speech_ms = 0
+        self._silence_ms = 0
+
+    def is_speech(self, data):
+        """
+        Arguments:
+        data -- a string of raw audio data
+
+        Returns True if the chunk contains speech
+        """
+        score = self.get_score(data)
+        if score > self._threshold:
+            return True
+        if score > self._threshold * 0.5:
+            samples = len(data) / self.sample_width
+            zcr = audioop.cross(data, self.sample_width) / float(samples)
+            return zcr > self.zcr_threshold
+        return False
+
+    def process(self, data):
+        duration = self.get_duration_ms(data)
+        if self.is_speech(data):
+            self._speech_ms += duration
+            self._silence_ms = 0
+        else:
+            self._silence_ms += duration
+        if self._speech_ms >= self.min_speech_ms:
+            return self._silence_ms >= self.silence_ms
+        return self._silence_ms >= self.leading_silence_ms
+
+
+def get_default_engine_slug():
+    return EnergyVAD.SLUG
+
+
+def get_engine_by_slug(slug=None):
+    """
+    Returns:
+        A VAD implementation available on the current platform
+
+    Raises:
+        ValueError if no VAD implementation is supported on this platform
+    """
+
+    if not slug or type(slug) is not str:
+        raise TypeError("Invalid slug '%s'", slug)
+
+    selected_engines = filter(lambda engine: hasattr(engine, "SLUG") and
+                              engine.SLUG == slug, get_engines())
+    if len(selected_engines) == 0:
+        raise ValueError("No VAD engine found for slug '%s'" % slug)
+    else:
+        if len(selected_engines) > 1:
+            print(("WARNING: Multiple VAD engines found for slug '%s'. " +
+                   "This is most certainly a bug.") % slug)
+        engine = selected_engines[0]
+        if not engine.is_available():
+            raise ValueError(("VAD engine '%s' is not available (due to " +
+                              "missing dependencies, etc.)") % slug)
+        return engine
+
+
+def get_engines():
+    def get_subclasses(cls):
+        subclasses = set()
+        for subclass in cls.__subclasses__():
+            subclasses.add(subclass)
+            subclasses.update(get_subclasses(subclass))
+        return subclasses
+    return [vad_engine for vad_engine in
+            list(get_subclasses(AbstractVAD))
+            if hasattr(vad_engine, 'SLUG') and vad_engine.SLUG]
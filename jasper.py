@@ -11,6 +11,8 @@ import argparse
 
 from client import tts
 from client import stt
+from client import vocabcompiler
+from client import vad
 from client import jasperpath
 from client import diagnose
 from client.conversation import Conversation
@@ -104,10 +106,34 @@ class Jasper(object):
                            "to '%s'", tts_engine_slug)
         tts_engine_class = tts.get_engine_by_slug(tts_engine_slug)
 
+        try:
+            vad_engine_slug = self.config['vad_engine']
+        except KeyError:
+            vad_engine_slug = vad.get_default_engine_slug()
+        vad_engine_class = vad.get_engine_by_slug(vad_engine_slug)
+
+        mic_kwargs = {'vad_engine': vad_engine_class.get_instance()}
+        if 'mic' in self.config:
+            if 'preroll_ms' in self.config['mic']:
+                mic_kwargs['preroll_ms'] = self.config['mic']['preroll_ms']
+            if 'output_device' in self.config['mic']:
+                mic_kwargs['output_device'] = \
+                    self.config['mic']['output_device']
+
+        active_stt_engine = stt_engine_class.get_active_instance()
+        if stt_passive_engine_class is stt_engine_class:
+            # Lets engines that support it use a single decoder for both
+            passive_stt_engine = active_stt_engine.with_vocabulary(
+                'keyword', vocabcompiler.get_keyword_phrases())
+        else:
+            passive_stt_engine = \
+                stt_passive_engine_class.get_passive_instance()
+
         # Initialize Mic
         self.mic = Mic(tts_engine_class.get_instance(),
-                       stt_passive_engine_class.get_passive_instance(),
-                       stt_engine_class.get_active_instance())
+                       passive_stt_engine,
+                       active_stt_engine,
+                       **mic_kwargs)
 
     def run(self):
         if 'first_name' in self.config:
@@ -115,9 +141,10 @@ class Jasper(object):
                           % self.config["first_name"])
         else:
             salutation = "How can I be of service?"
-        self.mic.say(salutation)
 
         conversation = Conversation("JASPER", self.mic, self.config)
+        conversation.presynthesizePrompts()
+        self.mic.say(salutation)
         conversation.handleForever()
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import unittest
+import threading
+import struct
+import StringIO
+from client import audio_utils
+
+
+class TestRingBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = audio_utils.RingBuffer(4)
+
+    def testRead(self):
+        """Does a reader get the chunks appended after its position?"""
+        for chunk in ('a', 'b'):
+            self.buffer.append(chunk)
+        reader = self.buffer.read(0)
+        self.assertEqual(['a', 'b'], [next(reader), next(reader)])
+        self.buffer.append('c')
+        self.assertEqual('c', next(reader))
+
+    def testOverrun(self):
+        """Does a reader skip chunks that have already been discarded?"""
+        for chunk in 'abcdef':
+            self.buffer.append(chunk)
+        self.assertEqual(6, self.buffer.position)
+        self.assertEqual(['c', 'd', 'e', 'f'], list(self.buffer.get_last(5)))
+        self.buffer.close()
+        self.assertEqual(['c', 'd', 'e', 'f'], list(self.buffer.read(0)))
+
+    def testBlockingRead(self):
+        """Does a reader wait for chunks appended by another thread?"""
+        reader = self.buffer.read()
+        timer = threading.Timer(0.05, self.buffer.append, args=('a',))
+        timer.start()
+        self.assertEqual('a', next(reader))
+        timer.join()
+
+    def testClose(self):
+        """Do readers stop after the buffer has been closed?"""
+        self.buffer.append('a')
+        reader = self.buffer.read(0)
+        self.buffer.close()
+        self.assertEqual(['a'], list(reader))
+
+
+class TestEnergyTracker(unittest.TestCase):
+
+    def testAverage(self):
+        """Does the tracker average over the last N scores only?"""
+        tracker = audio_utils.EnergyTracker(3, initial=6)
+        self.assertEqual(6, tracker.average)
+        tracker.extend([3, 3, 3, 9])
+        self.assertEqual(5, tracker.average)
+        self.assertEqual(3, len(tracker))
+
+
+class TestRMS(unittest.TestCase):
+
+    def testRMSMany(self):
+        """Does batch RMS calculation match audioop's results?"""
+        chunks = [struct.pack('<4h', *samples) for samples in
+                  ((0, 0, 0, 0), (100, -100, 100, -100), (1, 2, 3, 4000))]
+        self.assertEqual([audio_utils.rms(chunk) for chunk in chunks],
+                         audio_utils.rms_many(chunks))
+
+
+class TestAudioData(unittest.TestCase):
+
+    def testWavRoundTrip(self):
+        """Does AudioData survive serialization to WAV?"""
+        audio = audio_utils.AudioData(['\x01\x00', '\x02\x00\x03\x00'],
+                                      rate=8000)
+        self.assertEqual('\x01\x00\x02\x00\x03\x00', audio.data)
+        self.assertAlmostEqual(3 / 8000.0, audio.duration)
+        with audio.open_wav() as f:
+            copy = audio_utils.AudioData.from_wav(f)
+        self.assertEqual(audio.data, copy.data)
+        self.assertEqual(8000, copy.rate)
+        self.assertEqual(2, copy.sample_width)
+        self.assertEqual(1, copy.channels)
+
+
+class TestReadWavHeader(unittest.TestCase):
+
+    def testPipe(self):
+        """Is the header of streamed WAV data with unknown length read?"""
+        fmt = struct.pack('<HHIIHH', 1, 1, 22050, 44100, 2, 16)
+        data = ('RIFF' + struct.pack('<I', 0x7ffff000) + 'WAVE' +
+                'fmt ' + struct.pack('<I', len(fmt)) + fmt +
+                'LIST' + struct.pack('<I', 3) + 'abc\x00' +
+                'data' + struct.pack('<I', 0x7ffff000) + '\x01\x00')
+        fp = StringIO.StringIO(data)
+        self.assertEqual((22050, 2, 1), audio_utils.read_wav_header(fp))
+        self.assertEqual('\x01\x00', fp.read())
+        self.assertRaises(ValueError, audio_utils.read_wav_header,
+                          StringIO.StringIO('ID3'))
@@ -2,7 +2,7 @@
 # -*- coding: utf-8-*-
 import unittest
 import mock
-from client import brain, test_mic
+from client import brain, test_mic, stt
 
 
 DEFAULT_PROFILE = {
@@ -47,3 +47,49 @@ class TestBrain(unittest.TestCase):
         with mock.patch.object(hn, 'handle') as mocked_handle:
             my_brain.query(["hacker news"])
             self.assertTrue(mocked_handle.called)
+
+    def testConfidentTranscription(self):
+        """Does Brain skip the alternatives of a confident transcription?"""
+        my_brain = TestBrain._emptyBrain()
+        hn = filter(lambda m: m.__name__ == 'HN', my_brain.modules)[0]
+        time = filter(lambda m: m.__name__ == 'Time', my_brain.modules)[0]
+        # HN has a higher priority than Time
+        unsure = stt.Transcription([stt.Hypothesis('WHAT TIME IS IT', 0.5,
+                                                   []),
+                                    stt.Hypothesis('HACKER NEWS', 0.4, [])])
+        sure = stt.Transcription([stt.Hypothesis('WHAT TIME IS IT', 0.95,
+                                                 []),
+                                  stt.Hypothesis('HACKER NEWS', 0.05, [])])
+        with mock.patch.object(hn, 'handle') as hn_handle, \
+                mock.patch.object(time, 'handle') as time_handle:
+            my_brain.query(unsure)
+            self.assertTrue(hn_handle.called)
+            self.assertFalse(time_handle.called)
+            hn_handle.reset_mock()
+            my_brain.query(sure)
+            self.assertFalse(hn_handle.called)
+            self.assertTrue(time_handle.called)
+
+    def testConfidentUnmatchedTranscription(self):
+        """Are alternatives tried if a confident text matches no module?"""
+        my_brain = TestBrain._emptyBrain()
+        hn = filter(lambda m: m.__name__ == 'HN', my_brain.modules)[0]
+        unclear = my_brain.modules[-1]
+        sure = stt.Transcription([stt.Hypothesis('ZZZ', 1.0, []),
+                                  stt.Hypothesis('HACKER NEWS', 0.0, [])])
+        with mock.patch.object(hn, 'handle') as hn_handle, \
+                mock.patch.object(unclear, 'handle') as unclear_handle:
+            my_brain.query(sure)
+            self.assertTrue(hn_handle.called)
+            self.assertFalse(unclear_handle.called)
+
+    def testPrompts(self):
+        """Does Brain collect the prompts that modules declare?"""
+        my_brain = TestBrain._emptyBrain()
+        unclear = filter(lambda m: m.__name__ == 'Unclear',
+                         my_brain.modules)[0]
+        prompts = my_brain.get_prompts()
+        self.assertIn(brain.Brain.ERROR_MESSAGE, prompts)
+        for prompt in unclear.PROMPTS:
+            self.assertIn(prompt, prompts)
+        self.assertEqual(len(set(prompts)), len(prompts))
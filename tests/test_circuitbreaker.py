@@ -0,0 +1,36 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import unittest
+import mock
+from client import circuitbreaker
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = circuitbreaker.CircuitBreaker('test',
+                                                     failure_threshold=2,
+                                                     cooldown=10)
+
+    def testOpen(self):
+        """Does the breaker open after consecutive failures only?"""
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+
+    def testCooldown(self):
+        """Is a trial call allowed after the cooldown?"""
+        with mock.patch('time.time', return_value=100):
+            self.breaker.record_failure()
+            self.breaker.record_failure()
+        with mock.patch('time.time', return_value=111):
+            self.assertEqual(self.breaker.HALF_OPEN, self.breaker.state)
+            self.breaker.record_failure()
+            self.assertFalse(self.breaker.allow())
+        with mock.patch('time.time', return_value=122):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_success()
+        self.assertEqual(self.breaker.CLOSED, self.breaker.state)
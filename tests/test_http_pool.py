@@ -0,0 +1,58 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import unittest
+import threading
+import time
+import BaseHTTPServer
+import requests
+from client import http_pool
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.server.clients.add(self.client_address)
+        body = self.rfile.read(int(self.headers.getheader('content-length')))
+        if self.path == '/slow':
+            time.sleep(0.5)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPooledSession(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.clients = set()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+        self.session = http_pool.PooledSession(read_timeout=0.2)
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testKeepAlive(self):
+        """Are connections reused for subsequent requests?"""
+        for i in range(3):
+            r = self.session.post(self.url + '/echo', data='foo%d' % i)
+            self.assertEqual('foo%d' % i, r.content)
+        self.assertEqual(1, len(self.server.clients))
+
+    def testDefaultTimeout(self):
+        """Does the session apply its timeout to all requests?"""
+        self.assertRaises(requests.exceptions.Timeout, self.session.post,
+                          self.url + '/slow', data='foo')
+
+    def testSharedSession(self):
+        """Is the same session returned every time?"""
+        self.assertIs(http_pool.get_session(), http_pool.get_session())
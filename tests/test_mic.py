@@ -0,0 +1,229 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import gc
+import sys
+import time
+import struct
+import threading
+import types
+import unittest
+import mock
+# Imported here, so that only client.mic gets imported with the fake
+# pyaudio module in place
+from client import audio_utils, vad, player, alteration  # noqa
+
+CHUNK = 1024
+
+
+def make_chunk(amplitude):
+    """Returns a chunk of a square wave whose RMS is amplitude"""
+    return struct.pack('<hh', amplitude, -amplitude) * (CHUNK / 2)
+
+
+class FakeStream(object):
+    """
+    A PyAudio input stream that plays back a list of chunks at a pace the
+    reader can keep up with, followed by endless quiet. While a sound is
+    played, it picks up the BEEP chunk instead, and the quiet follows right
+    after the sound.
+    """
+
+    BEEP = make_chunk(3000)
+
+    def __init__(self, chunks, quiet=make_chunk(50)):
+        self.chunks = list(chunks)
+        self.quiet = quiet
+        self.playing = False
+        self._lock = threading.Lock()
+
+    def read(self, size):
+        time.sleep(0.002)
+        with self._lock:
+            if self.playing:
+                return self.BEEP
+            if self.chunks:
+                return self.chunks.pop(0)
+        return self.quiet
+
+    def write(self, data):
+        pass
+
+    def start_stream(self):
+        pass
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeOutputStream(FakeStream):
+    """A PyAudio output stream whose sounds the input stream picks up"""
+
+    def __init__(self, input_stream):
+        super(FakeOutputStream, self).__init__([])
+        self.input_stream = input_stream
+
+    def write(self, data):
+        self.input_stream.playing = True
+        time.sleep(0.03)
+
+    def stop_stream(self):
+        time.sleep(0.01)
+        with self.input_stream._lock:
+            self.input_stream.chunks = []
+            self.input_stream.playing = False
+
+    def is_stopped(self):
+        return True
+
+
+class FakePyAudio(object):
+
+    def __init__(self, chunks, quiet):
+        self.input_stream = FakeStream(chunks, quiet)
+
+    def open(self, **kwargs):
+        if kwargs.get('input'):
+            return self.input_stream
+        return FakeOutputStream(self.input_stream)
+
+    def get_format_from_width(self, width):
+        return width
+
+    def terminate(self):
+        pass
+
+
+class FakeTranscription(object):
+    """Recognizes the keyword once enough loud chunks were fed"""
+
+    LOUD = make_chunk(2000)
+
+    def __init__(self, engine, keyword_chunks):
+        self.engine = engine
+        self.keyword_chunks = keyword_chunks
+        self.loud_chunks = 0
+        self.fed = []
+
+    def feed(self, data):
+        self.fed.append(data)
+        if data == self.LOUD:
+            self.loud_chunks += 1
+
+    def partial(self):
+        if self.loud_chunks >= self.keyword_chunks:
+            return ['JASPER']
+        return []
+
+    def finish(self):
+        return self.partial()
+
+
+class FakeSTT(object):
+
+    def __init__(self, keyword_chunks=10):
+        self.keyword_chunks = keyword_chunks
+        self.streams = 0
+        self.transcription = None
+
+    def begin_stream(self, rate=16000, sample_width=2):
+        self.streams += 1
+        self.transcription = FakeTranscription(self, self.keyword_chunks)
+        return self.transcription
+
+
+class TestMic(unittest.TestCase):
+
+    # Shared by all tests, as client.mic is only imported once
+    pyaudio = mock.Mock(paInt16=8)
+    pyaudio.get_sample_size.return_value = 2
+
+    def setUp(self):
+        patcher = mock.patch.dict(sys.modules, {'pyaudio': self.pyaudio})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        from client import mic
+        self.mic_module = mic
+
+    def get_mic(self, chunks, quiet=make_chunk(50), **kwargs):
+        self.pyaudio.PyAudio.return_value = FakePyAudio(chunks, quiet)
+        self.stt = FakeSTT()
+        mic = self.mic_module.Mic(mock.Mock(), self.stt, self.stt, **kwargs)
+        self.addCleanup(mic.close)
+        return mic
+
+    def testNoiseRise(self):
+        """Does the threshold follow a lasting rise of background noise?"""
+        mic = self.get_mic([make_chunk(50)] * 16, quiet=make_chunk(400))
+        results = [mic.passiveListen('JASPER') for i in range(3)]
+        self.assertEqual((None, None), results[-1])
+        # Transcriptions are restarted every 5 seconds while the noise is
+        # still taken as a disturbance, but not for the whole time
+        self.assertLessEqual(self.stt.streams, 4)
+        self.assertGreater(mic._passive_lastN.average * 1.8, 400 / 3)
+
+    def testDetection(self):
+        """Is the keyword spotted during passive listening?"""
+        quiet, loud = make_chunk(50), FakeTranscription.LOUD
+        mic = self.get_mic([quiet] * 30 + [loud] * 10)
+        threshold, transcribed = mic.passiveListen('JASPER')
+        self.assertEqual('JASPER', transcribed)
+        self.assertGreater(threshold, 0)
+
+    def testBoundary(self):
+        """Is a keyword said while passiveListen returns still spotted?"""
+        quiet, loud = make_chunk(50), FakeTranscription.LOUD
+        # 15 chunks of calibration and 150 chunks of listening per call, so
+        # the keyword starts 7 chunks before the first call returns
+        mic = self.get_mic([quiet] * 158 + [loud] * 10)
+        self.assertNotEqual('JASPER', mic.passiveListen('JASPER')[1])
+        self.assertEqual('JASPER', mic.passiveListen('JASPER')[1])
+        self.assertEqual(1, self.stt.streams)
+
+    def testActiveListen(self):
+        """Is the pre-roll transcribed, but not the beep?"""
+        preroll, speech = make_chunk(60), make_chunk(70)
+        vad_engine = mock.Mock()
+        vad_engine.process.side_effect = lambda data: (
+            vad_engine.process.call_count >= 5)
+        mic = self.get_mic([preroll] * 1000, quiet=speech,
+                           vad_engine=vad_engine)
+        # Wait until some pre-roll has been captured
+        while mic._buffer.position < 30:
+            time.sleep(0.01)
+        mic.activeListenToAllOptions(THRESHOLD=100)
+        fed = self.stt.transcription.fed
+        # 500 ms of pre-roll are 8 chunks
+        self.assertEqual([preroll] * 8, fed[:8])
+        self.assertEqual(0, fed.count(FakeStream.BEEP))
+        self.assertEqual(speech, fed[-1])
+
+    def testActiveListenPreroll(self):
+        """Does speech in the pre-roll count for the VAD?"""
+        speech, silence = make_chunk(2000), make_chunk(50)
+        vad_engine = vad.EnergyVAD(leading_silence_ms=300, silence_ms=1000)
+        mic = self.get_mic([speech] * 1000, quiet=silence,
+                           vad_engine=vad_engine)
+        while mic._buffer.position < 30:
+            time.sleep(0.01)
+        mic.activeListenToAllOptions(THRESHOLD=100)
+        fed = self.stt.transcription.fed
+        # Without the pre-roll, the leading silence would end the utterance
+        # after 300 ms instead of waiting for 1000 ms of silence
+        self.assertGreater(fed.count(silence), 15)
+
+    def testBrokenInit(self):
+        """Is PyAudio released if the input device can't be opened?"""
+        audio = FakePyAudio([], make_chunk(50))
+        audio.open = mock.Mock(side_effect=IOError('No input device'))
+        audio.terminate = mock.Mock()
+        self.pyaudio.PyAudio.return_value = audio
+        with self.assertRaises(IOError):
+            self.mic_module.Mic(mock.Mock(), FakeSTT(), FakeSTT())
+        sys.exc_clear()
+        gc.collect()
+        self.assertTrue(audio.terminate.called)
+        # Instances whose __init__ failed even earlier
+        types.InstanceType(self.mic_module.Mic).close()
@@ -1,8 +1,12 @@
 #!/usr/bin/env python2
 # -*- coding: utf-8-*-
+import ast
+import inspect
 import unittest
+import mock
 from client import test_mic, diagnose, jasperpath
 from client.modules import Life, Joke, Time, Gmail, HN, News, Weather
+from client.modules import Unclear
 
 DEFAULT_PROFILE = {
     'prefers_email': False,
@@ -12,6 +16,14 @@ DEFAULT_PROFILE = {
 }
 
 
+def isLiteral(node):
+    """Returns True if an AST node is a string literal or a concatenation
+    of string literals"""
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        return isLiteral(node.left) and isLiteral(node.right)
+    return isinstance(node, ast.Str)
+
+
 class TestModules(unittest.TestCase):
 
     def setUp(self):
@@ -64,6 +76,42 @@ class TestModules(unittest.TestCase):
         inputs = []
         self.runConversation(query, inputs, Gmail)
 
+    def testGmailPrompts(self):
+        """Does Gmail say its static phrases as they are synthesized?"""
+        with mock.patch.object(Gmail, 'fetchUnreadEmails', return_value=[]):
+            outputs = self.runConversation("Check my email", [], Gmail)
+        self.assertEqual([Gmail.NO_UNREAD_EMAILS], outputs)
+        self.assertIn(outputs[0], Gmail.PROMPTS)
+
+    def testStaticPrompts(self):
+        """Is every static phrase a module says among its PROMPTS?"""
+        for module in (Life, Unclear, Gmail, News):
+            tree = ast.parse(inspect.getsource(module.handle).lstrip())
+            for node in ast.walk(tree):
+                if not (isinstance(node, ast.Call) and
+                        isinstance(node.func, ast.Attribute) and
+                        node.func.attr == 'say'):
+                    continue
+                arg = node.args[0]
+                # Phrases built at runtime (e.g. from a variable) are skipped
+                self.assertFalse(isLiteral(arg),
+                                 "%s says a literal on line %d" %
+                                 (module.__name__, arg.lineno))
+                if isinstance(arg, ast.Name) and hasattr(module, arg.id):
+                    self.assertIn(getattr(module, arg.id), module.PROMPTS)
+
+    def testNewsSendFailed(self):
+        """Does News say its static phrase if the articles can't be sent?"""
+        articles = [News.Article('Title - Source', 'http://example.com')]
+        with mock.patch.object(News, 'getTopArticles',
+                               return_value=articles), \
+                mock.patch('client.app_utils.generateTinyURL',
+                           return_value='http://tiny'), \
+                mock.patch('client.app_utils.emailUser', return_value=False):
+            outputs = self.runConversation("find me the news", ["yes"], News)
+        self.assertEqual(News.SEND_FAILED, outputs[-1])
+        self.assertIn(News.SEND_FAILED, News.PROMPTS)
+
     @unittest.skipIf(not diagnose.check_network_connection(),
                      "No internet connection")
     def testHN(self):
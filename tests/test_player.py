@@ -0,0 +1,97 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import os
+import sys
+import tempfile
+import time
+import unittest
+import mock
+from client import player, audio_utils, jasperpath, tts
+
+
+class TestPlayer(unittest.TestCase):
+
+    def setUp(self):
+        self.audio = mock.Mock()
+        self.audio.get_device_count.return_value = 2
+        devices = [{'name': 'USB Audio (hw:1,0)', 'maxOutputChannels': 0},
+                   {'name': 'USB Audio (hw:1,0)', 'maxOutputChannels': 2}]
+        self.audio.get_device_info_by_index.side_effect = devices.__getitem__
+        self.beep = jasperpath.data('audio', 'beep_hi.wav')
+
+    def testDevice(self):
+        """Can the output device be chosen by name?"""
+        self.assertEqual(1, player.Player(self.audio, 'USB Audio')
+                         .device_index)
+        self.assertRaises(ValueError, player.Player, self.audio, 'HDMI')
+
+    def testSingleStream(self):
+        """Is the output stream kept open between sounds?"""
+        p = player.Player(self.audio, device=1)
+        p.play(self.beep)
+        p.play(self.beep)
+        self.assertEqual(1, self.audio.open.call_count)
+        self.assertEqual(1, self.audio.open.call_args[1]
+                         ['output_device_index'])
+        stream = self.audio.open.return_value
+        self.assertEqual(2, stream.write.call_count)
+
+        p.play_data(audio_utils.AudioData('\x00\x00' * 10, rate=8000))
+        self.assertEqual(2, self.audio.open.call_count)
+        p.close()
+        self.assertTrue(stream.close.called)
+
+    def testDrainAndIdle(self):
+        """Does playback wait for the sound and release the device later?"""
+        p = player.Player(self.audio, idle_timeout=0.1)
+        stream = self.audio.open.return_value
+        stream.is_stopped.return_value = False
+        p.play(self.beep)
+        self.assertEqual(['write', 'stop_stream'],
+                         [name for name, args, kwargs in stream.mock_calls
+                          if name in ('write', 'stop_stream')])
+        self.assertFalse(stream.close.called)
+        time.sleep(0.3)
+        self.assertTrue(stream.close.called)
+        p.play(self.beep)
+        self.assertEqual(2, self.audio.open.call_count)
+
+    def testPreload(self):
+        """Are preloaded sounds played from memory?"""
+        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
+            audio_utils.AudioData('\x01\x00' * 10).write_wav(f)
+        p = player.Player(self.audio)
+        p.preload([f.name])
+        os.remove(f.name)
+        p.play(f.name)
+        stream = self.audio.open.return_value
+        stream.write.assert_called_once_with('\x01\x00' * 10)
+
+    def testTTS(self):
+        """Do TTS engines play through the player once it is set?"""
+        p = mock.Mock()
+        engine = tts.FallbackTTS([tts.EspeakTTS()])
+        engine.set_player(p)
+        engine.play(self.beep)
+        p.play.assert_called_once_with(self.beep)
+
+    def testStream(self):
+        """Is WAV data from a pipe played while it is read?"""
+        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
+            audio_utils.AudioData('\x01\x00' * 3000).write_wav(f)
+        self.addCleanup(os.remove, f.name)
+        p = player.Player(self.audio)
+        engine = tts.EspeakTTS()
+        engine.set_player(p)
+        # A stand-in synthesizer that writes WAV data to stdout
+        script = ('import sys; sys.stdout.write(open(%r, "rb").read())' %
+                  f.name)
+        with mock.patch.object(engine, 'get_stream_command',
+                               return_value=[sys.executable, '-c', script]):
+            with mock.patch('client.tts_cache.get_cache', return_value=None):
+                engine.say('This is a test.')
+        stream = self.audio.open.return_value
+        self.assertEqual(3, stream.write.call_count)
+        self.assertEqual('\x01\x00' * 3000,
+                         ''.join(args[0] for args, kwargs
+                                 in stream.write.call_args_list))
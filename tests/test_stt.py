@@ -1,8 +1,20 @@
 #!/usr/bin/env python2
 # -*- coding: utf-8-*-
+import os
+import gc
+import sys
+import shutil
+import socket
+import struct
+import threading
 import unittest
 import imp
-from client import stt, jasperpath
+import tempfile
+import time
+import StringIO
+import mock
+import concurrent.futures
+from client import stt, jasperpath, audio_utils, diagnose, benchmark
 
 
 def cmuclmtk_installed():
@@ -49,3 +61,692 @@ class TestSTT(unittest.TestCase):
         with open(self.time_clip, mode="rb") as f:
             transcription = self.active_stt_engine.transcribe(f)
         self.assertIn("TIME", transcription)
+
+
+class WavLengthSTT(stt.AbstractSTTEngine):
+    """An STT engine that 'transcribes' the number of frames of a WAV file"""
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def transcribe(self, fp):
+        return [str(audio_utils.AudioData.from_wav(fp).data.count('\x01'))]
+
+
+class TestAbstractSTT(unittest.TestCase):
+
+    def testTranscribePCM(self):
+        """Do engines without raw audio support get a WAV file?"""
+        audio = audio_utils.AudioData(['\x01\x00'] * 5)
+        self.assertEqual(['5'], WavLengthSTT().transcribe_pcm(audio))
+
+    def testStream(self):
+        """Does the default stream transcribe everything fed into it?"""
+        stream = WavLengthSTT().begin_stream()
+        for i in range(3):
+            stream.feed('\x01\x00')
+        self.assertEqual(['3'], stream.partial())
+        stream.feed('\x01\x00')
+        self.assertEqual(['4'], stream.finish())
+
+
+class DelayedSTT(stt.AbstractSTTEngine):
+    """An STT engine that returns a fixed result after a delay"""
+
+    def __init__(self, slug, result, delay):
+        self.SLUG = slug
+        self.result = result
+        self.delay = delay
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def transcribe(self, fp):
+        time.sleep(self.delay)
+        return self.result
+
+
+class TestRacingSTT(unittest.TestCase):
+
+    def setUp(self):
+        self.audio = audio_utils.AudioData(['\x01\x00'] * 5)
+
+    def race(self, engines, **kwargs):
+        engine = stt.RacingSTT(engines, **kwargs)
+        start = time.time()
+        transcribed = engine.transcribe_pcm(self.audio)
+        return transcribed, time.time() - start
+
+    def testFirstConfidentResult(self):
+        """Does the fastest confident result win without waiting?"""
+        transcribed, elapsed = self.race([DelayedSTT('a', ['SLOW'], 1),
+                                          DelayedSTT('b', ['FAST'], 0)])
+        self.assertEqual(['FAST'], transcribed)
+        self.assertLess(elapsed, 0.5)
+
+    def testWaitForConfidentResult(self):
+        """Is an unconfident result overruled by a later confident one?"""
+        transcribed, elapsed = self.race([DelayedSTT('a', ['GOOD'], 0.2),
+                                          DelayedSTT('b', ['BAD'], 0),
+                                          DelayedSTT('c', [], 0)],
+                                         confidence={'b': 0.5})
+        self.assertEqual(['GOOD'], transcribed)
+
+    def testDeadline(self):
+        """Is the best result returned once the deadline has passed?"""
+        transcribed, elapsed = self.race([DelayedSTT('a', ['LATE'], 1),
+                                          DelayedSTT('b', ['BAD'], 0),
+                                          DelayedSTT('c', ['BETTER'], 0)],
+                                         deadline=0.2,
+                                         confidence={'b': 0.4, 'c': 0.6})
+        self.assertEqual(['BETTER'], transcribed)
+        self.assertLess(elapsed, 0.5)
+
+    def testConfidenceCap(self):
+        """Is a reported confidence capped by the configured one?"""
+        sure = stt.Transcription([stt.Hypothesis('BAD', 1.0, [])])
+        good = stt.Transcription([stt.Hypothesis('GOOD', 0.9, [])])
+        transcribed, elapsed = self.race([DelayedSTT('a', good, 0.2),
+                                          DelayedSTT('sphinx', sure, 0)],
+                                         confidence={'sphinx': 0.6})
+        self.assertEqual(['GOOD'], transcribed)
+        engine = stt.RacingSTT([], confidence={'sphinx': 0.6})
+        self.assertEqual(0.5, engine.get_confidence(
+            DelayedSTT('sphinx', [], 0),
+            stt.Transcription([stt.Hypothesis('OK', 0.5, [])])))
+
+    def testStream(self):
+        """Are streams of all engines fed and raced?"""
+        engine = stt.RacingSTT([WavLengthSTT(), DelayedSTT('a', [], 0)])
+        stream = engine.begin_stream()
+        for i in range(3):
+            stream.feed('\x01\x00')
+        self.assertEqual(['3'], stream.partial())
+        self.assertEqual(['3'], stream.finish())
+
+
+class TestFallbackSTT(unittest.TestCase):
+
+    def setUp(self):
+        self.audio = audio_utils.AudioData(['\x01\x00'] * 5)
+
+    def testFallback(self):
+        """Is the next engine used if an engine misses its deadline?"""
+        engine = stt.FallbackSTT([DelayedSTT('a', ['SLOW'], 1),
+                                  DelayedSTT('b', [], 0),
+                                  DelayedSTT('c', ['FAST'], 0)],
+                                 deadline=0.1)
+        start = time.time()
+        self.assertEqual(['FAST'], engine.transcribe_pcm(self.audio))
+        self.assertLess(time.time() - start, 0.5)
+
+    def testCircuitBreaker(self):
+        """Is an engine skipped after repeated failures?"""
+        failing = DelayedSTT('a', ['SLOW'], 0)
+        failing.transcribe_pcm = mock.Mock(side_effect=IOError)
+        engine = stt.FallbackSTT([failing, DelayedSTT('b', ['OK'], 0)],
+                                 failure_threshold=2)
+        for i in range(3):
+            self.assertEqual(['OK'], engine.transcribe_pcm(self.audio))
+        self.assertEqual(2, failing.transcribe_pcm.call_count)
+
+    def testQueuedTasks(self):
+        """Do tasks that start late still use their own engine?"""
+        engines = [DelayedSTT(slug, [], 0) for slug in 'abc']
+        for engine in engines:
+            engine.transcribe_pcm = mock.Mock(return_value=[])
+        engine = stt.FallbackSTT(engines, deadline=0.01)
+        # The tasks are only queued and run after the loop over the engines
+        tasks = []
+        engine._executor = mock.Mock()
+        engine._executor.submit.side_effect = \
+            lambda task: tasks.append(task) or concurrent.futures.Future()
+        self.assertEqual([], engine.transcribe_pcm(self.audio))
+        for task in tasks:
+            task()
+        for e in engines:
+            self.assertEqual(1, e.transcribe_pcm.call_count)
+            self.assertEqual('\x01\x00' * 5,
+                             e.transcribe_pcm.call_args[0][0].data)
+
+    def testStream(self):
+        """Is the audio data passed on if the streaming engine fails?"""
+        engine = stt.FallbackSTT([DelayedSTT('a', [], 0), WavLengthSTT()])
+        stream = engine.begin_stream()
+        stream.feed('\x01\x00')
+        stream.feed('\x01\x00')
+        self.assertEqual(['2'], stream.finish())
+
+    def testStreamFirstEngine(self):
+        """Is only the first engine streamed to if it succeeds?"""
+        second = WavLengthSTT()
+        second.begin_stream = mock.Mock()
+        second.transcribe_pcm = mock.Mock()
+        engine = stt.FallbackSTT([WavLengthSTT(), second])
+        stream = engine.begin_stream()
+        stream.feed('\x01\x00')
+        self.assertEqual(['1'], stream.finish())
+        self.assertFalse(second.begin_stream.called)
+        self.assertFalse(second.transcribe_pcm.called)
+
+
+class TestTranscriptionCache(unittest.TestCase):
+
+    def testLRU(self):
+        """Are the least recently used entries evicted?"""
+        cache = stt.TranscriptionCache(size=2)
+        cache.put('a', ['A'])
+        cache.put('b', ['B'])
+        self.assertEqual(['A'], cache.get('a'))
+        cache.put('c', ['C'])
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(['A'], cache.get('a'))
+        self.assertEqual(2, len(cache))
+        self.assertEqual((2, 1), (cache.hits, cache.misses))
+
+    def testTTL(self):
+        """Do entries expire?"""
+        cache = stt.TranscriptionCache(ttl=10)
+        with mock.patch('time.time', return_value=100):
+            cache.put('a', ['A'])
+        with mock.patch('time.time', return_value=105):
+            self.assertEqual(['A'], cache.get('a'))
+        with mock.patch('time.time', return_value=111):
+            self.assertIsNone(cache.get('a'))
+
+
+class TestCachedSTT(unittest.TestCase):
+
+    def setUp(self):
+        self.inner = WavLengthSTT()
+        self.inner.transcribe_pcm = mock.Mock(
+            wraps=self.inner.transcribe_pcm)
+        self.engine = stt.CachedSTT(self.inner)
+
+    def testTranscribe(self):
+        """Is identical audio data only transcribed once?"""
+        for i in range(2):
+            audio = audio_utils.AudioData(['\x01\x00'] * 5)
+            self.assertEqual(['5'], self.engine.transcribe_pcm(audio))
+        self.assertEqual(1, self.inner.transcribe_pcm.call_count)
+        audio = audio_utils.AudioData(['\x01\x00'] * 5, rate=8000)
+        self.engine.transcribe_pcm(audio)
+        self.assertEqual(2, self.inner.transcribe_pcm.call_count)
+
+    def testStream(self):
+        """Are the results of streams cached?"""
+        stream = self.engine.begin_stream()
+        stream.feed('\x01\x00')
+        self.assertEqual(['1'], stream.finish())
+        self.inner.transcribe_pcm.reset_mock()
+        audio = audio_utils.AudioData('\x01\x00')
+        self.assertEqual(['1'], self.engine.transcribe_pcm(audio))
+        self.assertFalse(self.inner.transcribe_pcm.called)
+
+
+class TestVocabularySwitching(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = object.__new__(stt.PocketSphinxSTT)
+        self.engine.nbest_size = 0
+        self.engine._logger = mock.Mock()
+        self.engine._logfile_drainer = mock.Mock()
+        self.engine._decoder = mock.Mock(spec=[
+            'get_search', 'set_search', 'set_lm_file', 'lookup_word',
+            'add_word', 'start_utt', 'process_raw', 'end_utt', 'get_hyp'])
+        self.engine._decoder.get_search.return_value = '_default'
+        self.engine._decoder.get_hyp.return_value = ('PLAY', None, None)
+        self.engine._decoder.lookup_word.side_effect = \
+            lambda word: 'P L EY' if word == 'PLAY' else None
+        self.engine._search = '_default'
+        self.engine._searches = {}
+        self.engine._owns_decoder = False
+
+        self.tempdir = tempfile.mkdtemp()
+        dictionary_file = os.path.join(self.tempdir, 'dictionary')
+        with open(dictionary_file, 'w') as f:
+            f.write('PLAY P L EY\nSTOP S T AA P\nNEXT N EH K S T\n')
+        self.vocabulary = mock.Mock(compiled_revision='abc', decoder_kwargs={
+            'lm': os.path.join(self.tempdir, 'languagemodel'),
+            'dict': dictionary_file})
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def testSharedDecoder(self):
+        """Do PocketSphinx vocabularies share one decoder?"""
+        decoder = self.engine._decoder
+        with mock.patch.object(stt.PocketSphinxSTT, 'get_vocabulary',
+                               return_value=self.vocabulary):
+            music = self.engine.with_vocabulary('music', ['PLAY', 'STOP'])
+            self.engine.with_vocabulary('music', ['PLAY', 'STOP'])
+        decoder.set_lm_file.assert_called_once_with(
+            'music', self.vocabulary.decoder_kwargs['lm'])
+        self.assertEqual([mock.call('STOP', 'S T AA P', False),
+                          mock.call('NEXT', 'N EH K S T', True)],
+                         decoder.add_word.call_args_list)
+        self.assertIs(decoder, music._decoder)
+
+        music.transcribe_pcm(audio_utils.AudioData(''))
+        decoder.set_search.assert_called_once_with('music')
+        decoder.get_search.return_value = 'music'
+        self.engine.transcribe_pcm(audio_utils.AudioData(''))
+        decoder.set_search.assert_called_with('_default')
+
+    def testDefault(self):
+        """Do other engines get a new instance for another vocabulary?"""
+        engine = WavLengthSTT()
+        with mock.patch.object(WavLengthSTT, 'get_instance') as get_instance:
+            engine.with_vocabulary('music', ['PLAY'])
+        get_instance.assert_called_once_with('music', ['PLAY'])
+
+
+class TestPocketSphinxSTT(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        for patcher in (mock.patch('tempfile.tempdir', self.tempdir),
+                        mock.patch.dict(sys.modules,
+                                        {'pocketsphinx': mock.Mock()})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def testBrokenInit(self):
+        """Is the decoder logfile removed if __init__ fails?"""
+        with self.assertRaises(RuntimeError):
+            stt.PocketSphinxSTT(mock.Mock(), hmm_dir=os.path.join(
+                self.tempdir, 'missing'))
+        sys.exc_clear()
+        gc.collect()
+        self.assertEqual([], os.listdir(self.tempdir))
+        # Engines whose __init__ failed even earlier
+        object.__new__(stt.PocketSphinxSTT).__del__()
+
+
+class TestTranscription(unittest.TestCase):
+
+    def testList(self):
+        """Can a Transcription be used like a list of texts?"""
+        transcribed = stt.Transcription([stt.Hypothesis('A', 0.8, []),
+                                         stt.Hypothesis('B', 0.1, [])])
+        self.assertEqual(['A', 'B'], transcribed)
+        self.assertEqual(0.8, transcribed.confidence)
+        self.assertIsNone(stt.Transcription.from_texts(['A']).confidence)
+        self.assertIsNone(stt.Transcription().confidence)
+
+    def testPocketSphinxNBest(self):
+        """Are PocketSphinx's n-best scores turned into confidences?"""
+        engine = object.__new__(stt.PocketSphinxSTT)
+        engine.nbest_size = 2
+        decoder = mock.Mock(spec=['nbest', 'seg'])
+        decoder.nbest.return_value = [
+            mock.Mock(hypstr='WHAT TIME', score=0),
+            mock.Mock(hypstr='WHAT TIME', score=-10),
+            mock.Mock(hypstr='WHAT TIM', score=-6932),
+            mock.Mock(hypstr='WHAT', score=-8000)]
+        segment = mock.Mock(word='TIME(2)', start_frame=50, end_frame=100,
+                            prob=0)
+        decoder.seg.return_value = [mock.Mock(word='<s>'), segment]
+        engine._decoder = decoder
+        hypotheses = engine._get_nbest()
+        self.assertEqual(['WHAT TIME', 'WHAT TIM'],
+                         [h.text for h in hypotheses])
+        self.assertAlmostEqual(2 / 3.0, hypotheses[0].confidence, places=3)
+        self.assertEqual([stt.Word('TIME', 0.5, 1.0, 1.0)],
+                         hypotheses[0].words)
+
+    def testJuliusResult(self):
+        """Are Julius' confidence measures parsed?"""
+        engine = object.__new__(stt.JuliusSTT)
+        message = """<RECOGOUT>
+  <SHYPO RANK="2" SCORE="-2000.0">
+    <WHYPO WORD="<s>" CLASSID="0" PHONE="silB" CM="1.000"/>
+    <WHYPO WORD="JASPER" CLASSID="1" PHONE="jh ae s p er" CM="0.200"/>
+  </SHYPO>
+  <SHYPO RANK="1" SCORE="-1000.0">
+    <WHYPO WORD="WHAT" CLASSID="2" PHONE="w ah t" CM="0.900"/>
+    <WHYPO WORD="TIME" CLASSID="3" PHONE="t ay m" CM="0.700"/>
+  </SHYPO>
+</RECOGOUT>"""
+        transcribed = engine._parse_result(message)
+        self.assertEqual(['WHAT TIME', 'JASPER'], transcribed)
+        self.assertAlmostEqual(0.8, transcribed.confidence)
+        self.assertEqual(0.2, transcribed.hypotheses[1].words[0].confidence)
+
+
+class FakeJulius(object):
+    """
+    Stands in for a julius process: listens on the ports from its command
+    line, reads adinnet packets and answers every finished segment with a
+    message on the module connection
+    """
+
+    def __init__(self, cmd, result):
+        self.result = result
+        self.packets = []
+        self._listeners = []
+        for option in ('-module', '-adport'):
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.bind(('127.0.0.1', int(cmd[cmd.index(option) + 1])))
+            listener.listen(1)
+            self._listeners.append(listener)
+        self.process = mock.Mock(stdout=StringIO.StringIO())
+        self.process.poll.return_value = None
+        thread = threading.Thread(target=self._serve)
+        thread.daemon = True
+        thread.start()
+
+    def _serve(self):
+        module = self._listeners[0].accept()[0]
+        adinnet = self._listeners[1].accept()[0].makefile('rb')
+        while True:
+            header = adinnet.read(4)
+            if len(header) < 4:
+                break
+            length = struct.unpack('<i', header)[0]
+            self.packets.append(adinnet.read(length))
+            if not length:
+                module.sendall('<INPUT STATUS="STARTREC"/>\n.\n' +
+                               self.result + '\n.\n')
+        module.close()
+
+    def close(self):
+        for listener in self._listeners:
+            listener.close()
+
+
+class TestJuliusSTT(unittest.TestCase):
+
+    RESULT = """<RECOGOUT>
+  <SHYPO RANK="1" SCORE="-1000.0">
+    <WHYPO WORD="<s>" CLASSID="0" PHONE="silB" CM="1.000"/>
+    <WHYPO WORD="JASPER" CLASSID="1" PHONE="jh ae s p er" CM="0.900"/>
+  </SHYPO>
+</RECOGOUT>"""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.vocabulary = mock.Mock(
+            dfa_file=os.path.join(self.tempdir, 'dfa'),
+            dict_file=os.path.join(self.tempdir, 'dict'))
+        for fname in (self.vocabulary.dfa_file, self.vocabulary.dict_file):
+            open(fname, 'w').close()
+        self.servers = []
+        patcher = mock.patch('subprocess.Popen',
+                             side_effect=self.start_julius)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.engine = stt.JuliusSTT(self.vocabulary)
+        self.addCleanup(self.engine._stop_server)
+
+    def tearDown(self):
+        for server in self.servers:
+            server.close()
+        shutil.rmtree(self.tempdir)
+
+    def start_julius(self, cmd, **kwargs):
+        server = FakeJulius(cmd, self.RESULT)
+        self.servers.append(server)
+        return server.process
+
+    def transcribe(self, data):
+        return self.engine.transcribe_pcm(audio_utils.AudioData(data))
+
+    def testAdinnet(self):
+        """Is audio data sent in adinnet packets and the result parsed?"""
+        transcribed = self.transcribe('\x01\x00' * 2500)
+        self.assertEqual(['JASPER'], transcribed)
+        self.assertEqual(0.9, transcribed.confidence)
+        self.assertEqual([4096, 904, 0],
+                         [len(data) for data in self.servers[0].packets])
+
+    def testRecognitionFailure(self):
+        """Is an empty transcription returned if julius fails?"""
+        self.servers[0].result = '<RECOGFAIL/>'
+        self.assertEqual([''], self.transcribe('\x01\x00' * 10))
+
+    def testSingleProcess(self):
+        """Is the julius process kept running between transcriptions?"""
+        self.transcribe('\x01\x00' * 10)
+        self.transcribe('\x01\x00' * 10)
+        self.assertEqual(1, len(self.servers))
+        self.assertEqual(2, self.servers[0].packets.count(''))
+
+    def testVocabularyChange(self):
+        """Is julius restarted once the vocabulary was recompiled?"""
+        self.transcribe('\x01\x00' * 10)
+        mtime = time.time() + 10
+        os.utime(self.vocabulary.dfa_file, (mtime, mtime))
+        self.assertEqual(['JASPER'], self.transcribe('\x01\x00' * 10))
+        self.assertEqual(2, len(self.servers))
+        self.assertTrue(self.servers[0].process.terminate.called)
+
+    def testStream(self):
+        """Is audio data sent to julius while it is fed?"""
+        stream = self.engine.begin_stream()
+        stream.feed('\x01\x00' * 10)
+        stream.feed('\x01\x00' * 10)
+        self.assertEqual(['JASPER'], stream.finish())
+        self.assertEqual([20, 20, 0],
+                         [len(data) for data in self.servers[0].packets])
+
+    def testBrokenInit(self):
+        """Can an engine whose __init__ failed be deleted?"""
+        engine = object.__new__(stt.JuliusSTT)
+        engine.__del__()
+
+
+class TestBatchTranscription(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        for i in range(1, 4):
+            audio = audio_utils.AudioData(['\x01\x00'] * i)
+            with open(os.path.join(self.tempdir, '%d.wav' % i), 'wb') as f:
+                audio.write_wav(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def testManifest(self):
+        """Are relative paths and extra keys of manifests kept?"""
+        manifest = os.path.join(self.tempdir, 'manifest.jsonl')
+        with open(manifest, 'w') as f:
+            f.write('{"file": "2.wav", "text": "TWO"}\n\n')
+        self.assertEqual([{'file': os.path.join(self.tempdir, '2.wav'),
+                           'text': 'TWO'}], stt.find_batch_items(manifest))
+
+    def testTranscribeBatch(self):
+        """Are all files of a directory transcribed in order?"""
+        items = stt.find_batch_items(self.tempdir)
+        results = list(stt.transcribe_batch(WavLengthSTT, items, phrases=[],
+                                            processes=2))
+        self.assertEqual([['1'], ['2'], ['3']],
+                         [result['transcription'] for result in results])
+        self.assertEqual(os.path.join(self.tempdir, '3.wav'),
+                         results[-1]['file'])
+        self.assertAlmostEqual(3 / 16000.0, results[-1]['duration'])
+        self.assertIn('time', results[-1])
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def testWordErrorRate(self):
+        """Are substitutions, deletions and insertions counted?"""
+        self.assertEqual((0, 3), benchmark.word_error_rate('what time is',
+                                                           'WHAT TIME IS'))
+        self.assertEqual((2, 4), benchmark.word_error_rate('what time is it',
+                                                           'what is it it'))
+        self.assertEqual((1, 1), benchmark.word_error_rate('jasper', ''))
+
+    def testBenchmarkEngine(self):
+        """Are accuracy and latency measured over the corpus?"""
+        corpus = [{'file': jasperpath.data('audio', 'time.wav'),
+                   'text': 'what time'}]
+        result = benchmark.benchmark_engine(
+            lambda: DelayedSTT('a', ['WHAT TIME'], 0), corpus)
+        self.assertEqual(0, result['wer'])
+        self.assertEqual(1, len(result['clips']))
+        self.assertGreater(result['peak_rss_kb'], 0)
+        self.assertGreaterEqual(result['latency_max'], 0)
+
+    def testStubbedEngine(self):
+        """Do the HTTP engines work with the stub server?"""
+        server = benchmark.StubServer(text='what time is it')
+        server.start()
+        try:
+            audio = audio_utils.AudioData.from_wav(
+                jasperpath.data('audio', 'time.wav'))
+            for create_engine in benchmark.STUBBED_ENGINES.values():
+                engine = create_engine(server.base_url)
+                transcribed, latency, rtf = benchmark.measure_clip(engine,
+                                                                   audio)
+                self.assertEqual(['WHAT TIME IS IT'], transcribed)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestLogfileDrainer(unittest.TestCase):
+
+    def setUp(self):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            self.logfile = f.name
+        self.logger = mock.Mock()
+        self.drainer = stt.LogfileDrainer(self.logfile, self.logger,
+                                          max_size=20)
+
+    def tearDown(self):
+        os.remove(self.logfile)
+
+    def testForwardLines(self):
+        """Are complete lines forwarded at DEBUG level only?"""
+        self.logger.isEnabledFor.return_value = True
+        with open(self.logfile, 'a') as f:
+            f.write('foo\nbar')
+        self.drainer._process()
+        self.logger.debug.assert_called_once_with('foo')
+
+    def testSkipIfNotDebug(self):
+        """Is the logfile left alone if DEBUG is disabled?"""
+        self.logger.isEnabledFor.return_value = False
+        with open(self.logfile, 'a') as f:
+            f.write('foo\n')
+        self.drainer._process()
+        self.assertFalse(self.logger.debug.called)
+
+    def testMaxSize(self):
+        """Is the logfile truncated once it exceeds max_size?"""
+        self.logger.isEnabledFor.return_value = False
+        with open(self.logfile, 'a') as f:
+            f.write('x' * 30)
+        self.drainer._process()
+        self.assertEqual(0, os.path.getsize(self.logfile))
+
+
+class TestOAuthTokenManager(unittest.TestCase):
+
+    def setUp(self):
+        self.session = mock.Mock()
+        self.session.post.return_value.json.return_value = {
+            'access_token': 'foo', 'expires_in': 3600}
+        self.manager = stt.OAuthTokenManager(self.session,
+                                             'http://localhost/token', {})
+
+    def tearDown(self):
+        self.manager.stop()
+
+    def testRefreshAheadOfExpiry(self):
+        """Is the refresh scheduled ahead of the token expiry?"""
+        margin = self.manager.refresh_margin
+        with mock.patch.object(self.manager, '_schedule') as mocked_schedule:
+            self.assertEqual('foo', self.manager.get())
+            mocked_schedule.assert_called_once_with(3600 - margin)
+        self.assertTrue(self.manager.is_valid)
+
+    def testShortLivedToken(self):
+        """Are short-lived tokens refreshed halfway instead of at once?"""
+        self.session.post.return_value.json.return_value = {
+            'access_token': 'foo', 'expires_in': 2}
+        self.manager.start()
+        time.sleep(0.3)
+        self.manager.stop()
+        # Only the initial fetch, the refresh is due after one second
+        self.assertEqual(1, self.session.post.call_count)
+        self.assertEqual(60, self.manager.get_refresh_delay(120))
+        self.assertEqual(3300, self.manager.get_refresh_delay(3600))
+
+    def testNoRequestWithValidToken(self):
+        """Is a valid token reused without a request?"""
+        with mock.patch.object(self.manager, '_schedule'):
+            self.manager.refresh()
+            self.manager.get()
+            self.manager.get()
+        self.assertEqual(1, self.session.post.call_count)
+
+    def testExpiredToken(self):
+        """Is an expired token replaced?"""
+        with mock.patch.object(self.manager, '_schedule'):
+            self.manager.refresh()
+            self.manager.expires_at = time.time() - 1
+            self.assertFalse(self.manager.is_valid)
+            self.manager.get()
+        self.assertEqual(2, self.session.post.call_count)
+
+    def testBrokenAttInit(self):
+        """Can an AT&T engine whose __init__ failed be deleted?"""
+        engine = object.__new__(stt.AttSTT)
+        engine.__del__()
+
+
+class TestGoogleUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.server = benchmark.StubServer()
+        self.server.start()
+        self.audio = audio_utils.AudioData.from_wav(
+            jasperpath.data('audio', 'time.wav'))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_engine(self, compression=None):
+        engine = stt.GoogleSTT(api_key='test', compression=compression)
+        engine.api_url = self.server.url
+        return engine
+
+    def testUncompressed(self):
+        """Is raw PCM data uploaded with the l16 content-type?"""
+        sent, elapsed = benchmark.measure_upload(self.server,
+                                                 self.get_engine(),
+                                                 self.audio, repeat=1)
+        self.assertEqual(len(self.audio.data), sent)
+        self.assertEqual(['audio/l16; rate=16000'], self.server.content_types)
+
+    @unittest.skipUnless(diagnose.check_executable('flac'),
+                         "flac not present")
+    def testFLAC(self):
+        """Is FLAC data smaller and uploaded with the right content-type?"""
+        sent, elapsed = benchmark.measure_upload(self.server,
+                                                 self.get_engine('flac'),
+                                                 self.audio, repeat=1)
+        self.assertLess(sent, len(self.audio.data))
+        self.assertEqual(['audio/x-flac; rate=16000'],
+                         self.server.content_types)
+
+    def testChunkedStream(self):
+        """Is audio data uploaded with chunked transfer-encoding?"""
+        engine = self.get_engine()
+        transcription = engine.begin_stream()
+        for i in range(0, len(self.audio.data), 2048):
+            transcription.feed(self.audio.data[i:i + 2048])
+        self.assertEqual([], transcription.partial())
+        self.assertEqual([], transcription.finish())
+        self.assertEqual(len(self.audio.data), self.server.bytes_received)
+        self.assertEqual(['chunked'], self.server.transfer_encodings)
@@ -1,6 +1,11 @@
 #!/usr/bin/env python2
 # -*- coding: utf-8-*-
+import os
+import time
+import threading
 import unittest
+import mock
+import requests
 from client import tts
 
 
@@ -9,3 +14,120 @@ class TestTTS(unittest.TestCase):
         tts_engine = tts.get_engine_by_slug('dummy-tts')
         tts_instance = tts_engine()
         tts_instance.say('This is a test.')
+
+
+class FailingTTS(tts.DummyTTS):
+    SLUG = None
+
+    def __init__(self, delay=0):
+        super(FailingTTS, self).__init__()
+        self.delay = delay
+        self.calls = 0
+
+    def synthesize(self, phrase):
+        self.calls += 1
+        time.sleep(self.delay)
+        raise RuntimeError('Synthesis failed')
+
+
+class TestFallbackTTS(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('client.tts_cache.get_cache', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.failing = FailingTTS()
+        self.dummy = tts.DummyTTS()
+        self.engine = tts.FallbackTTS([self.failing, self.dummy],
+                                      deadline=0.1, failure_threshold=2)
+
+    def testFallback(self):
+        """Is the next engine used if an engine fails?"""
+        fname = self.engine.synthesize('This is a test.')
+        self.assertTrue(os.path.exists(fname))
+        os.remove(fname)
+
+    def testCircuitBreaker(self):
+        """Is an engine skipped after repeated failures?"""
+        for i in range(3):
+            self.engine.say('This is a test.')
+        self.assertEqual(2, self.failing.calls)
+
+    def testDeadline(self):
+        """Is the next engine used if an engine is too slow?"""
+        engine = tts.FallbackTTS([FailingTTS(delay=1), self.dummy],
+                                 deadline=0.1)
+        start = time.time()
+        os.remove(engine.synthesize('This is a test.'))
+        self.assertLess(time.time() - start, 0.5)
+
+
+class TestMaryTTS(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('client.tts_cache.get_cache', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testServerError(self):
+        """Is a server error logged instead of raised?"""
+        engine = tts.MaryTTS()
+        engine.session = mock.Mock()
+        engine.session.get.return_value.raise_for_status.side_effect = \
+            requests.exceptions.HTTPError('500 Server Error')
+        with mock.patch.object(engine, 'play') as play, \
+                mock.patch.object(engine._logger, 'error') as error:
+            engine.say('This is a test.')
+        self.assertFalse(play.called)
+        self.assertTrue(error.called)
+        self.assertRaises(requests.exceptions.HTTPError, engine.synthesize,
+                          'This is a test.')
+
+
+class PipelineTTS(tts.DummyTTS):
+    SLUG = None
+
+    def __init__(self):
+        super(PipelineTTS, self).__init__()
+        self.events = []
+        self._second = threading.Event()
+
+    def say(self, phrase):
+        tts.AbstractTTSEngine.say(self, phrase)
+
+    def synthesize(self, phrase):
+        self.events.append(('synthesize', phrase))
+        if phrase == 'Second.':
+            self._second.set()
+        return super(PipelineTTS, self).synthesize(phrase)
+
+    def play(self, filename):
+        if ('play', None) not in self.events:
+            # The second sentence is synthesized while the first one plays
+            self._second.wait(1)
+        self.events.append(('play', None))
+
+
+class TestSentencePipeline(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('client.tts_cache.get_cache', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testSplit(self):
+        """Is text split into sentences?"""
+        self.assertEqual(['Hi there!', 'It is 3.5 degrees.', 'OK?'],
+                         tts.split_sentences(' Hi there!  It is 3.5 ' +
+                                             'degrees.\nOK?'))
+        self.assertEqual([''], tts.split_sentences(''))
+
+    def testPipeline(self):
+        """Is the next sentence synthesized while a sentence plays?"""
+        engine = PipelineTTS()
+        engine.say('First. Second. Third.')
+        self.assertEqual([('synthesize', 'First.'),
+                          ('synthesize', 'Second.'), ('play', None)],
+                         engine.events[:3])
+        self.assertEqual(('play', None), engine.events[-1])
+        self.assertEqual(6, len(engine.events))
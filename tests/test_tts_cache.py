@@ -0,0 +1,140 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import os
+import sys
+import shutil
+import subprocess
+import tempfile
+import unittest
+import wave
+import mock
+from client import tts, tts_cache, player
+
+
+def write_wav(fname, nframes):
+    wav = wave.open(fname, 'wb')
+    wav.setnchannels(1)
+    wav.setsampwidth(2)
+    wav.setframerate(16000)
+    wav.writeframes('\x00\x00' * nframes)
+    wav.close()
+
+
+class CountingTTS(tts.DummyTTS):
+    SLUG = None
+
+    def __init__(self, voice='a'):
+        super(CountingTTS, self).__init__()
+        self.voice = voice
+        self.phrases = []
+
+    def synthesize(self, phrase):
+        self.phrases.append(phrase)
+        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
+            fname = f.name
+        write_wav(fname, 100)
+        return fname
+
+
+class TestSpeechCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = tts_cache.SpeechCache(os.path.join(self.tempdir, 'c'),
+                                           max_size=300)
+        self.wav = os.path.join(self.tempdir, 'speech.wav')
+        write_wav(self.wav, 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def testKey(self):
+        """Do whitespace changes keep, and voice changes change the key?"""
+        key = self.cache.make_key('espeak-tts', {'voice': 'a'}, 'Pardon?')
+        self.assertEqual(key, self.cache.make_key(
+            'espeak-tts', {'voice': 'a'}, ' Pardon? \n'))
+        self.assertNotEqual(key, self.cache.make_key(
+            'espeak-tts', {'voice': 'b'}, 'Pardon?'))
+
+    def testGet(self):
+        """Does get() return a copy that can be removed?"""
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('a', self.wav)
+        fname = self.cache.get('a')
+        with open(fname, 'rb') as f, open(self.wav, 'rb') as g:
+            self.assertEqual(g.read(), f.read())
+        os.remove(fname)
+        self.assertIsNotNone(self.cache.get('a'))
+
+    def testEviction(self):
+        """Are the least recently used files removed once it's full?"""
+        self.cache.put('a', self.wav)
+        os.utime(self.cache._get_filename('a'), (1, 1))
+        self.cache.put('b', self.wav)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertLessEqual(self.cache.size, 300)
+
+    def testEmpty(self):
+        """Are failed syntheses not cached?"""
+        write_wav(self.wav, 0)
+        self.cache.put('a', self.wav)
+        self.assertIsNone(self.cache.get('a'))
+
+
+class TestCachedSynthesis(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = tts_cache.SpeechCache(self.tempdir)
+        patcher = mock.patch('client.tts_cache.get_cache',
+                             return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def testSynthesizeCached(self):
+        """Is a phrase only synthesized once per voice?"""
+        engine = CountingTTS()
+        for i in range(2):
+            os.remove(engine.synthesize_cached('How can I be of service?'))
+        self.assertEqual(1, len(engine.phrases))
+        other_voice = CountingTTS(voice='b')
+        os.remove(other_voice.synthesize_cached('How can I be of service?'))
+        self.assertEqual(1, len(other_voice.phrases))
+
+    def testPresynthesize(self):
+        """Are presynthesized phrases played from the cache?"""
+        engine = CountingTTS()
+        engine.presynthesize(['Pardon?', 'I am sorry. Say that again?'])
+        self.assertEqual(3, len(engine.phrases))
+        os.remove(engine.synthesize_cached('Pardon?'))
+        os.remove(engine.synthesize_cached('Say that again?'))
+        self.assertEqual(3, len(engine.phrases))
+
+    def testStreamed(self):
+        """Is streamed speech added to the cache while it plays?"""
+        fname = os.path.join(self.tempdir, 'speech.tmp')
+        write_wav(fname, 100)
+        p = player.Player(mock.Mock())
+        self.addCleanup(p.close)
+        engine = tts.EspeakTTS()
+        engine.set_player(p)
+        # A stand-in synthesizer that writes WAV data to stdout
+        script = ('import sys; sys.stdout.write(open(%r, "rb").read())' %
+                  fname)
+        with mock.patch.object(engine, 'get_stream_command',
+                               return_value=[sys.executable, '-c', script]):
+            with mock.patch('subprocess.Popen',
+                            wraps=subprocess.Popen) as popen:
+                engine.say('Hello. How are you?')
+                self.assertEqual(2, popen.call_count)
+                engine.say('How are you?')
+                self.assertEqual(2, popen.call_count)
+        key = self.cache.make_key(engine.SLUG, engine.voice_settings,
+                                  'Hello.')
+        cached = self.cache.get(key)
+        self.addCleanup(os.remove, cached)
+        with open(fname, 'rb') as f, open(cached, 'rb') as g:
+            self.assertEqual(f.read(), g.read())
@@ -0,0 +1,51 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8-*-
+import unittest
+import struct
+from client import vad
+
+
+def make_chunk(amplitude, period=16, samples=1024):
+    """Creates a chunk of a square wave with the given amplitude"""
+    values = [amplitude if (i / (period / 2)) % 2 else -amplitude
+              for i in range(samples)]
+    return struct.pack('<%dh' % samples, *values)
+
+
+class TestEnergyVAD(unittest.TestCase):
+
+    def setUp(self):
+        self.vad = vad.EnergyVAD(silence_ms=300, leading_silence_ms=1000)
+        self.vad.reset(100)
+        self.speech = make_chunk(3000)
+        self.silence = make_chunk(30)
+
+    def testEndOfSpeech(self):
+        """Does the VAD end the utterance after silence_ms of silence?"""
+        for i in range(5):
+            self.assertFalse(self.vad.process(self.speech))
+        # 4 chunks are 256 ms, 5 chunks are 320 ms
+        for i in range(4):
+            self.assertFalse(self.vad.process(self.silence))
+        self.assertTrue(self.vad.process(self.silence))
+
+    def testLeadingSilence(self):
+        """Does the VAD wait longer for the utterance to start?"""
+        for i in range(15):
+            self.assertFalse(self.vad.process(self.silence))
+        self.assertTrue(self.vad.process(self.silence))
+
+    def testUnvoicedSpeech(self):
+        """Are quiet chunks with many zero-crossings considered speech?"""
+        self.assertTrue(self.vad.is_speech(make_chunk(400)))
+        self.assertTrue(self.vad.is_speech(make_chunk(200, period=2)))
+        self.assertFalse(self.vad.is_speech(make_chunk(200, period=64)))
+        self.assertFalse(self.vad.is_speech(make_chunk(10, period=2)))
+
+
+class TestVADEngines(unittest.TestCase):
+
+    def testGetEngineBySlug(self):
+        for engine in vad.get_engines():
+            self.assertIs(engine, vad.get_engine_by_slug(engine.SLUG))
+        self.assertRaises(ValueError, vad.get_engine_by_slug, 'foo-vad')